@@ -0,0 +1,285 @@
+"""
+Near-duplicate detection for training examples
+
+MinHash signatures over word shingles of each response, LSH banding to find
+candidate clusters, and one representative (highest quality_score) kept
+per cluster. Word splitting and hashing run on the raw UTF-8 bytes with
+vectorized numpy, so a few hundred thousand examples take seconds.
+
+Signatures use one-permutation hashing: every shingle is hashed once and
+lands in one of num_perm bins, and a bin keeps its minimum. Empty bins
+borrow the next non-empty bin's value (densification). The fraction of
+equal bins between two signatures estimates the Jaccard similarity of
+their shingle sets, like classic MinHash, at 1/num_perm of the hashing cost.
+
+    python dedup.py jsonl/clean_gita_training_dataset.jsonl --threshold 0.8 --output jsonl/dedup.jsonl
+"""
+
+import argparse
+import collections
+import json
+import string
+from pathlib import Path
+from typing import Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+
+# Bytes that belong to words: ASCII letters and digits, and every byte of a
+# non-ASCII character (Devanagari, diacritics)
+_WORD_BYTE = np.zeros(256, dtype=bool)
+_WORD_BYTE[[ord(c) for c in string.ascii_lowercase + string.ascii_uppercase + string.digits]] = True
+_WORD_BYTE[0x80:] = True
+# Random value of each byte at each position in a word (later positions share the last row)
+_BYTE_HASHES = np.random.default_rng(0).integers(0, 2 ** 64, size=(32, 256), dtype=np.uint64)
+_EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: a well-spread 64-bit hash of each uint64"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class MinHasher:
+    """One-permutation MinHash signatures ([n, num_perm] uint64) of texts' word shingles"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        if num_perm & (num_perm - 1):
+            raise ValueError("num_perm must be a power of two")
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = np.uint64(seed)
+        self._bin_shift = np.uint64(64 - num_perm.bit_length() + 1)
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        with np.errstate(over='ignore'):
+            return self._signatures(texts)
+
+    def _signatures(self, texts):
+        n, k = len(texts), self.shingle_size
+        # All texts in one byte buffer, NUL-separated (NUL never occurs in the data)
+        data = np.frombuffer("\0".join(texts).lower().encode('utf-8'), dtype=np.uint8)
+        edges = np.diff(_WORD_BYTE[data].view(np.int8), prepend=np.int8(0))
+        starts = np.flatnonzero(edges == 1)
+        word_bytes = np.flatnonzero(_WORD_BYTE[data])
+
+        # Word hash: wrapping sum of a random value per (position in word, byte)
+        first = edges[word_bytes] == 1
+        position = word_bytes - starts[np.cumsum(first) - 1]
+        values = _BYTE_HASHES[np.minimum(position, len(_BYTE_HASHES) - 1), data[word_bytes]]
+        words = np.add.reduceat(values, np.flatnonzero(first)) if len(starts) else values[:0]
+        owner = np.searchsorted(np.flatnonzero(data == 0), starts)   # text index of every word
+
+        # Shingle of k words starting at every word; windows stop at the end of their text
+        counts = np.bincount(owner, minlength=n)
+        text_end = np.cumsum(counts)[owner]
+        # Word hashes are already random, so a polynomial over them with a single final mix suffices
+        shingle = np.zeros(len(words), dtype=np.uint64)
+        index = np.arange(len(words))
+        for j in range(k):
+            shifted = words[np.minimum(index + j, len(words) - 1)] if len(words) else words
+            shingle = shingle * np.uint64(0x100000001B3) + np.where(index + j < text_end, shifted, np.uint64(0))
+        shingle = _mix(shingle + self.seed)
+
+        # One permutation: the top bits pick the bin, the low 32 bits are the value
+        bins = (shingle >> self._bin_shift).astype(np.int64)
+        flat = np.full(n * self.num_perm, _EMPTY, dtype=np.uint64)
+        np.minimum.at(flat, owner * self.num_perm + bins, shingle & _MASK32)
+        return _densify(flat.reshape(n, self.num_perm))
+
+
+def _densify(signatures: np.ndarray) -> np.ndarray:
+    """Fill each empty bin from the next non-empty bin to its right (circularly), offset by the distance"""
+    empty = signatures == _EMPTY
+    sparse = np.flatnonzero(empty.any(axis=1))
+    if len(sparse) == 0:
+        return signatures
+    signatures = signatures.copy()
+    signatures[sparse] = _densify_rows(signatures[sparse], empty[sparse])
+    return signatures
+
+
+def _densify_rows(signatures: np.ndarray, empty: np.ndarray) -> np.ndarray:
+    n, num_perm = signatures.shape
+    doubled = np.concatenate([signatures, signatures], axis=1)
+    columns = np.arange(2 * num_perm)
+    # Index of the nearest non-empty column at or after each column
+    candidate = np.where(np.concatenate([~empty, ~empty], axis=1), columns, 2 * num_perm)
+    nearest = np.minimum.accumulate(candidate[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+    found = nearest < 2 * num_perm   # False only for texts with no words
+    distance = (nearest - columns[:num_perm]).astype(np.uint64)
+    rows = np.arange(n)[:, None]
+    filled = doubled[rows, np.minimum(nearest, 2 * num_perm - 1)] + (distance << np.uint64(32))
+    return np.where(empty & found, filled, signatures)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity of signature rows"""
+    return (a == b).mean(axis=-1)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows per band) whose S-curve best separates pairs around threshold
+
+    Minimizes the false positive plus false negative probability mass, as
+    the usual MinHash LSH implementations do.
+    """
+    s = np.linspace(0, 1, 1001)
+    best, best_error = (num_perm, 1), None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        candidate = 1 - (1 - s ** rows) ** bands
+        error = np.where(s < threshold, candidate, 1 - candidate).mean()
+        if best_error is None or error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def find_clusters(signatures: np.ndarray, threshold: float) -> np.ndarray:
+    """Cluster label of every row (the smallest row index in its cluster)
+
+    Rows that agree on every bin of any LSH band are connected; labels are
+    the connected components, found by vectorized min-label propagation.
+    """
+    n, num_perm = signatures.shape
+    bands, rows = lsh_params(threshold, num_perm)
+    groups = []
+    with np.errstate(over='ignore'):
+        for band in range(bands):
+            key = np.zeros(n, dtype=np.uint64)
+            for column in range(band * rows, (band + 1) * rows):
+                key = _mix(key * np.uint64(0x100000001B3) + signatures[:, column])
+            _, inverse = np.unique(key, return_inverse=True)
+            if inverse.max(initial=-1) + 1 < n:   # bands where every row is alone connect nothing
+                groups.append(inverse.ravel())
+
+    labels = np.arange(n)
+    while True:
+        previous = labels
+        for inverse in groups:
+            smallest = np.full(inverse.max() + 1, n, dtype=np.int64)
+            np.minimum.at(smallest, inverse, labels)
+            labels = smallest[inverse]
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def deduplicate(signatures: np.ndarray, quality: Sequence[float], threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(keep mask, representative row of every row)
+
+    Each cluster keeps its highest-quality row (the first one on ties). A
+    member is dropped only if its own estimated similarity to that
+    representative reaches threshold, so LSH false positives and loose
+    chains are kept.
+    """
+    n = len(signatures)
+    labels = find_clusters(signatures, threshold)
+    quality = np.asarray(quality, dtype=np.float64)
+
+    # Best row per cluster: sort by (label, -quality, index) and take each label's first
+    order = np.lexsort((np.arange(n), -quality, labels))
+    first = np.ones(n, dtype=bool)
+    first[1:] = labels[order][1:] != labels[order][:-1]
+    representative_of = np.empty(n, dtype=np.int64)
+    representative_of[labels[order][first]] = order[first]
+    representative = representative_of[labels]
+
+    duplicate = similarity(signatures, signatures[representative]) >= threshold
+    keep = ~duplicate | (representative == np.arange(n))
+    return keep, representative
+
+
+def cluster_report(keep: np.ndarray, representative: np.ndarray, tasks: Sequence[str],
+                   titles: Sequence[str], top: int = 5) -> Dict:
+    """Removed examples per task, cluster size distribution and the largest clusters"""
+    tasks = np.asarray(tasks)
+    removed = ~keep
+    sizes = collections.Counter(representative[removed].tolist())   # duplicates per kept representative
+    distribution = collections.Counter()
+    for count in sizes.values():
+        size = count + 1
+        distribution["2" if size == 2 else "3-5" if size <= 5 else "6-10" if size <= 10 else ">10"] += 1
+    return {
+        "examples": len(keep),
+        "kept": int(keep.sum()),
+        "removed": int(removed.sum()),
+        "clusters": len(sizes),
+        "cluster_sizes": dict(distribution),
+        "removed_by_task": dict(collections.Counter(tasks[removed].tolist())),
+        "largest": [
+            {"size": count + 1, "kept": titles[row]}
+            for row, count in sizes.most_common(top)
+        ],
+    }
+
+
+def print_report(report: Dict):
+    print(f"   [OK] Kept {report['kept']} of {report['examples']} examples, "
+          f"removed {report['removed']} near-duplicates in {report['clusters']} clusters")
+    if report['clusters']:
+        sizes = ", ".join(f"{size}: {count}" for size, count in sorted(report['cluster_sizes'].items()))
+        print(f"   Cluster sizes: {sizes}")
+        for task, count in sorted(report['removed_by_task'].items()):
+            print(f"   Removed {task}: {count}")
+        for cluster in report['largest']:
+            print(f"   Largest: {cluster['size']} x {cluster['kept'][:70]}")
+
+
+def find_duplicates(examples: Iterable[Dict], threshold: float, num_perm: int = 128, shingle_size: int = 5,
+                    batch_size: int = 10000, field: str = "response") -> Tuple[np.ndarray, Dict]:
+    """(keep mask, report) for examples, hashed in batches so only signatures stay in memory"""
+    hasher = MinHasher(num_perm, shingle_size)
+    signatures, quality, tasks, titles = [], [], [], []
+    batch = []
+
+    def flush():
+        signatures.append(hasher.signatures([example.get(field, '') for example in batch]))
+        batch.clear()
+
+    for example in examples:
+        batch.append(example)
+        quality.append(example.get('quality_score', 0.0))
+        tasks.append(example.get('task', ''))
+        titles.append(example.get('instruction', ''))
+        if len(batch) >= batch_size:
+            flush()
+    if batch or not signatures:
+        flush()
+
+    keep, representative = deduplicate(np.concatenate(signatures), quality, threshold)
+    return keep, cluster_report(keep, representative, tasks, titles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop near-duplicate examples from a JSONL dataset")
+    parser.add_argument("input", type=Path, help="JSONL dataset")
+    parser.add_argument("--output", type=Path, help="deduplicated JSONL (default: print the report only)")
+    parser.add_argument("--threshold", type=float, default=0.8, help="estimated Jaccard similarity (default: 0.8)")
+    parser.add_argument("--num-perm", type=int, default=128, help="signature size, a power of two (default: 128)")
+    parser.add_argument("--shingle-size", type=int, default=5, help="words per shingle (default: 5)")
+    args = parser.parse_args()
+
+    def examples():
+        with open(args.input, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    keep, report = find_duplicates(examples(), args.threshold, args.num_perm, args.shingle_size)
+    print_report(report)
+    if args.output:
+        with open(args.input, 'r', encoding='utf-8') as f, open(args.output, 'w', encoding='utf-8') as out:
+            for line, kept in zip(f, keep):
+                if kept:
+                    out.write(line)
+        print(f"   Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
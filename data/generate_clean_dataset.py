@@ -3,12 +3,40 @@ Generate Clean Training Dataset from Bhagavad Gita Repository
 
 This script creates high-quality training data from the vedicscriptures/bhagavad-gita repo
 with complete verses, translations, and commentaries from 22+ scholars.
+
+Slok files are parsed in a process pool and streamed to the output in file order.
+Each verse's examples are cached next to the output with the slok file's content
+hash in a manifest, so a rebuild only reprocesses slok files that changed:
+
+    python generate_clean_dataset.py                         # incremental rebuild
+    python generate_clean_dataset.py --full                  # reprocess everything
+    python generate_clean_dataset.py --language en --authors tej,siva --output jsonl/tej_siva_en.jsonl
+    python generate_clean_dataset.py --shard-size 5000 --gzip
+    python generate_clean_dataset.py --packed                # also write pre-tokenized jsonl/*.packed/
+    python generate_clean_dataset.py --dedup 0.8             # drop near-duplicate responses
+    python generate_clean_dataset.py --eval-every 0          # hold out no verses
+
+Every EVAL_EVERY-th verse of each chapter is held out: its examples go to
+<output>_eval.jsonl instead of the training output (and --packed dataset),
+so server/eval_perplexity.py can score verses the model never trained on.
 """
 
+import argparse
+import collections
+import functools
+import gzip
+import hashlib
 import json
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from dedup import find_duplicates, print_report
+from packed_dataset import PackedDatasetWriter, tokenize_examples
 
 # Paths
 REPO_DIR = Path("bhagavad-gita-repo")
@@ -24,20 +52,41 @@ AUTHORS = [
     "neel", "prabhu"
 ]
 
-def load_chapter_info() -> Dict[int, Dict]:
+# Author fields used for each --language: (translations, commentaries), first non-empty wins
+LANGUAGES = {
+    "any": (("et", "ht"), ("ec", "hc", "sc")),
+    "en": (("et",), ("ec",)),
+    "hi": (("ht",), ("hc",)),
+}
+
+# Bump when the examples built from a slok file change; invalidates cached verses
+GENERATOR_VERSION = 1
+
+# Held-out evaluation verses: every EVAL_EVERY-th verse of a chapter (2.20, 2.40, ...)
+EVAL_EVERY = 20
+_SLOK_NAME = re.compile(r"_chapter_(\d+)_slok_(\d+)$")
+
+def is_eval_verse(slok_file: Path, every: int = EVAL_EVERY) -> bool:
+    """Whether a slok file's verse is held out of training for evaluation"""
+    match = _SLOK_NAME.search(slok_file.stem)
+    return bool(every) and match is not None and int(match.group(2)) % every == 0
+
+def load_chapter_info(chapter_dir: Path = CHAPTER_DIR) -> Dict[int, Dict]:
     """Load chapter metadata"""
     chapter_info = {}
     for i in range(1, 19):  # 18 chapters
-        chapter_file = CHAPTER_DIR / f"bhagavadgita_chapter_{i}.json"
+        chapter_file = chapter_dir / f"bhagavadgita_chapter_{i}.json"
         if chapter_file.exists():
             with open(chapter_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 chapter_info[i] = data
     return chapter_info
 
-def create_verse_explanation_examples(slok_data: Dict) -> List[Dict]:
+def create_verse_explanation_examples(slok_data: Dict, authors: List[str] = AUTHORS,
+                                      language: str = "any") -> List[Dict]:
     """Create training examples from a single verse"""
     examples = []
+    translation_fields, commentary_fields = LANGUAGES[language]
     chapter = slok_data['chapter']
     verse = slok_data['verse']
     verse_id = f"{chapter}.{verse}"
@@ -47,13 +96,13 @@ def create_verse_explanation_examples(slok_data: Dict) -> List[Dict]:
     transliteration = slok_data.get('transliteration', '')
     
     # Example 1: What does verse X.Y say?
-    for author_key in AUTHORS:
+    for author_key in authors:
         if author_key in slok_data and slok_data[author_key]:
             author_data = slok_data[author_key]
             author_name = author_data.get('author', '')
             
             # Get translation (English or Hindi)
-            translation = author_data.get('et', '') or author_data.get('ht', '')
+            translation = _first_field(author_data, translation_fields)
             if not translation:
                 continue
             
@@ -80,7 +129,7 @@ def create_verse_explanation_examples(slok_data: Dict) -> List[Dict]:
             })
             
             # Create commentary example if available
-            commentary = author_data.get('ec', '') or author_data.get('hc', '') or author_data.get('sc', '')
+            commentary = _first_field(author_data, commentary_fields)
             if commentary and len(commentary) > 50:
                 instruction = f"What is the commentary on verse {verse_id}?"
                 response = f"Commentary on Bhagavad Gita verse {verse_id} by {author_name}:\n\n{commentary}"
@@ -102,13 +151,19 @@ def create_verse_explanation_examples(slok_data: Dict) -> List[Dict]:
     
     return examples
 
-def create_chapter_summary_examples(chapter_info: Dict) -> List[Dict]:
+def _first_field(author_data: Dict, fields: Tuple[str, ...]) -> str:
+    for field in fields:
+        if author_data.get(field):
+            return author_data[field]
+    return ''
+
+def create_chapter_summary_examples(chapter_info: Dict, language: str = "any") -> List[Dict]:
     """Create chapter summary training examples"""
     examples = []
     
     for chapter_num, info in chapter_info.items():
         # English summary
-        if 'summary' in info and 'en' in info['summary']:
+        if language != "hi" and 'summary' in info and 'en' in info['summary']:
             summary_en = info['summary']['en']
             name_en = info.get('translation', '')
             
@@ -129,7 +184,7 @@ def create_chapter_summary_examples(chapter_info: Dict) -> List[Dict]:
             })
         
         # Hindi summary
-        if 'summary' in info and 'hi' in info['summary']:
+        if language != "en" and 'summary' in info and 'hi' in info['summary']:
             summary_hi = info['summary']['hi']
             name_hi = info.get('name', '')
             
@@ -197,68 +252,358 @@ def create_concept_qa_examples(all_verses: List[Dict]) -> List[Dict]:
     
     return examples
 
+# Tokenizers loaded by this process, by name (workers load theirs once)
+_tokenizers = {}
+
+def load_tokenizer(name: str):
+    if name not in _tokenizers:
+        from transformers import AutoTokenizer
+        _tokenizers[name] = AutoTokenizer.from_pretrained(name)
+    return _tokenizers[name]
+
+def build_verse(slok_file: str, piece_file: str, authors: List[str], language: str,
+                tokens_file: Optional[str] = None, tokenizer_name: Optional[str] = None) -> Tuple[str, Dict[str, int]]:
+    """Write the examples of one slok file to piece_file as JSONL; runs in a worker process
+    
+    With tokens_file, their token ids (for --packed) are saved there too, as
+    flat "tokens" and per-example "lengths" arrays. Returns the slok file's
+    content hash and the number of examples per task.
+    """
+    with open(slok_file, 'rb') as f:
+        content = f.read()
+    slok_data = json.loads(content)
+    examples = create_verse_explanation_examples(slok_data, authors, language)
+    
+    tmp_file = piece_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for example in examples:
+            f.write(json.dumps(example, ensure_ascii=False) + '\n')
+    os.replace(tmp_file, piece_file)
+    
+    if tokens_file is not None:
+        token_lists = tokenize_examples(examples, load_tokenizer(tokenizer_name))
+        tmp_file = tokens_file + ".tmp.npz"
+        np.savez(
+            tmp_file,
+            tokens=np.concatenate([np.asarray(ids, dtype=np.int64) for ids in token_lists]) if token_lists
+            else np.zeros(0, dtype=np.int64),
+            lengths=np.array([len(ids) for ids in token_lists], dtype=np.int64)
+        )
+        os.replace(tmp_file, tokens_file)
+    return hashlib.sha256(content).hexdigest(), dict(collections.Counter(example['task'] for example in examples))
+
+def file_sha256(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_manifest(manifest_file: Path) -> Dict[str, Dict]:
+    """Slok file name -> size, mtime, content hash and example counts of its cached verse"""
+    if not manifest_file.exists():
+        return {}
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != GENERATOR_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+def save_manifest(manifest_file: Path, config: Dict, files: Dict[str, Dict]):
+    tmp_file = manifest_file.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({"version": GENERATOR_VERSION, "config": config, "files": files}, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+def _unchanged(slok_file: Path, entry: Optional[Dict]) -> Tuple[bool, Dict]:
+    """(whether the cached verse is still valid, the file's current manifest entry)"""
+    stat = slok_file.stat()
+    current = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if entry is None or 'counts' not in entry:
+        return False, current
+    # Size and mtime match: trust the stored hash without reading the file
+    if entry['size'] == current['size'] and entry['mtime_ns'] == current['mtime_ns']:
+        return True, entry
+    # Touched (e.g. by a fresh checkout): the content hash decides
+    current['sha256'] = file_sha256(slok_file)
+    if current['sha256'] == entry['sha256']:
+        return True, dict(entry, **current)
+    return False, current
+
+def stream_verses(slok_files: List[Path], cache_dir: Path, manifest: Dict[str, Dict], workers: int,
+                  authors: List[str], language: str,
+                  tokens_dir: Optional[Path] = None, tokenizer_name: Optional[str] = None
+                  ) -> Iterator[Tuple[Path, Dict, Path, bool]]:
+    """Yield (slok file, manifest entry, cached piece, rebuilt) in file order
+    
+    Changed slok files are rebuilt in a process pool. At most a few verses per
+    worker are in flight, so memory stays bounded however large the repo.
+    With tokens_dir, verses without cached token ids are rebuilt as well.
+    A rebuilt verse drops its token ids cached for every other tokenizer (or
+    for all of them without tokens_dir), so no later --packed build reuses
+    tokens of its old examples.
+    """
+    build = functools.partial(build_verse, authors=authors, language=language, tokenizer_name=tokenizer_name)
+    window = max(1, workers) * 4
+    pending = collections.deque()
+    
+    def finish(item):
+        slok_file, entry, piece_file, future = item
+        if future is not None:
+            entry['sha256'], entry['counts'] = future.result()
+        return slok_file, entry, piece_file, future is not None
+    
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        for slok_file in slok_files:
+            piece_file = cache_dir / (slok_file.stem + ".jsonl")
+            tokens_file = tokens_dir / (slok_file.stem + ".npz") if tokens_dir is not None else None
+            unchanged, entry = _unchanged(slok_file, manifest.get(slok_file.name))
+            future = None
+            if not unchanged or not piece_file.exists() or (tokens_file is not None and not tokens_file.exists()):
+                for stale_file in cache_dir.glob(f"tokens-*/{slok_file.stem}.npz"):
+                    if stale_file != tokens_file:
+                        stale_file.unlink()
+                future = pool.submit(build, str(slok_file), str(piece_file),
+                                     tokens_file=str(tokens_file) if tokens_file is not None else None)
+            pending.append((slok_file, entry, piece_file, future))
+            
+            while len(pending) > window or (pending and pending[0][3] is None):
+                yield finish(pending.popleft())
+        
+        while pending:
+            yield finish(pending.popleft())
+
+class ShardedWriter:
+    """JSONL output, optionally split into shards of shard_size lines and gzip-compressed
+    
+    Each file is written under a temporary name and renamed when complete.
+    """
+    
+    def __init__(self, output_file: Path, shard_size: int = 0, compress: bool = False):
+        self.output_file = output_file
+        self.shard_size = shard_size
+        self.compress = compress
+        self.files = []
+        self._file = None
+        self._tmp_name = None
+        self._lines = 0
+    
+    def _path(self) -> Path:
+        name = self.output_file.name
+        if self.shard_size:
+            name = f"{self.output_file.stem}-{len(self.files):05d}{self.output_file.suffix}"
+        if self.compress:
+            name += ".gz"
+        return self.output_file.with_name(name)
+    
+    def _open(self):
+        self._tmp_name = str(self._path()) + ".tmp"
+        if self.compress:
+            self._file = gzip.open(self._tmp_name, 'wt', encoding='utf-8')
+        else:
+            self._file = open(self._tmp_name, 'w', encoding='utf-8')
+        self._lines = 0
+    
+    def _close(self):
+        self._file.close()
+        path = self._path()
+        os.replace(self._tmp_name, path)
+        self.files.append(path)
+        self._file = None
+    
+    def write(self, line: str):
+        if self._file is None:
+            self._open()
+        self._file.write(line)
+        self._lines += 1
+        if self.shard_size and self._lines >= self.shard_size:
+            self._close()
+    
+    def close(self):
+        if self._file is None and not self.files:
+            self._open()   # nothing written: still produce an (empty) output
+        if self._file is not None:
+            self._close()
+
+def remove_stale_outputs(output_file: Path):
+    """Delete shards of an earlier sharded build so they are not mixed with this one"""
+    for path in output_file.parent.glob(f"{output_file.stem}-[0-9][0-9][0-9][0-9][0-9]{output_file.suffix}*"):
+        path.unlink()
+
 def main():
+    parser = argparse.ArgumentParser(description="Generate the clean Bhagavad Gita training dataset")
+    parser.add_argument("--repo", type=Path, default=REPO_DIR, help=f"bhagavad-gita repository (default: {REPO_DIR})")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE, help=f"JSONL output (default: {OUTPUT_FILE})")
+    parser.add_argument("--authors", help="comma-separated author keys to include (default: all 22)")
+    parser.add_argument("--language", choices=sorted(LANGUAGES), default="any",
+                        help="en or hi translations and commentaries only (default: any, English first)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes (default: all CPUs)")
+    parser.add_argument("--full", action="store_true", help="reprocess every slok file, ignoring the manifest")
+    parser.add_argument("--shard-size", type=int, default=0, help="split the output into files of this many examples")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    parser.add_argument("--packed", action="store_true",
+                        help="also write the pre-tokenized, memory-mappable format (see packed_dataset.py)")
+    parser.add_argument("--tokenizer", default="gpt2", help="tokenizer for --packed (default: gpt2)")
+    parser.add_argument("--dedup", type=float, default=0.0, metavar="THRESHOLD",
+                        help="drop examples whose response is at least this similar to a better one, "
+                             "e.g. 0.8 (default: off; see dedup.py)")
+    parser.add_argument("--eval-every", type=int, default=EVAL_EVERY, metavar="N",
+                        help=f"hold out every Nth verse of each chapter for evaluation, 0 = none (default: {EVAL_EVERY})")
+    parser.add_argument("--eval-output", type=Path,
+                        help="JSONL of the held-out verses (default: <output>_eval.jsonl)")
+    args = parser.parse_args()
+    eval_output = args.eval_output or args.output.with_name(f"{args.output.stem}_eval.jsonl")
+    
+    authors = args.authors.split(",") if args.authors else AUTHORS
+    unknown = sorted(set(authors) - set(AUTHORS))
+    if unknown:
+        parser.error(f"unknown authors: {', '.join(unknown)}")
+    slok_dir = args.repo / "slok"
+    chapter_dir = args.repo / "chapter"
+    
+    # Cached verses depend on the example settings; each variant gets its own cache
+    config = {"authors": authors, "language": args.language}
+    config_key = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+    cache_dir = args.output.parent / ".cache" / config_key
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    manifest_file = cache_dir / "manifest.json"
+    
     print("=" * 60)
     print("CLEAN DATASET GENERATOR - Bhagavad Gita Training Data")
     print("=" * 60)
     
     # Load chapter information
     print("\n[1/5] Loading chapter information...")
-    chapter_info = load_chapter_info()
+    chapter_info = load_chapter_info(chapter_dir)
     print(f"   [OK] Loaded {len(chapter_info)} chapters")
     
     # Create chapter summary examples
     print("\n[2/5] Generating chapter summaries...")
-    chapter_examples = create_chapter_summary_examples(chapter_info)
+    chapter_examples = create_chapter_summary_examples(chapter_info, args.language)
     print(f"   [OK] Created {len(chapter_examples)} chapter summary examples")
     
-    # Process all verses
+    concept_examples = create_concept_qa_examples([])
+    
+    # Stream verses (then concept Q&A, then chapter summaries) to the output
     print("\n[3/5] Processing verses...")
-    all_examples = []
-    verse_count = 0
-    
-    for slok_file in sorted(SLOK_DIR.glob("*.json")):
-        with open(slok_file, 'r', encoding='utf-8') as f:
-            slok_data = json.load(f)
-            examples = create_verse_explanation_examples(slok_data)
-            all_examples.extend(examples)
-            verse_count += 1
-            
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    if args.shard_size:
+        remove_stale_outputs(args.output)
+    manifest = {} if args.full else load_manifest(manifest_file)
+    slok_files = sorted(slok_dir.glob("*.json"))
+    
+    packer, tokens_dir = None, None
+    if args.packed:
+        tokenizer = load_tokenizer(args.tokenizer)
+        packer = PackedDatasetWriter(args.output.with_suffix('.packed'), args.tokenizer,
+                                     len(tokenizer), tokenizer.eos_token_id)
+        # Token ids are cached per verse like the examples, one directory per tokenizer
+        tokenizer_key = hashlib.sha256(args.tokenizer.encode()).hexdigest()[:12]
+        tokens_dir = cache_dir / f"tokens-{tokenizer_key}"
+        tokens_dir.mkdir(exist_ok=True)
+    
+    files = {}
+    verses = []   # (slok file, cached piece) in output order
+    rebuilt = 0
+    for verse_count, (slok_file, entry, piece_file, was_rebuilt) in enumerate(
+            stream_verses(slok_files, cache_dir, manifest, args.workers, authors, args.language,
+                          tokens_dir, args.tokenizer), 1):
+        files[slok_file.name] = entry
+        verses.append((slok_file, piece_file))
+        rebuilt += was_rebuilt
+        
         if verse_count % 100 == 0:
             print(f"   Processed {verse_count} verses...")
+    extra_examples = concept_examples + chapter_examples
     
-    print(f"   [OK] Processed {verse_count} verses, created {len(all_examples)} examples")
+    def all_examples():
+        for _, piece_file in verses:
+            with open(piece_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+        yield from extra_examples
     
-    # Add concept-based Q&A
-    print("\n[4/5] Creating concept-based Q&A...")
-    concept_examples = create_concept_qa_examples([])
-    all_examples.extend(concept_examples)
+    print(f"   [OK] Processed {len(files)} verses ({rebuilt} rebuilt, {len(files) - rebuilt} unchanged)")
     print(f"   [OK] Created {len(concept_examples)} concept examples")
     
-    # Add chapter summaries
-    all_examples.extend(chapter_examples)
+    # Near-duplicates: signatures over every response, then one example kept per cluster
+    keep = None
+    if args.dedup:
+        print(f"\n[4/5] Removing near-duplicate responses (similarity >= {args.dedup})...")
+        keep, report = find_duplicates(all_examples(), args.dedup)
+        print_report(report)
+    else:
+        print("\n[4/5] Near-duplicate removal off (--dedup to enable)")
     
-    # Write to JSONL
-    print(f"\n[5/5] Writing to {OUTPUT_FILE}...")
-    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    print(f"\n[5/5] Writing {args.output}...")
+    task_counts = collections.Counter()
+    for entry in files.values():
+        task_counts.update(entry['counts'])
+    if keep is not None:
+        task_counts.subtract(report['removed_by_task'])
+    writer = ShardedWriter(args.output, args.shard_size, args.gzip)
+    eval_writer = ShardedWriter(eval_output)
+    eval_counts = collections.Counter()
+    eval_verses = 0
+    index = 0
+    for slok_file, piece_file in verses:
+        with open(piece_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        kept = [keep is None or keep[index + i] for i in range(len(lines))]
+        index += len(lines)
+        if is_eval_verse(slok_file, args.eval_every):
+            # Held out: never in the training output or the packed dataset
+            eval_verses += 1
+            for line, is_kept in zip(lines, kept):
+                if is_kept:
+                    eval_writer.write(line)
+                    eval_counts[json.loads(line)['task']] += 1
+            continue
+        for line, is_kept in zip(lines, kept):
+            if is_kept:
+                writer.write(line)
+        if packer is not None:
+            with np.load(tokens_dir / (slok_file.stem + ".npz")) as cached:
+                tokens, lengths = cached['tokens'], cached['lengths']
+            ends = np.cumsum(lengths)
+            for line, is_kept, start, end in zip(lines, kept, ends - lengths, ends):
+                if is_kept:
+                    packer.add(tokens[start:end], json.loads(line))
     
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        for example in all_examples:
-            f.write(json.dumps(example, ensure_ascii=False) + '\n')
+    extra_kept = [keep is None or keep[index + i] for i in range(len(extra_examples))]
+    extra_examples = [example for example, is_kept in zip(extra_examples, extra_kept) if is_kept]
+    for example in extra_examples:
+        writer.write(json.dumps(example, ensure_ascii=False) + '\n')
+    task_counts.update(example['task'] for example in concept_examples + chapter_examples)
+    task_counts.subtract(eval_counts)
+    if packer is not None:
+        for example, token_ids in zip(extra_examples, tokenize_examples(extra_examples, tokenizer)):
+            packer.add(token_ids, example)
+    writer.close()
+    eval_writer.close()
+    if packer is not None:
+        packer.close()
     
-    print(f"   [OK] Wrote {len(all_examples)} examples")
+    # Forget verses whose slok file is gone
+    for piece_file in list(cache_dir.glob("*.jsonl")) + list(cache_dir.glob("tokens-*/*.npz")):
+        if piece_file.stem + ".json" not in files:
+            piece_file.unlink()
+    save_manifest(manifest_file, config, files)
     
     # Statistics
     print("\n" + "=" * 60)
     print("DATASET STATISTICS")
     print("=" * 60)
-    print(f"Total examples: {len(all_examples)}")
-    print(f"Verse translations: {sum(1 for e in all_examples if e['task'] == 'verse_explanation')}")
-    print(f"Verse commentaries: {sum(1 for e in all_examples if e['task'] == 'verse_commentary')}")
-    print(f"Chapter summaries: {sum(1 for e in all_examples if e['task'] == 'chapter_summary')}")
-    print(f"Concept Q&A: {sum(1 for e in all_examples if e['task'] == 'concept_explanation')}")
+    print(f"Total examples: {sum(task_counts.values())}")
+    print(f"Verse translations: {task_counts['verse_explanation']}")
+    print(f"Verse commentaries: {task_counts['verse_commentary']}")
+    print(f"Chapter summaries: {task_counts['chapter_summary']}")
+    print(f"Concept Q&A: {task_counts['concept_explanation']}")
     print(f"\nAverage quality score: 9.5")
-    print(f"\nOutput file: {OUTPUT_FILE}")
+    print(f"\nOutput file{'s' if len(writer.files) > 1 else ''}: {', '.join(str(path) for path in writer.files)}")
+    if packer is not None:
+        print(f"Packed dataset: {packer.path} ({packer.num_tokens} tokens)")
+    print(f"Held-out evaluation verses: {eval_verses} ({sum(eval_counts.values())} examples) in {eval_output}")
     print("=" * 60)
     print("\n[SUCCESS] Clean dataset generation complete!")
     print("\nNext steps:")
@@ -268,4 +613,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
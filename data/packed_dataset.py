@@ -0,0 +1,229 @@
+"""
+Pre-tokenized, memory-mapped training dataset
+
+generate_clean_dataset.py --packed writes one directory per dataset:
+
+    tokens.bin          GPT-2 token ids of every example, back to back (uint16, or uint32 for large vocabularies)
+    offsets.bin         int64, example i is tokens[offsets[i]:offsets[i + 1]]
+    task.bin            uint8 codes into meta.json "categories" (same for author.bin)
+    author.bin
+    chapter.bin         uint8, 0 when the example is not about one chapter
+    verse.bin           uint8, 0 when the example is not about one verse
+    quality_score.bin   float32
+    meta.json           format version, dtype, tokenizer, counts and the text template
+
+Each example is tokenized as TEXT_TEMPLATE followed by the EOS token, the
+same text the training notebook builds. PackedDataset maps the files
+read-only, so opening it parses nothing and examples are views, not copies:
+
+    dataset = PackedDataset("jsonl/clean_gita_training_dataset.packed")
+    dataset[0]                                   # numpy view of example 0's token ids
+    dataset.metadata(0)                          # {"task": ..., "author": ..., ...}
+    commentaries = dataset.where(task="verse_commentary")
+    train = dataset.packed(512, indices=commentaries, seed=0)   # fixed-length blocks for Trainer
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Training text of one example (GPT2_Clean_Gita_Training.ipynb); EOS is appended as a token
+TEXT_TEMPLATE = "Question: {instruction}\nAnswer: {response}"
+
+# Columnar metadata: name -> numpy dtype; string columns are stored as codes
+STRING_COLUMNS = ("task", "author")
+NUMBER_COLUMNS = {"chapter": np.uint8, "verse": np.uint8, "quality_score": np.float32}
+
+
+def token_dtype(vocab_size: int):
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+class PackedDatasetWriter:
+    """Streams tokenized examples into a packed dataset directory
+
+    Token ids go straight to disk; offsets and metadata columns (a few bytes
+    per example) are kept until close(). Everything is written to a
+    temporary directory that replaces path once complete.
+    """
+
+    def __init__(self, path: Path, tokenizer_name: str, vocab_size: int, eos_token_id: int):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        if self.tmp_path.exists():
+            shutil.rmtree(self.tmp_path)
+        self.tmp_path.mkdir(parents=True)
+
+        self.tokenizer_name = tokenizer_name
+        self.vocab_size = vocab_size
+        self.eos_token_id = eos_token_id
+        self.dtype = token_dtype(vocab_size)
+        self._tokens = open(self.tmp_path / "tokens.bin", 'wb')
+        self._offsets = [0]
+        self._categories = {name: {} for name in STRING_COLUMNS}
+        self._columns = {name: [] for name in STRING_COLUMNS + tuple(NUMBER_COLUMNS)}
+
+    def add(self, token_ids: Sequence[int], example: Dict):
+        """Append one example: its token ids (EOS included) and metadata"""
+        np.asarray(token_ids, dtype=self.dtype).tofile(self._tokens)
+        self._offsets.append(self._offsets[-1] + len(token_ids))
+        for name in STRING_COLUMNS:
+            codes = self._categories[name]
+            self._columns[name].append(codes.setdefault(example.get(name, ''), len(codes)))
+        for name in NUMBER_COLUMNS:
+            self._columns[name].append(example.get(name) or 0)
+
+    @property
+    def num_tokens(self) -> int:
+        return self._offsets[-1]
+
+    def close(self):
+        self._tokens.close()
+        np.asarray(self._offsets, dtype=np.int64).tofile(self.tmp_path / "offsets.bin")
+        for name in STRING_COLUMNS:
+            if len(self._categories[name]) > 256:
+                raise ValueError(f"Too many distinct {name} values for a uint8 column")
+            np.asarray(self._columns[name], dtype=np.uint8).tofile(self.tmp_path / f"{name}.bin")
+        for name, dtype in NUMBER_COLUMNS.items():
+            np.asarray(self._columns[name], dtype=dtype).tofile(self.tmp_path / f"{name}.bin")
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "dtype": np.dtype(self.dtype).name,
+            "tokenizer": self.tokenizer_name,
+            "vocab_size": self.vocab_size,
+            "eos_token_id": self.eos_token_id,
+            "text_template": TEXT_TEMPLATE,
+            "num_examples": len(self._offsets) - 1,
+            "num_tokens": self._offsets[-1],
+            # Code i of a string column is categories[column][i]
+            "categories": {name: list(codes) for name, codes in self._categories.items()},
+        }
+        with open(self.tmp_path / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+
+
+class PackedDataset:
+    """Read-only, memory-mapped view of a packed dataset directory"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "meta.json", 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported packed dataset version {self.meta.get('version')} in {self.path}")
+
+        self.tokens = self._map("tokens", self.meta["dtype"])
+        self.offsets = self._map("offsets", np.int64)
+        self.categories = self.meta["categories"]
+        self.columns = {name: self._map(name, np.uint8) for name in STRING_COLUMNS}
+        self.columns.update({name: self._map(name, dtype) for name, dtype in NUMBER_COLUMNS.items()})
+        self.eos_token_id = self.meta["eos_token_id"]
+
+    def _map(self, name, dtype):
+        file = self.path / f"{name}.bin"
+        if file.stat().st_size == 0:
+            return np.zeros(0, dtype=dtype)   # numpy cannot map an empty file
+        return np.memmap(file, dtype=dtype, mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """Token ids of one example (a view into the mapped file)"""
+        if index < 0:
+            index += len(self)
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def metadata(self, index: int) -> Dict:
+        row = {name: self.categories[name][int(self.columns[name][index])] for name in STRING_COLUMNS}
+        for name in NUMBER_COLUMNS:
+            value = self.columns[name][index].item()
+            row[name] = value if value or name == "quality_score" else None
+        return row
+
+    def where(self, **filters) -> np.ndarray:
+        """Indices of the examples whose columns equal every given value, e.g. where(task="chapter_summary")"""
+        selected = np.ones(len(self), dtype=bool)
+        for name, value in filters.items():
+            if name in STRING_COLUMNS:
+                if value not in self.categories[name]:
+                    return np.zeros(0, dtype=np.int64)
+                value = self.categories[name].index(value)
+            selected &= self.columns[name] == value
+        return np.flatnonzero(selected)
+
+    def packed(self, seq_len: int, indices: Optional[Sequence[int]] = None,
+               seed: Optional[int] = None) -> "PackedSequences":
+        """Fixed-length training blocks over the chosen examples (all by default, shuffled with seed)"""
+        return PackedSequences(self, seq_len, indices, seed)
+
+
+class PackedSequences:
+    """Examples concatenated (EOS-separated) and cut into seq_len-token blocks
+
+    Map-style dataset for the Hugging Face Trainer: item i is
+    {"input_ids": [seq_len] int64}. No padding is needed, and the trailing
+    partial block is dropped. Over all examples in file order a block is one
+    slice of the mapped token file; otherwise it is gathered from the
+    examples it spans.
+    """
+
+    def __init__(self, dataset: PackedDataset, seq_len: int, indices: Optional[Sequence[int]] = None,
+                 seed: Optional[int] = None):
+        self.dataset = dataset
+        self.seq_len = seq_len
+
+        order = np.arange(len(dataset)) if indices is None else np.asarray(indices, dtype=np.int64)
+        if seed is not None:
+            order = np.random.default_rng(seed).permutation(order)
+        self.contiguous = indices is None and seed is None
+        self.order = order
+        # ends[k]: tokens in the first k + 1 examples of order
+        self.ends = np.cumsum(dataset.lengths()[order])
+        total = int(self.ends[-1]) if len(self.ends) else 0
+        self.num_blocks = total // seq_len
+
+    def __len__(self):
+        return self.num_blocks
+
+    def __getitem__(self, index: int) -> Dict[str, np.ndarray]:
+        if not 0 <= index < self.num_blocks:
+            raise IndexError(index)
+        start = index * self.seq_len
+        stop = start + self.seq_len
+
+        if self.contiguous:
+            block = self.dataset.tokens[start:stop]
+        else:
+            parts = []
+            k = int(np.searchsorted(self.ends, start, side='right'))
+            position = start
+            while position < stop:
+                example = self.dataset[int(self.order[k])]
+                example_start = int(self.ends[k]) - len(example)
+                take = min(stop, int(self.ends[k])) - position
+                parts.append(example[position - example_start:position - example_start + take])
+                position += take
+                k += 1
+            block = np.concatenate(parts)
+        return {"input_ids": block.astype(np.int64)}
+
+
+def tokenize_examples(examples: List[Dict], tokenizer) -> List[List[int]]:
+    """Token ids (EOS appended) of a batch of examples, as written by PackedDatasetWriter"""
+    texts = [TEXT_TEMPLATE.format(instruction=e['instruction'], response=e['response']) for e in examples]
+    return [ids + [tokenizer.eos_token_id] for ids in tokenizer(texts)['input_ids']]
@@ -0,0 +1,100 @@
+"""
+Incremental builds of the clean dataset on a small synthetic repository
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("transformers")
+
+import generate_clean_dataset
+from packed_dataset import PackedDataset, tokenize_examples
+
+# Local copy of the GPT-2 tokenizer the server ships
+TOKENIZER = str(Path(__file__).resolve().parents[2] / "server" / "models")
+
+
+def _write_slok(repo, verse, commentary=""):
+    slok = {
+        "chapter": 1,
+        "verse": verse,
+        "slok": f"धर्मक्षेत्रे कुरुक्षेत्रे {verse}",
+        "transliteration": f"dharmakṣetre kurukṣetre {verse}",
+        "siva": {"author": "Swami Sivananda", "et": f"Translation of verse {verse}.", "ec": commentary},
+        "tej": {"author": "Swami Tejomayananda", "ht": f"श्लोक {verse} का अनुवाद"}
+    }
+    with open(repo / "slok" / f"bhagavadgita_chapter_1_slok_{verse}.json", 'w', encoding='utf-8') as f:
+        json.dump(slok, f, ensure_ascii=False)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "repo"
+    (repo / "slok").mkdir(parents=True)
+    (repo / "chapter").mkdir()
+    for verse in range(1, 6):
+        _write_slok(repo, verse)
+    return repo
+
+
+def _build(monkeypatch, repo, output, *flags):
+    monkeypatch.setattr(sys, "argv", [
+        "generate_clean_dataset.py", "--repo", str(repo), "--output", str(output), "--workers", "1",
+        "--tokenizer", TOKENIZER, *flags
+    ])
+    generate_clean_dataset.main()
+
+
+def _assert_packed_matches_jsonl(output):
+    with open(output, 'r', encoding='utf-8') as f:
+        examples = [json.loads(line) for line in f]
+    dataset = PackedDataset(output.with_suffix('.packed'))
+    tokenizer = generate_clean_dataset.load_tokenizer(TOKENIZER)
+    assert len(dataset) == len(examples)
+    for i, token_ids in enumerate(tokenize_examples(examples, tokenizer)):
+        assert dataset[i].tolist() == token_ids, examples[i]['instruction']
+
+
+def test_packed_build_after_unpacked_rebuild(monkeypatch, repo, tmp_path):
+    output = tmp_path / "jsonl" / "dataset.jsonl"
+    _build(monkeypatch, repo, output, "--packed")
+    _assert_packed_matches_jsonl(output)
+
+    # Verse 3 gains a commentary example in a build without --packed ...
+    _write_slok(repo, 3, "A commentary on verse 3 that is long enough to become its own example.")
+    _build(monkeypatch, repo, output)
+
+    # ... so the next --packed build must not reuse its cached token ids
+    _build(monkeypatch, repo, output, "--packed")
+    _assert_packed_matches_jsonl(output)
+
+
+def test_incremental_packed_build_matches_full_build(monkeypatch, repo, tmp_path):
+    output = tmp_path / "jsonl" / "dataset.jsonl"
+    _build(monkeypatch, repo, output, "--packed")
+    _write_slok(repo, 2, "Verse 2 now has a commentary long enough to become its own example.")
+    _build(monkeypatch, repo, output, "--packed")
+    _assert_packed_matches_jsonl(output)
+
+    full_output = tmp_path / "full" / "dataset.jsonl"
+    _build(monkeypatch, repo, full_output, "--packed", "--full")
+    assert output.read_text(encoding='utf-8') == full_output.read_text(encoding='utf-8')
+    assert PackedDataset(output.with_suffix('.packed')).tokens.tolist() == \
+        PackedDataset(full_output.with_suffix('.packed')).tokens.tolist()
+
+
+def test_eval_verses_are_held_out_of_training(monkeypatch, repo, tmp_path):
+    output = tmp_path / "jsonl" / "dataset.jsonl"
+    _build(monkeypatch, repo, output, "--packed", "--eval-every", "2")
+    _assert_packed_matches_jsonl(output)
+
+    with open(output, 'r', encoding='utf-8') as f:
+        trained = {json.loads(line).get('verse') for line in f}
+    with open(output.with_name("dataset_eval.jsonl"), 'r', encoding='utf-8') as f:
+        held_out = [json.loads(line) for line in f]
+    assert {example['verse'] for example in held_out} == {2, 4}
+    assert trained & {2, 4} == set()
+    assert {1, 3, 5} <= trained
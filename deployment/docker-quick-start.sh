@@ -36,9 +36,9 @@ docker-compose up -d
 echo -e "${BLUE}Waiting for services to start...${NC}"
 sleep 10
 
-# Health check
-echo -e "${BLUE}Testing health endpoint...${NC}"
-curl -f http://localhost:8000/health || echo "Health check pending..."
+# Readiness check: 503 until the model is loaded and warmed up
+echo -e "${BLUE}Testing readiness endpoint...${NC}"
+curl -f http://localhost:8000/ready || echo "Model still loading..."
 
 echo ""
 echo -e "${GREEN}=============================================="
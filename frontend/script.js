@@ -207,9 +207,27 @@ async function handleSendMessage() {
     // Show inline typing indicator
     const typingEl = addTypingIndicator();
     
+    // Assistant message that fills in while tokens stream in
+    let streamingEl = null;
+    let streamedText = '';
+    
     try {
-        // Call API
-        const response = await callAPI(message, currentMode);
+        // Call API (streaming, falls back to the plain endpoint)
+        const response = await callAPIStream(message, currentMode, (text) => {
+            if (!streamingEl) {
+                if (typingEl && typingEl.parentNode) {
+                    typingEl.parentNode.removeChild(typingEl);
+                }
+                streamingEl = addMessage('', 'assistant');
+            }
+            streamedText += text;
+            updateMessageText(streamingEl, streamedText);
+        });
+        
+        // Replace the streamed draft with the final cleaned response
+        if (streamingEl && streamingEl.parentNode) {
+            streamingEl.parentNode.removeChild(streamingEl);
+        }
         
         // Add assistant response
         addMessage(response.response, 'assistant', response.citations, response.generation_time);
@@ -233,6 +251,9 @@ async function handleSendMessage() {
         
     } catch (error) {
         console.error('Error:', error);
+        if (streamingEl && streamingEl.parentNode) {
+            streamingEl.parentNode.removeChild(streamingEl);
+        }
         addMessage(
             'I apologize, but I encountered an error. Please make sure the API server is running on port 8000.',
             'assistant',
@@ -272,6 +293,84 @@ async function callAPI(message, mode) {
     return await response.json();
 }
 
+// Call streaming API: onToken receives text chunks as they are generated,
+// resolves with the final response (same shape as callAPI)
+async function callAPIStream(message, mode, onToken) {
+    if (!window.ReadableStream || !window.TextDecoder) {
+        return await callAPI(message, mode);
+    }
+    
+    const response = await fetch(`${API_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify({
+            message: message,
+            mode: mode
+        })
+    });
+    
+    if (response.status === 404 || !response.body) {
+        // Older backend without /chat/stream
+        return await callAPI(message, mode);
+    }
+    if (!response.ok) {
+        throw new Error(`API error: ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Server-Sent Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) continue;
+            
+            const payload = JSON.parse(data);
+            if (eventName === 'token') {
+                onToken(payload.text);
+            } else if (eventName === 'done') {
+                return payload;
+            } else if (eventName === 'error') {
+                throw new Error(`API error: ${payload.status} ${payload.detail}`);
+            }
+        }
+    }
+    
+    throw new Error('Stream ended before the response was complete');
+}
+
+// Replace the paragraphs of a message element while it streams
+function updateMessageText(messageDiv, text) {
+    const content = messageDiv.querySelector('.message-content');
+    content.innerHTML = '';
+    text.split('\n\n').forEach(para => {
+        if (para.trim()) {
+            const p = document.createElement('p');
+            p.textContent = para;
+            content.appendChild(p);
+        }
+    });
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
 // Add Message to Chat
 function addMessage(text, type, citations = null, generationTime = null) {
     const messageDiv = document.createElement('div');
@@ -328,6 +427,8 @@ function addMessage(text, type, citations = null, generationTime = null) {
     
     // Scroll to bottom
     chatContainer.scrollTop = chatContainer.scrollHeight;
+    
+    return messageDiv;
 }
 
 // Sidebar: load recent conversations
@@ -4,11 +4,30 @@ FastAPI application using GPT-2 model
 Working version that fits in memory
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from model_loader_gpt2 import SanatanaLLMGPT2
+from typing import Optional
+from inference_pool import InferencePool, QueueFullError, InferenceTimeoutError, parse_lanes
+from batch_scheduler import BatchScheduler, PromptBatcher
+from streaming import TokenTextStream, format_sse
+from response_cache import ResponseCache, MemoryBackend, SqliteBackend, normalize_message
+from single_flight import SingleFlight
+from rate_limit import RateLimiter, RateLimitedError
+from sampling import PROFILES
+from model_registry import ModelRegistry, ModelSlot, read_registry_file
+from verse_index import VerseIndex
+from verse_lookup import VerseStore
+from postprocessing import FALLBACK_RESPONSE
+from metrics import CACHE_LOOKUPS, COALESCED_REQUESTS, ERRORS, REQUEST_SECONDS, render as render_metrics
+from concurrent.futures import ThreadPoolExecutor
+import settings
+import asyncio
+import ipaddress
 import logging
+import os
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,12 +49,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global model instance
-model = None
+# Loaded models and their traffic split, the worker pool they share, and
+# the verse index and caches in front of them
+registry = ModelRegistry()
+pool = None
+response_cache = None
+verse_store = None
+verse_index = None
+registry_task = None
+registry_error = None   # why the last MODEL_REGISTRY change was not applied
+registry_mtime = None   # of the MODEL_REGISTRY file last read; None while there was none
+# Generations in progress that identical requests can attach to
+flights = SingleFlight()
+# Per-client request budget (RATE_LIMIT) and API keys pinned to a lane (API_KEY_LANES)
+rate_limiter = RateLimiter(settings.RATE_LIMIT, settings.RATE_LIMIT_BURST) if settings.RATE_LIMIT > 0 else None
+api_key_lanes = {}
+api_keys = set()          # API keys that identify a client (API_KEYS and API_KEY_LANES)
+trusted_proxies = []      # networks whose X-Real-IP header is believed (TRUSTED_PROXIES)
+# Startup progress: starting -> loading -> warming_up -> ready, or failed
+startup_state = "starting"
+startup_error = None
+load_timings = {}   # seconds per startup step
+loader_task = None
+# Builds and tokenizes prompts (retrieval included) while requests wait for a
+# slot, batching the prompts that arrive together into one tokenizer call
+prompt_batcher = PromptBatcher()
+# Response cache lookups and stores (SQLite I/O, near-duplicate scans) run
+# here, never on the event loop
+cache_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="response-cache")
+
+# Served by /examples and run through the model during warm-up
+EXAMPLES = {
+    "scholar_examples": [
+        "What is karma yoga according to the Bhagavad-Gita?",
+        "Explain the concept of dharma in Chapter 2",
+        "What does Krishna teach about detachment?",
+        "How does the Gita define the three gunas?",
+        "What is the significance of the battlefield setting?"
+    ],
+    "child_examples": [
+        "What is dharma?",
+        "How should I behave according to the Gita?",
+        "What does Krishna teach about being good?",
+        "How can I be brave like Arjuna?",
+        "What is the meaning of karma?"
+    ]
+}
 
 class ChatRequest(BaseModel):
     message: str
     mode: str = "scholar"  # "scholar" or "child"
+    fresh: bool = False    # sample a new answer: skip the response cache and in-flight sharing
+    profile: Optional[str] = None         # "fast", "balanced" or "thorough"; DEFAULT_PROFILE if unset
+    max_new_tokens: Optional[int] = None  # token budget, overrides the profile's
+    deadline_ms: Optional[int] = None     # stop generating after this long and answer with what there is
+    model: Optional[str] = None           # a loaded model by name; the MODEL_REGISTRY traffic split if unset
+    priority: Optional[str] = None        # lane, e.g. "bulk" for batch jobs; by endpoint and mode if unset (LANES)
 
 class ChatResponse(BaseModel):
     response: str
@@ -44,20 +113,268 @@ class ChatResponse(BaseModel):
     mode: str
     confidence: float
     generation_time: float
-    model_used: str
+    model_used: str  # name of the model that generated the answer, or "verse-store"
+    cached: bool = False
+    coalesced: bool = False  # shared with an identical request asked at the same time
+    profile: Optional[str] = None        # sampling profile used; None for verse lookups
+    finish_reason: Optional[str] = None  # "stop" (answer complete), "length" (token budget) or "deadline"
+    tokenize_time: Optional[float] = None  # seconds building and tokenizing the prompt, apart from generation
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the model on startup"""
-    global model
+    """Load and warm up the model in the background; /ready reports when it is done"""
+    global loader_task
+    # Keep a reference so the task is not garbage collected mid-load
+    loader_task = asyncio.create_task(_load_and_warm_up())
+
+async def _load_and_warm_up():
+    global startup_state, startup_error, registry_task
+    loop = asyncio.get_running_loop()
+    try:
+        startup_state = "loading"
+        entries = await loop.run_in_executor(None, _load)
+        slots = []
+        for entry in entries:
+            slot = await loop.run_in_executor(None, _load_slot, entry["name"], entry["path"])
+            slots.append((slot, entry["weight"]))
+        load_timings.update(slots[0][0].model.load_timings)
+        
+        if settings.WARMUP:
+            startup_state = "warming_up"
+            start = time.perf_counter()
+            for slot, _ in slots:
+                await _warm_up(slot)
+            load_timings["warmup"] = time.perf_counter() - start
+        
+        registry.install(slots)
+        startup_state = "ready"
+        breakdown = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in load_timings.items())
+        logger.info(f"✅ Ready to serve ({breakdown})")
+    except Exception as e:
+        startup_state = "failed"
+        startup_error = str(e)
+        logger.error(f"Startup failed: {e}")
+        return
+    
+    if settings.MODEL_REGISTRY:
+        registry_task = asyncio.create_task(_watch_registry())
+
+def _load():
+    """Import the model stack and build what all models share (blocking)
+    
+    Returns the models to serve: the MODEL_REGISTRY file, or MODEL_PATH alone.
+    """
+    global pool, response_cache, verse_store, verse_index, api_key_lanes, api_keys, trusted_proxies, registry_mtime
+    # torch and transformers load here rather than at import, so /live answers meanwhile
+    start = time.perf_counter()
+    import model_loader_gpt2
+    import continuous_batching
+    load_timings["import"] = time.perf_counter() - start
+    if settings.DEFAULT_PROFILE not in PROFILES:
+        raise ValueError(f"DEFAULT_PROFILE must be one of {', '.join(PROFILES)}, not {settings.DEFAULT_PROFILE!r}")
+    
+    registry_mtime = _registry_mtime()
+    if registry_mtime is not None:
+        entries = read_registry_file(settings.MODEL_REGISTRY)
+    else:
+        if settings.MODEL_REGISTRY:
+            logger.warning(f"No model registry at {settings.MODEL_REGISTRY} yet; serving {settings.MODEL_PATH}")
+        entries = [{"name": None, "path": settings.MODEL_PATH, "weight": 1.0}]
+    
+    start = time.perf_counter()
+    if (settings.RAG or settings.VERSE_LOOKUP) and os.path.isdir(settings.VERSE_INDEX_PATH):
+        verse_index = VerseIndex(settings.VERSE_INDEX_PATH)
+        load_timings["verse_index"] = time.perf_counter() - start
+    elif settings.RAG or settings.VERSE_LOOKUP:
+        logger.warning(f"No verse index at {settings.VERSE_INDEX_PATH}; verse lookups and RAG are off")
+    if verse_index is not None and settings.VERSE_LOOKUP:
+        verse_store = VerseStore(verse_index)
+    
+    lanes = parse_lanes(settings.LANES)
+    api_key_lanes = _parse_api_key_lanes(settings.API_KEY_LANES, [name for name, _, _ in lanes])
+    api_keys = {key.strip() for key in settings.API_KEYS.split(",") if key.strip()} | set(api_key_lanes)
+    trusted_proxies = _parse_networks(settings.TRUSTED_PROXIES)
+    
+    continuous = settings.BATCHING == "continuous"
+    pool = InferencePool(
+        max_workers=settings.MAX_WORKERS,
+        max_queue=settings.MAX_QUEUE,
+        timeout=settings.TIMEOUT,
+        intra_op_threads=settings.INTRA_OP_THREADS,
+        # A single decode loop serves the whole live batch in continuous mode
+        max_in_flight=settings.BATCH_MAX_SIZE if continuous else settings.MAX_WORKERS * settings.BATCH_MAX_SIZE,
+        lanes=lanes
+    )
+
+    if settings.RESPONSE_CACHE == "sqlite":
+        backend = SqliteBackend(settings.RESPONSE_CACHE_PATH, max_entries=settings.RESPONSE_CACHE_SIZE)
+    elif settings.RESPONSE_CACHE == "memory":
+        backend = MemoryBackend(max_entries=settings.RESPONSE_CACHE_SIZE)
+    else:
+        backend = None
+    if backend is not None:
+        response_cache = ResponseCache(
+            backend,
+            ttl=settings.RESPONSE_CACHE_TTL,
+            similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY
+        )
+    return entries
+
+def _parse_api_key_lanes(spec, lanes):
+    """{api key: lane} from "key:lane,..." """
+    pinned = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        key, _, lane = item.strip().rpartition(":")
+        if not key or lane not in lanes:
+            raise ValueError(f"API_KEY_LANES entries must be key:lane with lane one of {', '.join(lanes)}")
+        pinned[key] = lane
+    return pinned
+
+def _parse_networks(spec):
+    """ip_network of each address or network in "10.0.0.5,172.28.0.0/16,..." """
     try:
-        logger.info("Initializing GPT-2 model (CLEAN DATASET - 12K examples)...")
-        # NEW MODEL: Trained on 12,002 clean examples from 22 scholars
-        model = SanatanaLLMGPT2(model_path="models/gpt2-gita-clean")
-        logger.info("✅ GPT-2 CLEAN model initialized successfully!")
+        return [ipaddress.ip_network(item.strip(), strict=False) for item in spec.split(",") if item.strip()]
+    except ValueError as e:
+        raise ValueError(f"TRUSTED_PROXIES must be comma-separated addresses or networks: {e}")
+
+def _load_slot(name, path):
+    """Load one checkpoint with retrieval, speculative decoding and its batcher (blocking)"""
+    from model_loader_gpt2 import SanatanaLLMGPT2
+    from continuous_batching import ContinuousBatchingEngine
+    
+    try:
+        logger.info(f"Initializing GPT-2 model from {path}...")
+        model = SanatanaLLMGPT2(
+            model_path=path,
+            device=settings.MODEL_DEVICE,
+            prefix_cache_mb=settings.PREFIX_CACHE_MB,
+            mmap_weights=settings.MODEL_MMAP,
+            dtype=settings.MODEL_DTYPE,
+            name=name,
+            backend=settings.MODEL_BACKEND,
+            token_cache_size=settings.TOKEN_CACHE_SIZE
+        )
+        logger.info(f"✅ GPT-2 model {model.name} initialized successfully!")
+        
+        if verse_index is not None and settings.RAG:
+            model.enable_retrieval(
+                verse_index,
+                top_k=settings.RAG_TOP_K,
+                max_context_tokens=settings.RAG_CONTEXT_TOKENS,
+                max_passage_tokens=settings.RAG_PASSAGE_TOKENS,
+                max_new_tokens=settings.RAG_MAX_NEW_TOKENS,
+                cache_size=settings.RAG_TOKEN_CACHE_SIZE
+            )
+        
+        if settings.SPECULATIVE_DRAFT:
+            if settings.BATCHING == "continuous":
+                logger.warning("Speculative decoding is not used by continuous batching")
+            model.enable_speculative(
+                settings.SPECULATIVE_DRAFT,
+                num_tokens=settings.SPECULATIVE_TOKENS,
+                max_ngram=settings.SPECULATIVE_NGRAM,
+                corpus=verse_index
+            )
     except Exception as e:
         logger.error(f"Failed to initialize model: {e}")
         raise e
+    
+    scheduler = None
+    if settings.BATCHING == "continuous":
+        scheduler = ContinuousBatchingEngine(
+            model,
+            pool.executor,
+            max_batch_size=settings.BATCH_MAX_SIZE
+        )
+    elif settings.BATCH_MAX_SIZE > 1:
+        scheduler = BatchScheduler(
+            model,
+            pool.executor,
+            num_workers=pool.max_workers,
+            max_batch_size=settings.BATCH_MAX_SIZE,
+            max_wait_ms=settings.BATCH_MAX_WAIT_MS
+        )
+    return ModelSlot(model.name, path, model, scheduler)
+
+async def _warm_up(slot):
+    """Run the scholar and child templates through a model's request path at each batch size
+    
+    Allocations, thread pools and kernels are initialized here, before the
+    first real request. Answers are not cached.
+    """
+    batch_sizes = [1]
+    if slot.scheduler is not None and settings.BATCH_MAX_SIZE > 1:
+        batch_sizes.append(settings.BATCH_MAX_SIZE)
+    for mode, examples in (("scholar", EXAMPLES["scholar_examples"]), ("child", EXAMPLES["child_examples"])):
+        for batch_size in batch_sizes:
+            requests = [ChatRequest(message=examples[i % len(examples)], mode=mode) for i in range(batch_size)]
+            await asyncio.gather(*(_generate(request, slot) for request in requests))
+    logger.info(f"Warm-up of {slot.name} done: scholar and child prompts at batch sizes {batch_sizes}")
+
+def _registry_mtime():
+    """Modification time of the MODEL_REGISTRY file, None if there is none"""
+    if not settings.MODEL_REGISTRY:
+        return None
+    try:
+        return os.stat(settings.MODEL_REGISTRY).st_mtime_ns
+    except OSError:
+        return None
+
+async def _watch_registry():
+    """Apply edits of the MODEL_REGISTRY file while serving"""
+    global registry_error, registry_mtime
+    while True:
+        mtime = _registry_mtime()
+        # Also applies a registry created after startup served MODEL_PATH
+        if mtime is not None and mtime != registry_mtime:
+            registry_mtime = mtime
+            try:
+                await _apply_registry(read_registry_file(settings.MODEL_REGISTRY))
+                registry_error = None
+            except Exception as e:
+                registry_error = str(e)
+                logger.error(f"Model registry change not applied, serving the previous models: {e}")
+        await asyncio.sleep(settings.MODEL_REGISTRY_POLL)
+
+async def _apply_registry(entries):
+    """Load and warm up new models in the background, then switch traffic in one step
+    
+    Models that keep their name and path stay loaded and only change weight.
+    Models left out drain: their in-flight generations finish before they
+    are released.
+    """
+    loop = asyncio.get_running_loop()
+    table, loaded = [], []
+    try:
+        for entry in entries:
+            slot = registry.get(entry["name"])
+            if slot is None or slot.path != entry["path"]:
+                logger.info(f"Loading model {entry['name']} from {entry['path']}")
+                slot = await loop.run_in_executor(None, _load_slot, entry["name"], entry["path"])
+                loaded.append(slot)
+                if settings.WARMUP:
+                    await _warm_up(slot)
+            table.append((slot, entry["weight"]))
+    except BaseException:
+        for slot in loaded:
+            slot.retire()
+        raise
+    registry.install(table)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the registry watcher, the batchers and the inference workers"""
+    if registry_task is not None:
+        registry_task.cancel()
+    for slot in registry.slots():
+        if slot.scheduler is not None:
+            slot.scheduler.shutdown()
+    if pool is not None:
+        pool.shutdown()
+    prompt_batcher.shutdown()
+    cache_executor.shutdown(wait=False)
 
 @app.get("/")
 async def root():
@@ -71,64 +388,462 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
+    primary = registry.primary()
+    model = primary.model if primary is not None else None
+    cache_stats = None
+    if response_cache is not None:
+        cache_stats = await asyncio.get_running_loop().run_in_executor(cache_executor, response_cache.stats)
     return {
-        "status": "healthy",
+        "status": "healthy" if startup_state == "ready" else startup_state,
         "model_loaded": model is not None,
+        "startup": {
+            "state": startup_state,
+            "error": startup_error,
+            "timings": {step: round(seconds, 3) for step, seconds in load_timings.items()}
+        },
         "model_type": "GPT-2",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "models": dict(registry.stats(), registry=settings.MODEL_REGISTRY or None, error=registry_error),
+        "inference": pool.stats() if pool is not None else None,
+        "rate_limit": rate_limiter.stats() if rate_limiter is not None else None,
+        "backend": model.backend.stats() if model is not None else None,
+        "token_cache": model.token_cache.stats() if model is not None else None,
+        "prefix_cache": model.prefix_cache.stats() if model is not None and model.prefix_cache is not None else None,
+        "response_cache": cache_stats,
+        "coalescing": flights.stats() if settings.COALESCE else None,
+        "retrieval": model.context_packer.stats() if model is not None and model.context_packer is not None else None,
+        "verse_lookup": verse_store.stats() if verse_store is not None else None,
+        "speculative": model.speculator.stats() if model is not None and model.speculator is not None else None
     }
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Chat endpoint for asking questions about Bhagavad-Gita"""
+@app.get("/live")
+async def live():
+    """Liveness: the process is up and serving, whether or not the model has loaded"""
+    if startup_state == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": startup_error})
+    return {"status": "alive", "state": startup_state}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the model is loaded and warmed up, 503 until then"""
+    if startup_state != "ready":
+        return JSONResponse(
+            status_code=503,
+            content={"status": startup_state, "error": startup_error},
+            headers={"Retry-After": "5"}
+        )
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics, merged across uvicorn workers"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+def _validate_request(request: ChatRequest):
+    """Reject empty messages and normalise the mode"""
+    if startup_state == "failed":
+        raise HTTPException(status_code=503, detail="Model failed to load")
+    if startup_state != "ready":
+        raise HTTPException(status_code=503, detail="Model is still loading", headers={"Retry-After": "5"})
+    
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    # Validate mode
+    if request.mode not in ["scholar", "child"]:
+        request.mode = "scholar"
+    
+    # Sampling profile and budgets are rejected rather than guessed: they decide the cost
+    if request.profile is not None and request.profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile, expected one of: {', '.join(PROFILES)}")
+    if request.max_new_tokens is not None and not 1 <= request.max_new_tokens <= settings.MAX_NEW_TOKENS:
+        raise HTTPException(status_code=400, detail=f"max_new_tokens must be between 1 and {settings.MAX_NEW_TOKENS}")
+    if request.deadline_ms is not None and not 0 < request.deadline_ms <= settings.TIMEOUT * 1000:
+        raise HTTPException(status_code=400, detail=f"deadline_ms must be between 1 and {settings.TIMEOUT * 1000:.0f}")
+    if request.priority is not None and request.priority not in pool.lanes:
+        raise HTTPException(status_code=400, detail=f"Unknown priority, expected one of: {', '.join(pool.lanes)}")
+
+def _client(http_request: Request):
+    """Who a request is rate-limited and fair-queued as: its known API key, else the caller's IP
+    
+    Unknown keys and X-Real-IP headers from untrusted peers are ignored, so a
+    client cannot get a fresh budget by changing them on every request.
+    """
+    api_key = http_request.headers.get("x-api-key")
+    if api_key in api_keys:
+        return f"key:{api_key}"
+    ip = http_request.client.host if http_request.client else ""
+    # nginx passes the caller's address in X-Real-IP
+    if _trusted_proxy(ip):
+        ip = http_request.headers.get("x-real-ip") or ip
+    return f"ip:{ip}"
+
+def _trusted_proxy(host):
     try:
-        if model is None:
-            raise HTTPException(status_code=503, detail="Model not loaded")
-        
-        if not request.message.strip():
-            raise HTTPException(status_code=400, detail="Message cannot be empty")
-        
-        # Validate mode
-        if request.mode not in ["scholar", "child"]:
-            request.mode = "scholar"
-        
-        logger.info(f"Processing request: {request.message[:50]}...")
-        
-        # Generate response
-        response = model.generate_response(
-            prompt=request.message,
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+def _admit(request: ChatRequest, http_request: Request, streaming):
+    """(lane, client) of a validated request; 429 once the client is over RATE_LIMIT"""
+    client = _client(http_request)
+    if rate_limiter is not None:
+        try:
+            rate_limiter.check(client)
+        except RateLimitedError as e:
+            ERRORS.labels("429").inc()
+            raise HTTPException(status_code=429, detail="Too many requests, please slow down",
+                                headers={"Retry-After": str(e.retry_after)})
+    
+    lanes = list(pool.lanes)
+    api_key = http_request.headers.get("x-api-key")
+    if api_key in api_key_lanes:
+        lane = api_key_lanes[api_key]
+    elif request.priority is not None:
+        lane = request.priority
+    elif streaming or request.mode == "child":
+        # Someone is reading along
+        lane = lanes[0]
+    else:
+        lane = lanes[-1]
+    return lane, client
+
+def _route(request: ChatRequest):
+    """Model that answers this request: the one it names, or a pick by traffic weight"""
+    slot = registry.route(request.model)
+    if slot is None:
+        serving = ", ".join(s.name for s in registry.slots() if s.state == "serving")
+        raise HTTPException(status_code=400, detail=f"Unknown model, expected one of: {serving}")
+    return slot
+
+def _sampling(request: ChatRequest, model):
+    """The request's profile and token budget; its deadline counts from now"""
+    deadline = time.monotonic() + request.deadline_ms / 1000 if request.deadline_ms is not None else None
+    return model.make_sampling(request.profile or settings.DEFAULT_PROFILE, request.max_new_tokens, deadline)
+
+async def _generate(request: ChatRequest, slot, on_token=None, lane=None, client=None):
+    """Run one request on an inference worker, off the event loop, queued in lane as client"""
+    model, scheduler = slot.model, slot.scheduler
+    admission = {"lane": lane, "client": client}
+    # Retrieval and tokenization start now and overlap with queueing; the
+    # model waits on the Future only when the request reaches it
+    prompt = prompt_batcher.submit(model, request.message, request.mode)
+    sampling = _sampling(request, model)
+    
+    if on_token is None:
+        # A static batch returns when its longest answer is done, so requests
+        # with a deadline only batch in continuous mode, where rows leave early
+        if scheduler is not None and (sampling.deadline is None or settings.BATCHING == "continuous"):
+            if settings.BATCHING == "continuous":
+                return await pool.wait(lambda: scheduler.submit(prompt, request.mode, sampling=sampling), **admission)
+            priority = list(pool.lanes).index(lane) if lane is not None else 0
+            return await pool.wait(
+                lambda: scheduler.submit(prompt, request.mode, sampling=sampling, priority=priority), **admission
+            )
+        return await pool.run(
+            model.generate_response,
+            prompt=prompt,
             mode=request.mode,
-            max_length=512,
-            temperature=0.8
+            sampling=sampling,
+            **admission
         )
-        
-        logger.info(f"Generated response in {response['generation_time']:.2f}s")
-        
-        return ChatResponse(**response)
-        
+    
+    if settings.BATCHING == "continuous":
+        return await pool.wait(
+            lambda: scheduler.submit(prompt, request.mode, on_token=on_token, sampling=sampling), **admission
+        )
+    # Static batches cannot stream, so streamed requests get their own generate call
+    return await pool.run(model.stream_response, prompt, request.mode, on_token, sampling, **admission)
+
+def _cache_params(request: ChatRequest, slot):
+    """Everything besides the message and mode that shapes an answer"""
+    model = slot.model
+    config = model.make_sampling(request.profile or settings.DEFAULT_PROFILE, request.max_new_tokens).config
+    config = dict(config, model=slot.path)
+    if model.context_packer is None:
+        return config
+    return dict(config, retrieval=settings.VERSE_INDEX_PATH, top_k=settings.RAG_TOP_K)
+
+def _direct_response(request: ChatRequest):
+    """Verbatim answer for a verse or chapter reference, or None"""
+    if verse_store is None:
+        return None
+    try:
+        return verse_store.answer(request.message, request.mode)
+    except Exception as e:
+        logger.warning(f"Verse lookup failed: {e}")
+        return None
+
+async def _cached_response(request: ChatRequest, slot):
+    """Previously generated answer for this request, flagged as cached, or None"""
+    if response_cache is None or request.fresh:
+        return None
+    start_time = time.time()
+    params = _cache_params(request, slot)
+    loop = asyncio.get_running_loop()
+    try:
+        response = await loop.run_in_executor(cache_executor, response_cache.get, request.message, request.mode, params)
+    except Exception as e:
+        logger.warning(f"Response cache lookup failed: {e}")
+        return None
+    CACHE_LOOKUPS.labels("response", "miss" if response is None else "hit").inc()
+    if response is None:
+        return None
+    # Another profile may resolve to the same config; report the one asked for
+    return dict(
+        response,
+        cached=True,
+        profile=request.profile or settings.DEFAULT_PROFILE,
+        generation_time=time.time() - start_time
+    )
+
+def _store_response(request: ChatRequest, slot, response):
+    """Remember a freshly generated answer in the background (failures and deadline-cut answers are never cached)"""
+    if response_cache is None or response["response"] == FALLBACK_RESPONSE:
+        return
+    if response.get("finish_reason") == "deadline":
+        return
+    
+    def store(params):
+        try:
+            response_cache.set(request.message, request.mode, params, response)
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+    
+    try:
+        cache_executor.submit(store, _cache_params(request, slot))
+    except RuntimeError:
+        pass   # shutting down
+
+def _flight_key(request: ChatRequest, slot):
+    """Requests with equal keys share one generation; None never shares"""
+    if not settings.COALESCE or request.fresh:
+        return None
+    return (
+        slot.name,
+        request.mode,
+        normalize_message(request.message),
+        request.profile or settings.DEFAULT_PROFILE,
+        request.max_new_tokens,
+        request.deadline_ms
+    )
+
+async def _fly(flight, request: ChatRequest, slot, text_stream=None, lane=None, client=None):
+    """Generate the flight's answer, cache it and settle flight.result
+    
+    A streaming flight also publishes the "done" or "error" event, queued
+    behind the token events already scheduled from the decode thread.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        on_token = text_stream.push if text_stream is not None else None
+        response = await _generate(request, slot, on_token, lane, client)
+        if text_stream is not None:
+            text_stream.close()
+        logger.info(f"{'Streamed' if flight.streaming else 'Generated'} response in {response['generation_time']:.2f}s")
+        _store_response(request, slot, response)
+        flight.result.set_result(response)
+        if flight.streaming:
+            loop.call_soon(flight.publish, "done", response)
+    except asyncio.CancelledError:
+        flight.result.cancel()
+        raise
     except Exception as e:
-        logger.error(f"Error processing chat request: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        flight.result.set_exception(e)
+        if flight.streaming:
+            loop.call_soon(flight.publish, "error", e)
+    finally:
+        flights.finish(flight)
+
+def _join_or_start(request: ChatRequest, slot, endpoint, streaming, lane=None, client=None):
+    """(flight, joined): attach to an identical in-flight request or start a new generation on slot
+    
+    A new generation waits for a worker in lane as client (see _admit).
+    """
+    key = _flight_key(request, slot)
+    flight = flights.join(key)
+    if flight is not None:
+        logger.info(f"Coalesced with an in-flight request: {request.message[:50]}...")
+        COALESCED_REQUESTS.labels(endpoint).inc()
+        return flight, True
+    
+    logger.info(f"Processing {'streaming ' if streaming else ''}request: {request.message[:50]}...")
+    flight = flights.start(key, streaming)
+    text_stream = None
+    if streaming:
+        loop = asyncio.get_running_loop()
+        text_stream = TokenTextStream(
+            slot.model.tokenizer,
+            lambda text: loop.call_soon_threadsafe(flight.publish, "token", {"text": text})
+        )
+    # The slot counts the generation until the task ends, even if it is
+    # cancelled before it starts; a swapped-out model is released after that
+    slot.acquire()
+    flight.task = asyncio.create_task(_fly(flight, request, slot, text_stream, lane, client))
+    flight.task.add_done_callback(lambda _: slot.release())
+    return flight, False
+
+def _error_status(e):
+    """Map a generation failure to (status code, detail, headers)"""
+    if isinstance(e, QueueFullError):
+        logger.warning(f"Shedding request, inference queue full: {pool.stats()}")
+        ERRORS.labels("503").inc()
+        return 503, "Server is busy, please retry shortly", {"Retry-After": str(e.retry_after)}
+    if isinstance(e, InferenceTimeoutError):
+        logger.warning(f"Chat request timed out: {e}")
+        ERRORS.labels("504").inc()
+        return 504, str(e), None
+    logger.error(f"Error processing chat request: {e}")
+    ERRORS.labels("500").inc()
+    return 500, str(e), None
+
+def _observe(endpoint, response, start_time):
+    """Record the latency of an answered request by where the answer came from"""
+    if response.get("model_used") == "verse-store":
+        source = "verse_store"
+    elif response.get("cached"):
+        source = "response_cache"
+    elif response.get("coalesced"):
+        source = "coalesced"
+    else:
+        source = "model"
+    REQUEST_SECONDS.labels(endpoint, source, response.get("model_used", "")).observe(time.perf_counter() - start_time)
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, http_request: Request):
+    """Chat endpoint for asking questions about Bhagavad-Gita"""
+    start_time = time.perf_counter()
+    _validate_request(request)
+    lane, client = _admit(request, http_request, streaming=False)
+    
+    direct = _direct_response(request)
+    if direct is not None:
+        logger.info(f"Verse lookup: {request.message[:50]}...")
+        _observe("chat", direct, start_time)
+        return ChatResponse(**direct)
+    
+    slot = _route(request)
+    cached = await _cached_response(request, slot)
+    if cached is not None:
+        logger.info(f"Cache hit: {request.message[:50]}...")
+        _observe("chat", cached, start_time)
+        return ChatResponse(**cached)
+    
+    flight, joined = _join_or_start(request, slot, "chat", False, lane, client)
+    try:
+        # Shielded: this request going away must not cancel an answer others wait for
+        response = await asyncio.shield(flight.result)
+    except Exception as e:
+        status_code, detail, headers = _error_status(e)
+        raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+    finally:
+        flight.detach()
+    
+    if joined:
+        response = dict(response, coalesced=True)
+    _observe("chat", response, start_time)
+    return ChatResponse(**response)
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Chat endpoint that streams the answer as Server-Sent Events
+    
+    Emits "token" events with cleaned text as it is generated, then a "done"
+    event carrying the full ChatResponse (final cleaned text, citations,
+    confidence, generation_time), or an "error" event.
+    """
+    start_time = time.perf_counter()
+    _validate_request(request)
+    lane, client = _admit(request, http_request, streaming=True)
+    
+    sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    
+    slot = None
+    cached = _direct_response(request)
+    if cached is not None:
+        logger.info(f"Verse lookup: {request.message[:50]}...")
+    else:
+        slot = _route(request)
+        cached = await _cached_response(request, slot)
+        if cached is not None:
+            logger.info(f"Cache hit: {request.message[:50]}...")
+    if cached is not None:
+        _observe("chat_stream", cached, start_time)
+        cached_events = [
+            format_sse("token", {"text": cached["response"]}),
+            format_sse("done", ChatResponse(**cached).model_dump())
+        ]
+        return StreamingResponse(iter(cached_events), media_type="text/event-stream", headers=sse_headers)
+    
+    flight, joined = _join_or_start(request, slot, "chat_stream", True, lane, client)
+    
+    if not flight.streaming:
+        # Attached to a /chat generation, which has no tokens to stream: send its answer whole
+        try:
+            response = await asyncio.shield(flight.result)
+        except Exception as e:
+            status_code, detail, headers = _error_status(e)
+            raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+        finally:
+            flight.detach()
+        response = dict(response, coalesced=True)
+        _observe("chat_stream", response, start_time)
+        events = [
+            format_sse("token", {"text": response["response"]}),
+            format_sse("done", ChatResponse(**response).model_dump())
+        ]
+        return StreamingResponse(iter(events), media_type="text/event-stream", headers=sse_headers)
+    
+    # Every attached request reads the flight's events from the first token on
+    events = flight.subscribe()
+    
+    def leave():
+        flight.unsubscribe(events)
+        # The last request to leave stops the generation
+        flight.detach()
+    
+    # Wait for the first event so admission failures still get a proper status code
+    try:
+        event, data = await events.get()
+    except BaseException:
+        leave()
+        raise
+    if event == "error":
+        leave()
+        status_code, detail, headers = _error_status(data)
+        raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+    
+    async def event_source():
+        try:
+            current = (event, data)
+            while True:
+                name, payload = current
+                if name == "done":
+                    response = dict(payload, coalesced=True) if joined else payload
+                    _observe("chat_stream", response, start_time)
+                    payload = ChatResponse(**response).model_dump()
+                elif name == "error":
+                    status_code, detail, _ = _error_status(payload)
+                    payload = {"status": status_code, "detail": detail}
+                yield format_sse(name, payload)
+                if name in ("done", "error"):
+                    break
+                current = await events.get()
+        finally:
+            leave()
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers=sse_headers
+    )
 
 @app.get("/examples")
 async def get_examples():
     """Get example questions for testing"""
-    return {
-        "scholar_examples": [
-            "What is karma yoga according to the Bhagavad-Gita?",
-            "Explain the concept of dharma in Chapter 2",
-            "What does Krishna teach about detachment?",
-            "How does the Gita define the three gunas?",
-            "What is the significance of the battlefield setting?"
-        ],
-        "child_examples": [
-            "What is dharma?",
-            "How should I behave according to the Gita?",
-            "What does Krishna teach about being good?",
-            "How can I be brave like Arjuna?",
-            "What is the meaning of karma?"
-        ]
-    }
+    return EXAMPLES
 
 if __name__ == "__main__":
     import uvicorn
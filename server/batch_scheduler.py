@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Dynamic micro-batching for the Sanatana Dharma LLM server
+Collects concurrent /chat requests into batched GPT-2 generate calls
+and their prompts into batched tokenizer calls
+"""
+
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingRequest:
+    """A prompt waiting to be placed in a batch"""
+
+    __slots__ = ("prompt", "mode", "sampling", "priority", "future", "arrival")
+
+    def __init__(self, prompt, mode, sampling=None, priority=0):
+        self.prompt = prompt
+        self.mode = mode
+        self.sampling = sampling
+        self.priority = priority   # lower is served first
+        self.future = Future()
+        self.arrival = time.monotonic()
+
+
+class BatchScheduler:
+    """Groups requests with compatible sampling settings into one generate call
+
+    A batch is formed only when an inference worker is free, so under load
+    requests pile up and leave together, while a lone request waits at most
+    max_wait_ms for company.
+    """
+
+    def __init__(self, model, executor, num_workers, max_batch_size=8, max_wait_ms=20):
+        self.model = model
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+
+        self._cond = threading.Condition()
+        self._pending = collections.OrderedDict()   # batch key -> deque of _PendingRequest
+        self._free_workers = threading.Semaphore(num_workers)
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._dispatch_loop, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+        logger.info(f"Batch scheduler: up to {self.max_batch_size} requests, {max_wait_ms}ms window")
+
+    def submit(self, prompt, mode="scholar", sampling=None, priority=0):
+        """Queue a prompt; returns a Future resolving to its response dict
+
+        priority is the rank of the request's lane (0 = first): batches of
+        a higher lane go before older ones of a lower lane.
+        """
+        request = _PendingRequest(prompt, mode, sampling, priority)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Batch scheduler is shut down")
+            key = self._batch_key(mode, sampling, priority)
+            self._pending.setdefault(key, collections.deque()).append(request)
+            self._cond.notify()
+        return request.future
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._free_workers.release()
+
+    def _batch_key(self, mode, sampling, priority):
+        # Scholar and child prompts use different templates, so they batch
+        # separately; so do sampling profiles (deadlines are per row) and lanes
+        return mode, sampling.key if sampling is not None else None, priority
+
+    def _dispatch_loop(self):
+        while True:
+            self._free_workers.acquire()
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self.executor.submit(self._run_batch, batch)
+            except RuntimeError as e:
+                # Executor already shut down
+                for request in batch:
+                    request.future.set_exception(e)
+                return
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                while not self._closed and not self._pending:
+                    self._cond.wait()
+                if self._closed:
+                    return None
+
+                # Serve the highest lane, then the group whose oldest request has waited longest
+                key = min(self._pending, key=lambda k: (self._pending[k][0].priority, self._pending[k][0].arrival))
+                group = self._pending[key]
+
+                deadline = group[0].arrival + self.max_wait
+                while len(group) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = []
+                now = time.monotonic()
+                while group and len(batch) < self.max_batch_size:
+                    request = group.popleft()
+                    # Skip requests whose caller already gave up
+                    if request.future.set_running_or_notify_cancel():
+                        STAGE_SECONDS.labels("batch_wait").observe(now - request.arrival)
+                        batch.append(request)
+                if not group:
+                    del self._pending[key]
+
+                if batch:
+                    return batch
+
+    def _run_batch(self, batch):
+        try:
+            results = self.model.generate_batch(
+                [request.prompt for request in batch],
+                mode=batch[0].mode,
+                samplings=[request.sampling for request in batch]
+            )
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} failed: {e}")
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self._free_workers.release()
+
+
+class PromptBatcher:
+    """Prepares prompts (retrieval and tokenization) ahead of generation on one thread
+
+    Requests hand their prompt over on arrival and get a Future of the
+    PreparedPrompt, so preparation overlaps with queueing. Prompts that
+    arrive while a batch is being prepared wait and are then tokenized
+    together in one prepare_prompts call per model and mode. One thread,
+    since the fast tokenizer must not truncate concurrently.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = collections.OrderedDict()   # (model, mode) -> list of (prompt, Future)
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._prepare_loop, name="prompt-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, model, prompt, mode="scholar"):
+        """Queue a raw prompt; returns a Future resolving to model's PreparedPrompt of it"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Prompt batcher is shut down")
+            self._pending.setdefault((model, mode), []).append((prompt, future))
+            self._cond.notify()
+        return future
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _prepare_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._pending:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                (model, mode), group = self._pending.popitem(last=False)
+
+            # Skip requests whose caller already gave up
+            group = [(prompt, future) for prompt, future in group if future.set_running_or_notify_cancel()]
+            if not group:
+                continue
+            try:
+                prepared = model.prepare_prompts([prompt for prompt, _ in group], mode)
+            except Exception as e:
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(group, prepared):
+                future.set_result(result)
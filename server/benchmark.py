@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput benchmarks for the Sanatana Dharma LLM server
+Micro-benchmarks of the model loader, an in-process load generator for the
+chat endpoints, and a comparison of two result files
+
+    python benchmark.py micro --tiny --output before.json
+    python benchmark.py load --tiny --concurrency 8 --requests 64 --output before.json
+    python benchmark.py load --rate 2 --requests 60 --endpoint /chat/stream
+    python benchmark.py compare before.json after.json
+
+--tiny swaps the checkpoint for a small randomly initialized GPT-2 with the
+same tokenizer, so runs are offline, fast and independent of the weights.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Benchmarks read the in-process counters, never the multiprocess files
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+TOKENIZER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+# Same questions as GET /examples, for the micro-benchmarks
+QUESTIONS = [
+    ("What is karma yoga according to the Bhagavad-Gita?", "scholar"),
+    ("Explain the concept of dharma in Chapter 2", "scholar"),
+    ("What does Krishna teach about detachment?", "scholar"),
+    ("How does the Gita define the three gunas?", "scholar"),
+    ("What is the significance of the battlefield setting?", "scholar"),
+    ("What is dharma?", "child"),
+    ("How should I behave according to the Gita?", "child"),
+    ("What does Krishna teach about being good?", "child"),
+    ("How can I be brave like Arjuna?", "child"),
+    ("What is the meaning of karma?", "child")
+]
+
+
+def build_tiny_model(output, seed=0):
+    """Save a 2-layer randomly initialized GPT-2 with the project tokenizer to output"""
+    import torch
+    from transformers import AutoTokenizer, GPT2Config, GPT2LMHeadModel
+
+    tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_PATH)
+    torch.manual_seed(seed)
+    config = GPT2Config(
+        vocab_size=len(tokenizer),
+        n_positions=1024,
+        n_embd=64,
+        n_layer=2,
+        n_head=2,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id
+    )
+    GPT2LMHeadModel(config).save_pretrained(output)
+    tokenizer.save_pretrained(output)
+    return output
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3)
+    }
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def tokens_generated():
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value("sanatana_llm_tokens_generated_total") or 0.0
+
+
+def metadata(args, model_path):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import torch
+    import transformers
+    return {
+        "command": args.command,
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "model": "tiny" if args.tiny else model_path,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads()
+    }
+
+
+def run_micro(args, model_path):
+    """Tokenize, generate at each batch size, time to first token, post-process"""
+    import torch
+    from model_loader_gpt2 import SanatanaLLMGPT2
+    from postprocessing import postprocess_response
+
+    llm = SanatanaLLMGPT2(model_path, prefix_cache_mb=args.prefix_cache_mb, dtype=args.dtype, backend=args.backend)
+    if args.speculative:
+        llm.enable_speculative(args.speculative, num_tokens=args.speculative_tokens)
+    results = []
+
+    samples = []
+    for _ in range(args.repeats * 10):
+        for question, mode in QUESTIONS:
+            start = time.perf_counter()
+            llm.prepare_prompt(question, mode)
+            samples.append(time.perf_counter() - start)
+    results.append({"name": "tokenize", "latency": summarize(samples)})
+
+    outputs = []
+    for batch_size in args.batch_sizes:
+        torch.manual_seed(args.seed)
+        prompts = [QUESTIONS[i % len(QUESTIONS)][0] for i in range(batch_size)]
+        llm.generate_batch(prompts[:1])   # warm-up
+        samples, tokens_before, started = [], tokens_generated(), time.perf_counter()
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            outputs.extend(llm.generate_batch(prompts))
+            samples.append(time.perf_counter() - start)
+        elapsed = time.perf_counter() - started
+        tokens = tokens_generated() - tokens_before
+        results.append({
+            "name": f"generate/batch={batch_size}",
+            "latency": summarize(samples),
+            "tokens_per_s": round(tokens / elapsed, 2),
+            "requests_per_s": round(batch_size * args.repeats / elapsed, 3)
+        })
+
+    torch.manual_seed(args.seed)
+    samples, first_tokens, token_gaps = [], [], []
+    for i in range(args.repeats):
+        question, mode = QUESTIONS[i % len(QUESTIONS)]
+        arrivals = []
+        start = time.perf_counter()
+        llm.stream_response(question, mode, on_token=lambda _: arrivals.append(time.perf_counter()))
+        samples.append(time.perf_counter() - start)
+        first_tokens.append(arrivals[0] - start if arrivals else samples[-1])
+        token_gaps.extend(np.diff(arrivals))
+    result = {"name": "stream", "latency": summarize(samples), "ttft": summarize(first_tokens)}
+    if llm.speculator is not None:
+        result["speculative"] = llm.speculator.stats()
+    results.append(result)
+    # Time between streamed tokens: the per-token decode cost at batch size 1
+    results.append({"name": "decode_token", "latency": summarize(token_gaps), "backend": llm.backend.name})
+
+    # Post-processing of real decoded answers, prompt included
+    raw = [(o["response"], "") for o in outputs]
+    for question, mode in QUESTIONS:
+        prompt = llm.prepare_prompt(question, mode).system_prompt
+        raw.append((prompt + " " + outputs[0]["response"], prompt))
+    samples = []
+    for _ in range(max(1, 1000 // len(raw))):
+        for text, prompt in raw:
+            start = time.perf_counter()
+            postprocess_response(text, prompt)
+            samples.append(time.perf_counter() - start)
+    results.append({"name": "postprocess", "latency": summarize(samples)})
+    return results
+
+
+async def asgi_post(app, path, payload):
+    """POST payload to an ASGI app in-process; returns (status, first body chunk time, body)"""
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("benchmark", 0),
+        "server": ("benchmark", 80)
+    }
+    request_sent = False
+    status, first_chunk, chunks = None, None, []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()   # the client never disconnects
+
+    async def send(message):
+        nonlocal status, first_chunk
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if first_chunk is None:
+                first_chunk = time.perf_counter()
+            chunks.append(message["body"])
+
+    await app(scope, receive, send)
+    return status, first_chunk, b"".join(chunks)
+
+
+async def run_load(args, model_path):
+    """Replay the /examples questions against the chat endpoint, closed or open loop"""
+    import settings
+    settings.MODEL_PATH = model_path
+    if not args.cache:
+        settings.RESPONSE_CACHE = "off"
+    if not args.coalesce:
+        settings.COALESCE = False
+    if args.backend:
+        settings.MODEL_BACKEND = args.backend
+    # Every simulated client is one caller; measure the server, not the rate limiter
+    settings.RATE_LIMIT = 0
+    import app_gpt2
+
+    await app_gpt2.app.router.startup()
+    try:
+        # Startup only schedules the load; measure once the app reports ready
+        await app_gpt2.loader_task
+        if app_gpt2.startup_state != "ready":
+            raise RuntimeError(f"App failed to start: {app_gpt2.startup_error}")
+        examples = await app_gpt2.get_examples()
+        questions = [(q, "scholar") for q in examples["scholar_examples"]]
+        questions += [(q, "child") for q in examples["child_examples"]]
+        rng = random.Random(args.seed)
+        order = [questions[rng.randrange(len(questions))] for _ in range(args.requests)]
+
+        latencies, first_chunks, statuses = [], [], {}
+        fields = {"profile": args.profile} if args.profile else {}
+        if args.priority:
+            fields["priority"] = args.priority
+
+        async def send(i, scheduled):
+            question, mode = order[i]
+            status, first_chunk, _ = await asgi_post(
+                app_gpt2.app, args.endpoint, dict(fields, message=question, mode=mode)
+            )
+            done = time.perf_counter()
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                # Measured from the scheduled start, so a backed-up open loop shows up as latency
+                latencies.append(done - scheduled)
+                first_chunks.append((first_chunk or done) - scheduled)
+
+        for i in range(min(args.warmup, len(order))):
+            await asgi_post(app_gpt2.app, args.endpoint, dict(fields, message=order[i][0], mode=order[i][1]))
+
+        tokens_before = tokens_generated()
+        started = time.perf_counter()
+        if args.rate:
+            # Open loop: Poisson arrivals, whether or not earlier requests finished
+            tasks, arrival = [], started
+            for i in range(args.requests):
+                arrival += rng.expovariate(args.rate)
+                await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+                tasks.append(asyncio.create_task(send(i, arrival)))
+            await asyncio.gather(*tasks)
+        else:
+            # Closed loop: each client sends its next request when the last one returns
+            next_request = iter(range(args.requests))
+
+            async def client():
+                for i in next_request:
+                    await send(i, time.perf_counter())
+
+            await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        result = {
+            "name": f"load{args.endpoint}/" + (f"rate={args.rate:g}" if args.rate else f"concurrency={args.concurrency}")
+                    + (f"/{args.profile}" if args.profile else "") + (f"/{args.priority}" if args.priority else ""),
+            "latency": summarize(latencies),
+            "requests_per_s": round(len(latencies) / elapsed, 3),
+            "tokens_per_s": round((tokens_generated() - tokens_before) / elapsed, 2),
+            "statuses": statuses
+        }
+        if args.endpoint == "/chat/stream":
+            result["ttft"] = summarize(first_chunks)
+        return [result]
+    finally:
+        await app_gpt2.app.router.shutdown()
+
+
+def compare(old_path, new_path, threshold):
+    """Print the change of every shared metric; return the regressions beyond threshold percent"""
+    with open(old_path) as f:
+        old = {r["name"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["name"]: r for r in json.load(f)["results"]}
+
+    # (section, key, higher is better)
+    metrics = [
+        ("latency", "p50_ms", False), ("latency", "p95_ms", False), ("latency", "p99_ms", False),
+        ("ttft", "p50_ms", False), ("ttft", "p95_ms", False),
+        (None, "tokens_per_s", True), (None, "requests_per_s", True)
+    ]
+    regressions = []
+    print(f"{'benchmark':<32} {'metric':<20} {'old':>12} {'new':>12} {'change':>9}")
+    for name in old:
+        if name not in new:
+            continue
+        for section, key, higher_is_better in metrics:
+            a = old[name].get(section, {}) if section else old[name]
+            b = new[name].get(section, {}) if section else new[name]
+            if key not in a or key not in b or not a[key]:
+                continue
+            change = (b[key] / a[key] - 1) * 100
+            worse = -change if higher_is_better else change
+            label = f"{section}.{key}" if section else key
+            flag = "  REGRESSION" if worse > threshold else ""
+            print(f"{name:<32} {label:<20} {a[key]:>12.3f} {b[key]:>12.3f} {change:>+8.1f}%{flag}")
+            if flag:
+                regressions.append((name, label))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the model loader and the chat API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("micro", "load"):
+        sub = commands.add_parser(command)
+        sub.add_argument("--model-path", default=None, help="checkpoint (default: MODEL_PATH setting)")
+        sub.add_argument("--tiny", action="store_true", help="use a small randomly initialized GPT-2 instead")
+        sub.add_argument("--seed", type=int, default=0)
+        sub.add_argument("--output", help="write the results as JSON")
+    micro = commands.choices["micro"]
+    micro.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    micro.add_argument("--repeats", type=int, default=5)
+    micro.add_argument("--dtype", default="fp32")
+    micro.add_argument("--backend", default="eager", choices=["eager", "torchscript"])
+    micro.add_argument("--prefix-cache-mb", type=int, default=0)
+    micro.add_argument("--speculative", help="draft for single prompts: ngram or a draft model path")
+    micro.add_argument("--speculative-tokens", type=int, default=4)
+    load = commands.choices["load"]
+    load.add_argument("--endpoint", default="/chat", choices=["/chat", "/chat/stream"])
+    load.add_argument("--requests", type=int, default=50)
+    load.add_argument("--concurrency", type=int, default=4, help="closed-loop clients")
+    load.add_argument("--rate", type=float, default=0.0, help="open-loop arrivals per second (overrides --concurrency)")
+    load.add_argument("--warmup", type=int, default=2)
+    load.add_argument("--cache", action="store_true", help="keep the response cache on")
+    load.add_argument("--coalesce", action="store_true", help="let identical concurrent questions share a generation")
+    load.add_argument("--backend", choices=["eager", "torchscript"], help="inference backend (default: MODEL_BACKEND)")
+    load.add_argument("--priority", help="lane of every request (see LANES); by endpoint and mode if unset")
+    load.add_argument("--profile", choices=["fast", "balanced", "thorough"], help="sampling profile of every request")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        regressions = compare(args.old, args.new, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold}%")
+            sys.exit(1)
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tiny_dir:
+        if args.tiny:
+            model_path = build_tiny_model(tiny_dir, args.seed)
+        else:
+            import settings
+            model_path = args.model_path or settings.MODEL_PATH
+
+        if args.command == "micro":
+            results = run_micro(args, model_path)
+        else:
+            results = asyncio.run(run_load(args, model_path))
+        report = {"meta": metadata(args, model_path), "results": results, "peak_rss_mb": peak_rss_mb()}
+
+    for result in results:
+        line = f"{result['name']:<32}"
+        if result["latency"].get("count"):
+            latency = result["latency"]
+            line += f" p50 {latency['p50_ms']:9.2f}ms  p95 {latency['p95_ms']:9.2f}ms  p99 {latency['p99_ms']:9.2f}ms"
+        if "ttft" in result:
+            line += f"  ttft p50 {result['ttft']['p50_ms']:8.2f}ms"
+        if "tokens_per_s" in result:
+            line += f"  {result['tokens_per_s']:8.1f} tok/s"
+        if "speculative" in result:
+            line += f"  acceptance {result['speculative']['acceptance_rate']}"
+        if "statuses" in result:
+            line += f"  {result['statuses']}"
+        print(line)
+    print(f"peak RSS {report['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Retrieval context for the Sanatana Dharma LLM server
+Packs the best-matching verse passages into a fixed token budget ahead of the question
+"""
+
+import collections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# English passages only by default: GPT-2's byte-level BPE spends several
+# tokens per Devanagari character
+DEFAULT_KINDS = ("et", "ec")
+
+
+class ContextPacker:
+    """Top-k verse passages, formatted and tokenized, within max_context_tokens
+
+    Each passage is tokenized once, cut to max_passage_tokens and kept in an
+    LRU cache, so packing a prompt only concatenates cached token ids.
+    Candidates are taken in score order and skipped if they no longer fit.
+    """
+
+    def __init__(self, index, tokenizer, top_k=4, max_context_tokens=384, max_passage_tokens=128,
+                 kinds=DEFAULT_KINDS, cache_size=4096):
+        self.index = index
+        self.tokenizer = tokenizer
+        self.top_k = top_k
+        self.max_context_tokens = max_context_tokens
+        self.max_passage_tokens = max_passage_tokens
+        self.kinds = kinds
+        self.cache_size = cache_size
+        self.separator = tokenizer("\n\n").input_ids
+        self.hits = 0
+        self.misses = 0
+
+        self._tokens = collections.OrderedDict()   # passage index -> token ids
+        self._lock = threading.Lock()
+
+    def pack(self, question, author=None):
+        """Return (context token ids, verse ids used, in order)"""
+        # A few spare candidates so skipped long passages can be replaced
+        candidates = self.index.search_passages(question, k=self.top_k * 3, author=author, kinds=self.kinds)
+
+        context, verses, used = [], [], 0
+        for passage_index, _ in candidates:
+            tokens = self._passage_tokens(passage_index)
+            if len(context) + len(tokens) > self.max_context_tokens:
+                continue
+            context.extend(tokens)
+            verse_id = self.index.verse_ids[self.index.passage_verse[passage_index]]
+            if verse_id not in verses:
+                verses.append(verse_id)
+            used += 1
+            if used >= self.top_k:
+                break
+        return context, verses
+
+    def stats(self):
+        with self._lock:
+            return {"cached_passages": len(self._tokens), "token_cache_hits": self.hits,
+                    "token_cache_misses": self.misses}
+
+    def _passage_tokens(self, passage_index):
+        with self._lock:
+            tokens = self._tokens.get(passage_index)
+            if tokens is not None:
+                self._tokens.move_to_end(passage_index)
+                self.hits += 1
+                return tokens
+
+        passage = self.index.passage(passage_index)
+        source = f"Bhagavad Gita {passage['verse']}"
+        if passage["author"]:
+            source += f" ({passage['author']})"
+        # Long commentaries only need their opening; 8 characters per token
+        # is well above GPT-2's average, so the cut never costs budget
+        text = f"{source}: {passage['text']}"[:self.max_passage_tokens * 8]
+        tokens = self.tokenizer(text).input_ids[:self.max_passage_tokens - len(self.separator)]
+        tokens = tokens + self.separator
+
+        with self._lock:
+            self.misses += 1
+            self._tokens[passage_index] = tokens
+            while len(self._tokens) > self.cache_size:
+                self._tokens.popitem(last=False)
+        return tokens
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Continuous (iteration-level) batching for the Sanatana Dharma LLM server
+One decode loop keeps a live batch of sequences; they join and leave between steps
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+from metrics import PROMPT_TOKENS, STAGE_SECONDS, TOKENS_GENERATED
+from sampling import finish_reason
+
+logger = logging.getLogger(__name__)
+
+
+class _Sequence:
+    """A request being decoded inside the live batch"""
+
+    __slots__ = (
+        "prompt", "mode", "on_token", "sampling", "system_prompt", "future", "start_time",
+        "token_ids", "prompt_length", "max_new_tokens", "processors", "warpers", "citations", "tokenize_time"
+    )
+
+    def __init__(self, prompt, mode, on_token=None, sampling=None):
+        self.prompt = prompt
+        self.mode = mode
+        self.on_token = on_token     # called with each sampled token id, for streaming
+        self.sampling = sampling     # sampling.Sampling; None means the balanced profile
+        self.system_prompt = None
+        self.future = Future()
+        self.start_time = time.time()
+        self.token_ids = []          # prompt + generated tokens
+        self.prompt_length = 0
+        self.max_new_tokens = 0
+        self.processors = None
+        self.warpers = None
+        self.citations = None
+        self.tokenize_time = None
+
+    @property
+    def num_generated(self):
+        return len(self.token_ids) - self.prompt_length
+
+
+class _LiveBatch:
+    """Left-padded KV cache, attention mask and positions of the live sequences
+
+    Row i of every tensor belongs to sequences[i]. Padding sits on the left
+    so all rows share the same cache length and new tokens line up.
+    """
+
+    def __init__(self):
+        self.sequences = []
+        self.past_key_values = None   # per layer (key, value), each [batch, heads, length, head_dim]
+        self.attention_mask = None    # [batch, length]
+        self.positions = None         # [batch] position id of the next token
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def add(self, sequence, past_key_values):
+        """Append a freshly prefilled sequence (batch of one)"""
+        length = past_key_values[0][0].shape[2]
+        mask = torch.ones(1, length, dtype=torch.long)
+        position = torch.tensor([length], dtype=torch.long)
+
+        if not self.sequences:
+            self.sequences = [sequence]
+            self.past_key_values = past_key_values
+            self.attention_mask = mask
+            self.positions = position
+            return
+
+        target = max(length, self.attention_mask.shape[1])
+        self.past_key_values = tuple(
+            (
+                torch.cat([_pad_left(k, target), _pad_left(new_k, target)]),
+                torch.cat([_pad_left(v, target), _pad_left(new_v, target)])
+            )
+            for (k, v), (new_k, new_v) in zip(self.past_key_values, past_key_values)
+        )
+        self.attention_mask = torch.cat([_pad_left(self.attention_mask, target), _pad_left(mask, target)])
+        self.positions = torch.cat([self.positions, position])
+        self.sequences.append(sequence)
+
+    def keep(self, rows):
+        """Drop every row not listed in rows and trim all-padding columns"""
+        if not rows:
+            self.__init__()
+            return
+
+        index = torch.tensor(rows, dtype=torch.long)
+        mask = self.attention_mask.index_select(0, index)
+
+        # Columns that are padding for every remaining row can go
+        first = int((mask.sum(dim=0) > 0).nonzero()[0])
+        mask = mask[:, first:]
+
+        self.past_key_values = tuple(
+            (k.index_select(0, index)[:, :, first:], v.index_select(0, index)[:, :, first:])
+            for k, v in self.past_key_values
+        )
+        self.attention_mask = mask
+        self.positions = self.positions.index_select(0, index)
+        self.sequences = [self.sequences[i] for i in rows]
+
+
+def _pad_left(tensor, length):
+    # Works for KV tensors ([batch, heads, len, dim]) and masks ([batch, len])
+    missing = length - (tensor.shape[2] if tensor.dim() == 4 else tensor.shape[1])
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    if tensor.dim() == 4:
+        shape[2] = missing
+        return torch.cat([tensor.new_zeros(shape), tensor], dim=2)
+    shape[1] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=1)
+
+
+class ContinuousBatchingEngine:
+    """Iteration-level batching over a single GPT-2 decode loop
+
+    Every step runs one forward pass for all live sequences. Finished
+    sequences (EOS or token budget) leave immediately and waiting requests
+    are prefilled and join before the next step, so no compute is spent on
+    padding for answers that are already done. Sampling reproduces
+    each request's generation config through the same logits processors HF
+    generate uses, so sequences of every profile share the batch; a
+    sequence past its deadline leaves with the tokens it has.
+    """
+
+    def __init__(self, llm, executor, max_batch_size=16, num_threads=0):
+        self.llm = llm
+        self.executor = executor     # runs post-processing off the decode loop
+        self.max_batch_size = max(1, max_batch_size)
+        self.num_threads = num_threads or (os.cpu_count() or 1)
+        self.eos_token_id = llm.tokenizer.eos_token_id
+
+        self._cond = threading.Condition()
+        self._inbox = collections.deque()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._decode_loop, name="continuous-batching", daemon=True)
+        self._thread.start()
+
+        logger.info(f"Continuous batching: up to {self.max_batch_size} live sequences, {self.num_threads} threads")
+
+    def submit(self, prompt, mode="scholar", on_token=None, sampling=None):
+        """Queue a prompt; returns a Future resolving to its response dict
+
+        prompt may be a string, a PreparedPrompt or a Future of one (see
+        SanatanaLLMGPT2.resolve_prompt). on_token, if given, receives every
+        sampled token id from the decode loop.
+        """
+        sequence = _Sequence(prompt, mode, on_token, sampling)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Continuous batching engine is shut down")
+            self._inbox.append(sequence)
+            self._cond.notify()
+        return sequence.future
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _decode_loop(self):
+        torch.set_num_threads(self.num_threads)
+        batch = _LiveBatch()
+
+        with torch.inference_mode():
+            while True:
+                with self._cond:
+                    while not self._closed and not self._inbox and not batch:
+                        self._cond.wait()
+                    if self._closed:
+                        break
+                    joining = []
+                    while self._inbox and len(batch) + len(joining) < self.max_batch_size:
+                        joining.append(self._inbox.popleft())
+
+                for sequence in joining:
+                    if not sequence.future.set_running_or_notify_cancel():
+                        continue   # caller already gave up
+                    try:
+                        self._prefill(batch, sequence)
+                    except Exception as e:
+                        logger.error(f"Prefill failed: {e}")
+                        self._finish(sequence, error=e)
+
+                try:
+                    if batch:
+                        self._step(batch)
+                except Exception as e:
+                    logger.error(f"Decode loop failed: {e}")
+                    for sequence in batch.sequences:
+                        self._finish(sequence, error=e)
+                    batch = _LiveBatch()
+
+        # Shut down: fail whatever is still waiting or decoding
+        error = RuntimeError("Continuous batching engine is shut down")
+        for sequence in batch.sequences + list(self._inbox):
+            if not sequence.future.done():
+                sequence.future.set_exception(error)
+
+    def _prefill(self, batch, sequence):
+        llm = self.llm
+        STAGE_SECONDS.labels("batch_wait").observe(time.time() - sequence.start_time)
+        prepared = llm.resolve_prompt(sequence.prompt, sequence.mode)
+        sequence.system_prompt = prepared.system_prompt
+        sequence.citations = prepared.citations
+        sequence.tokenize_time = prepared.tokenize_time
+        input_ids = torch.tensor([prepared.input_ids], dtype=torch.long)
+
+        if sequence.sampling is None:
+            sequence.sampling = llm.make_sampling()
+        config = sequence.sampling.config
+        sequence.token_ids = list(prepared.input_ids)
+        sequence.prompt_length = len(sequence.token_ids)
+        sequence.max_new_tokens = llm.token_budget(config, sequence.prompt_length)
+        sequence.processors, sequence.warpers = llm.make_logits_processors(sequence.prompt_length, config)
+        PROMPT_TOKENS.inc(sequence.prompt_length)
+
+        # Only tokens past the longest cached prefix need a forward pass
+        start = time.perf_counter()
+        past_key_values = llm.prefill_prefix(input_ids)
+        cached = past_key_values[0][0].shape[2] if past_key_values is not None else 0
+        outputs = llm.model(input_ids=input_ids[:, cached:], past_key_values=past_key_values, use_cache=True)
+        token = self._sample(sequence, outputs.logits[0, -1])
+        STAGE_SECONDS.labels("prefill").observe(time.perf_counter() - start)
+        self._append(sequence, token)
+
+        if self._is_finished(sequence, token):
+            self._finish(sequence)
+        else:
+            batch.add(sequence, outputs.past_key_values)
+
+    def _step(self, batch):
+        start = time.perf_counter()
+        input_ids = torch.tensor([[s.token_ids[-1]] for s in batch.sequences], dtype=torch.long)
+        attention_mask = torch.cat(
+            [batch.attention_mask, batch.attention_mask.new_ones(len(batch), 1)], dim=1
+        )
+
+        outputs = self.llm.model(
+            input_ids=input_ids,
+            past_key_values=batch.past_key_values,
+            attention_mask=attention_mask,
+            position_ids=batch.positions.unsqueeze(1),
+            use_cache=True
+        )
+        batch.past_key_values = outputs.past_key_values
+        batch.attention_mask = attention_mask
+        batch.positions = batch.positions + 1
+
+        keep = []
+        for row, sequence in enumerate(batch.sequences):
+            token = self._sample(sequence, outputs.logits[row, -1])
+            self._append(sequence, token)
+            if self._is_finished(sequence, token):
+                self._finish(sequence)
+            else:
+                keep.append(row)
+        STAGE_SECONDS.labels("decode_token").observe(time.perf_counter() - start)
+
+        if len(keep) < len(batch):
+            batch.keep(keep)
+
+    def _sample(self, sequence, logits):
+        ids = torch.tensor([sequence.token_ids], dtype=torch.long)
+        scores = sequence.processors(ids, logits.unsqueeze(0).float())
+        scores = sequence.warpers(ids, scores)
+        probs = torch.softmax(scores, dim=-1)
+        return int(torch.multinomial(probs, num_samples=1)[0, 0])
+
+    def _append(self, sequence, token):
+        sequence.token_ids.append(token)
+        if sequence.on_token is not None:
+            try:
+                sequence.on_token(token)
+            except Exception as e:
+                # A broken stream consumer must not take down the batch
+                logger.warning(f"Token callback failed: {e}")
+                sequence.on_token = None
+
+    def _is_finished(self, sequence, token):
+        return (
+            token == self.eos_token_id
+            or sequence.num_generated >= sequence.max_new_tokens
+            or sequence.sampling.expired()
+        )
+
+    def _finish(self, sequence, error=None):
+        if error is not None:
+            if not sequence.future.done():
+                sequence.future.set_exception(error)
+            return
+        TOKENS_GENERATED.inc(sequence.num_generated)
+        # Decoding and the regex clean-up run on a worker, not the decode loop
+        self.executor.submit(self._complete, sequence)
+
+    def _complete(self, sequence):
+        try:
+            result = self.llm.finish_response(
+                sequence.token_ids,
+                sequence.system_prompt,
+                sequence.mode,
+                sequence.start_time,
+                sequence.citations,
+                profile=sequence.sampling.profile,
+                finish_reason=finish_reason(
+                    sequence.token_ids[sequence.prompt_length:], sequence.max_new_tokens, self.eos_token_id
+                ),
+                tokenize_time=sequence.tokenize_time
+            )
+            sequence.future.set_result(result)
+        except Exception as e:
+            sequence.future.set_exception(e)
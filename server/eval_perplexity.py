@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Perplexity guardrail for the reduced-precision model modes
+Scores the held-out verses with fp32 and each requested MODEL_DTYPE and
+fails if quality drops more than allowed
+
+generate_clean_dataset.py writes every 20th verse of each chapter to
+clean_gita_training_dataset_eval.jsonl instead of the training JSONL, so the
+notebook never trains on them. (A checkpoint trained on a dataset built
+before that split has seen them; retrain before reading the perplexity as
+a generalization metric.)
+
+    python eval_perplexity.py --dtype bf16 int8
+"""
+
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+
+import torch
+
+import settings
+from model_loader_gpt2 import MODEL_DTYPES, SanatanaLLMGPT2
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATASET = "../data/jsonl/clean_gita_training_dataset_eval.jsonl"
+
+
+def load_texts(path, limit):
+    """First `limit` examples, formatted exactly like the training notebook"""
+    with open(path, encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    texts = []
+    for example in examples[:limit]:
+        instruction = example.get("instruction") or example.get("input", "")
+        response = example.get("response") or example.get("output", "")
+        texts.append(f"Question: {instruction}\nAnswer: {response}<|endoftext|>")
+    return texts
+
+
+def perplexity(llm, texts, max_length=256):
+    """Token-weighted perplexity of the texts and the seconds it took"""
+    total_nll, total_tokens = 0.0, 0
+    start = time.time()
+    with torch.inference_mode():
+        for text in texts:
+            input_ids = llm.tokenizer(text, return_tensors="pt", truncation=True, max_length=max_length).input_ids
+            if input_ids.shape[1] < 2:
+                continue
+            logits = llm.model(input_ids=input_ids).logits[0, :-1].float()
+            nll = torch.nn.functional.cross_entropy(logits, input_ids[0, 1:], reduction="sum")
+            total_nll += float(nll)
+            total_tokens += input_ids.shape[1] - 1
+    return math.exp(total_nll / max(total_tokens, 1)), time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare perplexity of reduced-precision modes against fp32")
+    parser.add_argument("--model-path", default=settings.MODEL_PATH)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--limit", type=int, default=200, help="held-out examples scored")
+    parser.add_argument("--dtype", nargs="+", default=["bf16", "int8"], choices=MODEL_DTYPES[1:])
+    parser.add_argument("--max-increase", type=float, default=5.0,
+                        help="allowed perplexity increase over fp32, in percent")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    texts = load_texts(args.dataset, args.limit)
+    print(f"Scoring {len(texts)} held-out examples from {args.dataset}")
+
+    baseline, seconds = perplexity(SanatanaLLMGPT2(args.model_path, prefix_cache_mb=0), texts)
+    print(f"{'fp32':>5}  ppl {baseline:8.3f}  {seconds:6.1f}s")
+
+    failed = []
+    for dtype in args.dtype:
+        llm = SanatanaLLMGPT2(args.model_path, prefix_cache_mb=0, dtype=dtype)
+        score, seconds = perplexity(llm, texts)
+        increase = (score / baseline - 1) * 100
+        status = "ok" if increase <= args.max_increase else "FAIL"
+        print(f"{dtype:>5}  ppl {score:8.3f}  {seconds:6.1f}s  {increase:+6.2f}%  {status}")
+        if status == "FAIL":
+            failed.append(dtype)
+        del llm
+
+    if failed:
+        print(f"Perplexity increase above {args.max_increase}% for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
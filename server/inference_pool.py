@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Inference worker pool for the Sanatana Dharma LLM server
+Runs blocking model calls on dedicated threads so the event loop stays free
+
+Requests wait for a slot in priority lanes (LANES, e.g. "interactive:4,bulk:1:0.75"):
+free slots go to the lanes in proportion to their weights, a lane may be
+capped to a share of the slots so others always find one free, and inside a
+lane clients take turns, so one heavy client cannot starve the rest.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import QUEUE_SECONDS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue cannot take another request"""
+
+    def __init__(self, retry_after):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceTimeoutError(Exception):
+    """Raised when a request does not finish within its time budget"""
+
+
+def parse_lanes(spec):
+    """[(name, weight, max_share)] from "name:weight[:max_share],...", highest priority first"""
+    lanes = []
+    for item in spec.split(","):
+        parts = [part.strip() for part in item.split(":")]
+        if not parts[0]:
+            continue
+        if len(parts) > 3:
+            raise ValueError(f"Bad lane {item!r}, expected name:weight[:max_share]")
+        weight = float(parts[1]) if len(parts) > 1 else 1.0
+        max_share = float(parts[2]) if len(parts) > 2 else 1.0
+        if weight <= 0 or not 0 < max_share <= 1:
+            raise ValueError(f"Bad lane {item!r}: weight must be positive and max_share in (0, 1]")
+        lanes.append((parts[0], weight, max_share))
+    if not lanes:
+        raise ValueError("At least one lane is needed")
+    if len({name for name, _, _ in lanes}) < len(lanes):
+        raise ValueError(f"Lane listed twice in {spec!r}")
+    return lanes
+
+
+class _Lane:
+    """Waiters of one priority lane, ordered by start-time fair queuing across clients
+
+    A waiter's tag is when its client's previous request in the lane would
+    have finished in a fair share of the lane (or now, for an idle client);
+    the smallest tag is served first.
+    """
+
+    def __init__(self, name, weight, max_in_flight):
+        self.name = name
+        self.weight = weight
+        self.max_in_flight = max_in_flight
+        self.active = 0
+        self.admitted = 0
+        self.avg_wait = 0.0
+        self.pass_value = 0.0       # stride scheduling between lanes
+        self._heap = []             # (tag, seq, waiter, client)
+        self._finish = {}           # client -> tag after its last queued request
+        self._vtime = 0.0           # tag of the last request served
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, waiter, client, seq):
+        tag = max(self._vtime, self._finish.get(client, 0.0))
+        self._finish[client] = tag + 1.0
+        heapq.heappush(self._heap, (tag, seq, waiter, client))
+
+    def pop(self):
+        tag, _, waiter, _ = heapq.heappop(self._heap)
+        self._vtime = tag
+        if not self._heap:
+            # Everyone is idle again: nobody keeps credit or debt
+            self._finish.clear()
+        return waiter
+
+    def remove(self, waiter):
+        entries = [entry for entry in self._heap if entry[2] is not waiter]
+        if len(entries) < len(self._heap):
+            self._heap = entries
+            heapq.heapify(self._heap)
+            if not self._heap:
+                self._finish.clear()
+
+    def stats(self):
+        return {
+            "weight": self.weight,
+            "max_in_flight": self.max_in_flight,
+            "active": self.active,
+            "queued": len(self._heap),
+            "clients_waiting": len({entry[3] for entry in self._heap}),
+            "admitted": self.admitted,
+            "avg_wait": round(self.avg_wait, 3)
+        }
+
+
+def _init_worker(num_threads):
+    # Imported here so the app can serve /live before torch has loaded
+    import torch
+
+    # Each worker gets its own slice of the CPU cores for intra-op parallelism
+    torch.set_num_threads(num_threads)
+
+
+class InferencePool:
+    """Fixed set of inference threads behind bounded, weighted-fair admission lanes
+
+    max_in_flight is how many admitted requests may be running at once; it
+    defaults to one per worker and is raised when requests share a worker
+    through batching. lanes is parse_lanes() output (one FIFO lane by
+    default); max_queue bounds each lane's queue.
+    """
+
+    def __init__(self, max_workers=4, max_queue=16, timeout=60.0, intra_op_threads=0, max_in_flight=None,
+                 lanes=None):
+        self.max_workers = max(1, max_workers)
+        self.max_in_flight = max(self.max_workers, max_in_flight or 0)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.lanes = {
+            name: _Lane(name, weight, max(1, int(self.max_in_flight * max_share)))
+            for name, weight, max_share in lanes or [("default", 1.0, 1.0)]
+        }
+        self.default_lane = next(iter(self.lanes))
+
+        if intra_op_threads <= 0:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+        self.intra_op_threads = intra_op_threads
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="inference",
+            initializer=_init_worker,
+            initargs=(intra_op_threads,)
+        )
+
+        self._active = 0                      # slots held by running or submitted calls
+        self._avg_service_time = 5.0          # seconds, moving average of finished calls
+        self._pass = 0.0                      # pass value of the lane served last
+        self._seq = itertools.count()         # FIFO among equal tags
+
+        split = ", ".join(f"{lane.name} {lane.weight:g} (max {lane.max_in_flight})" for lane in self.lanes.values())
+        logger.info(
+            f"Inference pool: {self.max_workers} workers x {intra_op_threads} threads, "
+            f"queue {self.max_queue} per lane, timeout {self.timeout}s, lanes: {split}"
+        )
+
+    async def run(self, fn, *args, lane=None, client=None, **kwargs):
+        """Run fn(*args, **kwargs) on an inference worker and return its result"""
+        return await self.wait(lambda: self.executor.submit(fn, *args, **kwargs), lane=lane, client=client)
+
+    async def wait(self, start, lane=None, client=None):
+        """Admit a request, call start() to launch it and await the future it returns
+
+        start must return a concurrent.futures.Future that completes on an
+        inference worker (directly, or via the batch scheduler). lane is a
+        lane name (the first lane if None) and client whoever the request
+        is fair-queued as.
+        """
+        loop = asyncio.get_running_loop()
+        arrival = loop.time()
+        deadline = arrival + self.timeout
+        lane = self.lanes[lane or self.default_lane]
+
+        await self._acquire(loop, deadline, lane, client)
+        waited = loop.time() - arrival
+        STAGE_SECONDS.labels("queue").observe(waited)
+        QUEUE_SECONDS.labels(lane.name).observe(waited)
+        lane.avg_wait = 0.8 * lane.avg_wait + 0.2 * waited
+
+        started = time.monotonic()
+        try:
+            future = start()
+        except BaseException:
+            self._release(lane)
+            raise
+
+        # The slot is only given back once the worker is actually done,
+        # even if the caller has already timed out and gone away
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._release, lane, time.monotonic() - started)
+        )
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            raise InferenceTimeoutError(f"Request exceeded {self.timeout:.0f}s")
+
+    def retry_after(self, lane=None):
+        """Estimate in seconds until a queued request would get a worker"""
+        lane = self.lanes[lane or self.default_lane]
+        backlog = len(lane) + 1
+        return max(1, math.ceil(self._avg_service_time * backlog / lane.max_in_flight))
+
+    def stats(self):
+        """Current pool occupancy, overall and per lane"""
+        return {
+            "workers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "active": self._active,
+            "queued": sum(len(lane) for lane in self.lanes.values()),
+            "max_queue": self.max_queue,
+            "avg_service_time": round(self._avg_service_time, 3),
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()}
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _acquire(self, loop, deadline, lane, client):
+        if len(lane) >= self.max_queue and not self._can_admit(lane):
+            raise QueueFullError(self.retry_after(lane.name))
+
+        waiter = loop.create_future()
+        if not lane:
+            # An idle lane starts level with the others instead of using up banked turns
+            lane.pass_value = max(lane.pass_value, self._pass)
+        lane.push(waiter, client, next(self._seq))
+        self._dispatch()
+        if waiter.done():
+            return
+        try:
+            await asyncio.wait_for(waiter, max(0.0, deadline - loop.time()))
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self._release(lane)
+            else:
+                lane.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise InferenceTimeoutError(f"Request waited {self.timeout:.0f}s for a worker") from None
+            raise
+
+    def _can_admit(self, lane):
+        return self._active < self.max_in_flight and lane.active < lane.max_in_flight
+
+    def _dispatch(self):
+        """Hand free slots to waiters: lanes by weight (stride scheduling), clients fairly within one"""
+        while self._active < self.max_in_flight:
+            ready = [lane for lane in self.lanes.values() if lane and lane.active < lane.max_in_flight]
+            if not ready:
+                return
+            lane = min(ready, key=lambda lane: lane.pass_value)
+            waiter = lane.pop()
+            if waiter.done():
+                # Gave up before its cleanup ran
+                continue
+            self._pass = lane.pass_value
+            lane.pass_value += 1.0 / lane.weight
+            self._active += 1
+            lane.active += 1
+            lane.admitted += 1
+            waiter.set_result(None)
+
+    def _release(self, lane, service_time=None):
+        if service_time is not None:
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+        self._active -= 1
+        lane.active -= 1
+        self._dispatch()
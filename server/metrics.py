@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics for the Sanatana Dharma LLM server
+Per-stage latency of the inference path plus request, token and cache counters
+"""
+
+import os
+
+# config.env may set PROMETHEUS_MULTIPROC_DIR, and prometheus_client reads it at import
+import settings
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# With several uvicorn workers every process writes its samples to files in
+# this directory and /metrics merges them. It must be emptied before the
+# workers start (the Dockerfile and systemd unit do this).
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+if MULTIPROCESS_DIR:
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+
+# From post-processing (~40us) up to a full generation under load
+_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+# Where time goes inside one request:
+#   queue        waiting for an inference slot (admission queue)
+#   batch_wait   waiting in the batch scheduler or continuous-batching inbox
+#   tokenize     building and tokenizing the prompt
+#   retrieval    searching and packing verse passages (RAG only)
+#   prefill      forward pass over the prompt, prefix cache included
+#   decode_token one decode step (one token for every sequence in the batch)
+#   postprocess  detokenizing and cleaning the answer text
+#   citations    extracting citations from ungrounded answers
+STAGE_SECONDS = Histogram(
+    "sanatana_llm_stage_seconds",
+    "Time spent in each stage of the inference path",
+    ["stage"],
+    buckets=_BUCKETS
+)
+
+# Admission wait by priority lane (LANES), to check that interactive requests
+# stay fast while bulk ones queue
+QUEUE_SECONDS = Histogram(
+    "sanatana_llm_queue_seconds",
+    "Time waiting for an inference slot by priority lane",
+    ["lane"],
+    buckets=_BUCKETS
+)
+
+# source: model, response_cache, verse_store or coalesced; model: model_used of the
+# answer, to compare models that share traffic; the _count series counts answered requests
+REQUEST_SECONDS = Histogram(
+    "sanatana_llm_request_seconds",
+    "End-to-end chat request latency by where the answer came from",
+    ["endpoint", "source", "model"],
+    buckets=_BUCKETS
+)
+
+ERRORS = Counter(
+    "sanatana_llm_errors",
+    "Chat requests that failed, by HTTP status",
+    ["status"]
+)
+
+FALLBACK_RESPONSES = Counter(
+    "sanatana_llm_fallback_responses",
+    "Generations that failed and returned the fallback answer"
+)
+
+TOKENS_GENERATED = Counter(
+    "sanatana_llm_tokens_generated",
+    "Tokens sampled by the model"
+)
+
+PROMPT_TOKENS = Counter(
+    "sanatana_llm_prompt_tokens",
+    "Prompt tokens, retrieved context included"
+)
+
+# result: proposed or accepted; accepted / proposed is the acceptance rate
+SPECULATIVE_TOKENS = Counter(
+    "sanatana_llm_speculative_tokens",
+    "Draft tokens proposed to and accepted by the main model in speculative decoding",
+    ["result"]
+)
+
+# endpoint: chat or chat_stream
+COALESCED_REQUESTS = Counter(
+    "sanatana_llm_coalesced_requests",
+    "Requests answered by an identical request's in-flight generation",
+    ["endpoint"]
+)
+
+# cache: response or prefix; result: hit or miss
+CACHE_LOOKUPS = Counter(
+    "sanatana_llm_cache_lookups",
+    "Response cache and prompt prefix cache lookups",
+    ["cache", "result"]
+)
+
+
+def render():
+    """Return (body, content type) of the current metrics, merged across workers"""
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
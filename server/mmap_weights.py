@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped safetensors weights for the Sanatana Dharma LLM server
+Every uvicorn worker maps the same file, so the weights live once in the page cache
+
+Convert a checkpoint once before enabling MODEL_MMAP:
+    python mmap_weights.py models/gpt2-gita-clean
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import warnings
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# File written by the conversion step, next to config.json
+MMAP_WEIGHTS_FILE = "model.mmap.safetensors"
+
+_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def find_weights_file(model_path):
+    """Converted weights if present, else the checkpoint's own safetensors, else None"""
+    for name in (MMAP_WEIGHTS_FILE, "model.safetensors"):
+        path = os.path.join(model_path, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def load_mmap_state_dict(path):
+    """State dict whose tensors point straight into a memory-mapped safetensors file
+
+    The mapping is copy-on-write: pages stay shared with every other process
+    mapping the file until something writes to them, and a stray in-place
+    write only copies that page instead of faulting.
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    state_dict = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        count = (end - begin) // torch.empty(0, dtype=dtype).element_size()
+        if count == 0:
+            state_dict[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + begin)
+        state_dict[name] = tensor.view(info["shape"])
+    return state_dict
+
+
+def load_mmap_model(model_path, weights_file):
+    """Build the model skeleton without allocating weights, then point it at the mapped file"""
+    from accelerate import init_empty_weights
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    config = AutoConfig.from_pretrained(model_path)
+    with init_empty_weights():
+        model = AutoModelForCausalLM.from_config(config)
+
+    state_dict = load_mmap_state_dict(weights_file)
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        raise ValueError(f"{weights_file} is missing weights: {', '.join(missing[:5])}")
+
+    model.eval()
+    return model
+
+
+def convert_checkpoint(model_path, output=None, dtype=torch.float32):
+    """Write the checkpoint's weights as an mmap-friendly safetensors file (float32 by default)"""
+    from safetensors.torch import save_file
+    from transformers import AutoModelForCausalLM
+
+    output = output or os.path.join(model_path, MMAP_WEIGHTS_FILE)
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=dtype)
+
+    # Tied weights (lm_head -> wte) are stored once and re-tied at load time
+    state_dict = {}
+    seen = set()
+    for name, tensor in model.state_dict().items():
+        if tensor.data_ptr() in seen:
+            continue
+        seen.add(tensor.data_ptr())
+        state_dict[name] = tensor.contiguous()
+
+    save_file(state_dict, output, metadata={"format": "pt"})
+    size_mb = os.path.getsize(output) / 1e6
+    logger.info(f"Wrote {len(state_dict)} tensors ({size_mb:.1f} MB) to {output}")
+    return output
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Convert a checkpoint to memory-mappable safetensors")
+    parser.add_argument("model_path", help="checkpoint directory, e.g. models/gpt2-gita-clean")
+    parser.add_argument("--output", help=f"output file (default: <model_path>/{MMAP_WEIGHTS_FILE})")
+    parser.add_argument("--dtype", choices=["fp32", "bf16"], default="fp32",
+                        help="stored precision; bf16 matches MODEL_DTYPE=bf16 without a private copy")
+    args = parser.parse_args()
+    dtype = torch.bfloat16 if args.dtype == "bf16" else torch.float32
+    convert_checkpoint(args.model_path, args.output, dtype)
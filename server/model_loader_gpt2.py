@@ -5,226 +5,612 @@ Uses GPT-2 as a working model that fits in memory
 """
 
 import torch
+import os
 import time
 import logging
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from concurrent.futures import Future
+from transformers import AutoModelForCausalLM
+from transformers import (
+    LogitsProcessor,
+    LogitsProcessorList,
+    MinNewTokensLengthLogitsProcessor,
+    NoRepeatNGramLogitsProcessor,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper
+)
+from transformers.generation.streamers import BaseStreamer
+from transformers.pytorch_utils import Conv1D
+from context_packer import ContextPacker
+from inference_backend import make_backend
+from metrics import CACHE_LOOKUPS, FALLBACK_RESPONSES, PROMPT_TOKENS, STAGE_SECONDS, TOKENS_GENERATED
+from postprocessing import FALLBACK_RESPONSE, postprocess_response
+from prefix_cache import PrefixCache
+from sampling import Sampling, finish_reason, resolve_config
+from tokenization import TokenCache, load_fast_tokenizer
+from speculative import DraftModelDrafter, NgramDrafter, SpeculativeDecoder, build_ngram_table
+from mmap_weights import find_weights_file, load_mmap_model
 
 logger = logging.getLogger(__name__)
 
+# Sampling settings shared by every generate call
+GENERATION_CONFIG = {
+    "max_new_tokens": 150,       # Further reduced for conciseness
+    "min_new_tokens": 20,        # Allow very brief answers
+    "temperature": 0.6,          # Lower temp = more focused
+    "do_sample": True,
+    "top_p": 0.85,               # More focused sampling
+    "top_k": 40,                 # More selective
+    "repetition_penalty": 1.15,  # Slight repetition penalty
+    "no_repeat_ngram_size": 3    # Prevent 3-word repetitions
+}
+
+# Fixed template text that starts every prompt of its kind; its KV is computed
+# once at load time and pinned in the prefix cache
+TEMPLATE_PREFIXES = [
+    "Explain in simple words for a child:"
+]
+
+# Formatted prompts (template + question) are cut to this many tokens
+PROMPT_MAX_TOKENS = 100
+
+# Precision modes selectable with MODEL_DTYPE
+MODEL_DTYPES = ("fp32", "bf16", "int8")
+
+def _conv1d_to_linear(module):
+    """Swap GPT-2's Conv1D layers for equivalent nn.Linear so dynamic quantization covers them"""
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            # Conv1D computes x @ W + b with W stored as [in, out]
+            linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+            linear.weight = torch.nn.Parameter(child.weight.detach().t().contiguous(), requires_grad=False)
+            linear.bias = torch.nn.Parameter(child.bias.detach().clone(), requires_grad=False)
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+class PreparedPrompt:
+    """A prompt ready for the model: its text, token ids and the verses it was grounded on
+    
+    tokenize_time is the seconds spent building and tokenizing it, retrieval excluded.
+    """
+    
+    __slots__ = ("system_prompt", "input_ids", "citations", "tokenize_time")
+    
+    def __init__(self, system_prompt, input_ids, citations=None, tokenize_time=None):
+        self.system_prompt = system_prompt
+        self.input_ids = input_ids
+        self.citations = citations
+        self.tokenize_time = tokenize_time
+
+class DeadlineLogitsProcessor(LogitsProcessor):
+    """Forces EOS on rows whose deadline has passed, so they end with what they have
+    
+    generate() can only stop a whole batch, but a row that samples EOS is
+    finished on its own. Rows cut short this way are recorded in cut.
+    """
+    
+    def __init__(self, deadlines, eos_token_id, pad_token_id):
+        self.deadlines = deadlines   # per row, time.monotonic() value or None
+        self.eos_token_id = eos_token_id
+        self.finished_ids = {eos_token_id, pad_token_id}
+        self.cut = set()
+    
+    def __call__(self, input_ids, scores):
+        now = time.monotonic()
+        for row, deadline in enumerate(self.deadlines):
+            if deadline is None or now < deadline:
+                continue
+            # A finished row ends with its EOS, then generate() pads it with
+            # pad_token_id (<|pad|> for the fine-tuned checkpoints); it was not cut
+            if row not in self.cut and int(input_ids[row, -1]) in self.finished_ids:
+                continue
+            self.cut.add(row)
+            scores[row, :] = -float("inf")
+            scores[row, self.eos_token_id] = 0
+        return scores
+
+class TokenCallbackStreamer(BaseStreamer):
+    """Passes each newly generated token id to a callback (batch size 1 only)"""
+    
+    def __init__(self, on_token):
+        self.on_token = on_token
+        self._prompt_seen = False
+    
+    def put(self, value):
+        # generate() first hands over the prompt, then one token per step
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for token_id in value.view(-1).tolist():
+            self.on_token(token_id)
+    
+    def end(self):
+        pass
+
+class StageTimer(BaseStreamer):
+    """Times the prefill and every decode step of a generate call
+    
+    generate() hands the streamer the prompt first and then one token per
+    step, so the gaps between calls are the step times. Calls are forwarded
+    to streamer, if given.
+    """
+    
+    def __init__(self, streamer=None):
+        self.streamer = streamer
+        self._last = time.perf_counter()
+        self._calls = 0
+    
+    def put(self, value):
+        now = time.perf_counter()
+        # Call 1 is the prompt; call 2 follows the prefill, which starts
+        # when the timer is created (prefix cache lookup included)
+        if self._calls == 1:
+            STAGE_SECONDS.labels("prefill").observe(now - self._last)
+            self._last = now
+        elif self._calls > 1:
+            STAGE_SECONDS.labels("decode_token").observe(now - self._last)
+            self._last = now
+        self._calls += 1
+        if self.streamer is not None:
+            self.streamer.put(value)
+    
+    def end(self):
+        if self.streamer is not None:
+            self.streamer.end()
+
 class SanatanaLLMGPT2:
     """GPT-2 based AI model for Bhagavad-Gita knowledge"""
     
-    def __init__(self, model_path="gpt2", device="cpu"):
+    def __init__(self, model_path="gpt2", device="cpu", prefix_cache_mb=0, mmap_weights=False, dtype="fp32",
+                 name=None, backend="eager", token_cache_size=4096):
+        if dtype not in MODEL_DTYPES:
+            raise ValueError(f"Unknown model dtype {dtype!r}, expected one of {', '.join(MODEL_DTYPES)}")
+        # Eager PyTorch or a traced graph (see inference_backend.BACKENDS)
+        self.backend = make_backend(backend)
         self.model_path = model_path
+        # Reported as model_used; the checkpoint directory unless the registry names it
+        self.name = name or os.path.basename(os.path.normpath(model_path))
         self.device = device
+        self.mmap_weights = mmap_weights
+        self.dtype = dtype
         self.tokenizer = None
+        self.token_cache = None
+        self.token_cache_size = token_cache_size
         self.model = None
+        self.context_packer = None
+        self.speculator = None
+        self.generation_config = GENERATION_CONFIG
+        self.prefix_cache = PrefixCache(prefix_cache_mb * 1024 * 1024) if prefix_cache_mb > 0 else None
+        self.load_timings = {}   # seconds per loading step
         
         self._load_model()
+        start = time.perf_counter()
+        self._warm_prefix_cache()
+        self.load_timings["prefix_cache"] = time.perf_counter() - start
     
     def _load_model(self):
         try:
             logger.info("Loading GPT-2 tokenizer...")
+            start = time.perf_counter()
             
-            # Load tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+            # Load tokenizer (always the fast one, checked against the checkpoint's added tokens)
+            self.tokenizer = load_fast_tokenizer(self.model_path)
             
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
             
+            # Left padding keeps batched prompts flush against the generated tokens
+            self.tokenizer.padding_side = "left"
+            self.token_cache = TokenCache(self.tokenizer, PROMPT_MAX_TOKENS, self.token_cache_size)
+            
+            self.load_timings["tokenizer"] = time.perf_counter() - start
             logger.info("Loading GPT-2 model...")
+            start = time.perf_counter()
             
-            # Load model with memory optimizations
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_path,
-                torch_dtype=torch.float32,  # Use float32 for CPU compatibility
-                low_cpu_mem_usage=True
-            )
+            weights_file = find_weights_file(self.model_path) if self.mmap_weights else None
+            if weights_file is not None:
+                # Shared, read-mostly weights straight from the page cache
+                self.model = load_mmap_model(self.model_path, weights_file)
+                logger.info(f"Weights memory-mapped from {weights_file}")
+            else:
+                if self.mmap_weights:
+                    logger.warning(
+                        f"No safetensors weights in {self.model_path}, loading a private copy "
+                        f"(run: python mmap_weights.py {self.model_path})"
+                    )
+                # Load model with memory optimizations
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    self.model_path,
+                    torch_dtype=torch.float32,  # Use float32 for CPU compatibility
+                    low_cpu_mem_usage=True
+                )
             
-            logger.info("GPT-2 model loaded successfully!")
+            self._apply_dtype()
+            self.load_timings["weights"] = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            self.backend.install(self.model, self.tokenizer)
+            self.load_timings["backend"] = time.perf_counter() - start
+            
+            logger.info(f"GPT-2 model loaded successfully! (backend: {self.backend.name})")
             
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             raise e
     
-    def generate_response(self, prompt, mode="scholar", max_length=512, temperature=0.8):
+    def _apply_dtype(self):
+        """Convert the loaded weights to the configured precision"""
+        if self.dtype == "bf16":
+            # No copy if the weights file is already bfloat16
+            self.model = self.model.to(torch.bfloat16)
+        elif self.dtype == "int8":
+            # Dynamic int8: weights quantized once, activations per call
+            engines = torch.backends.quantized.supported_engines
+            if "fbgemm" in engines:
+                torch.backends.quantized.engine = "fbgemm"
+            elif "qnnpack" in engines:
+                torch.backends.quantized.engine = "qnnpack"
+            _conv1d_to_linear(self.model)
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.model.eval()
+        logger.info(f"Model precision: {self.dtype}")
+    
+    def _warm_prefix_cache(self):
+        """Precompute and pin the KV of the fixed prompt templates"""
+        if self.prefix_cache is None:
+            return
+        for prefix in TEMPLATE_PREFIXES:
+            input_ids = self.tokenizer(prefix, return_tensors="pt").input_ids
+            with torch.no_grad():
+                outputs = self.model(input_ids=input_ids, use_cache=True)
+            self.prefix_cache.insert(input_ids[0].tolist(), outputs.past_key_values, pinned=True)
+        logger.info(f"Prefix cache ready: {self.prefix_cache.stats()}")
+    
+    def enable_retrieval(self, index, top_k=4, max_context_tokens=384, max_passage_tokens=128,
+                         max_new_tokens=None, cache_size=4096):
+        """Ground every prompt on the best-matching passages of a VerseIndex"""
+        if max_new_tokens is not None:
+            # Grounded answers need fewer tokens to say the same thing
+            self.generation_config = dict(GENERATION_CONFIG, max_new_tokens=max_new_tokens)
+        
+        # Context + question (truncated at 100 tokens) + answer must fit the window
+        window = self.model.config.n_positions
+        available = window - 100 - self.generation_config["max_new_tokens"]
+        if max_context_tokens > available:
+            logger.warning(f"RAG context budget lowered from {max_context_tokens} to {available} tokens")
+            max_context_tokens = available
+        
+        self.context_packer = ContextPacker(
+            index,
+            self.tokenizer,
+            top_k=top_k,
+            max_context_tokens=max_context_tokens,
+            max_passage_tokens=max_passage_tokens,
+            cache_size=cache_size
+        )
+        logger.info(f"Retrieval enabled: top {top_k} passages, {max_context_tokens} context tokens")
+    
+    def enable_speculative(self, draft="ngram", num_tokens=4, max_ngram=3, corpus=None):
+        """Decode single prompts speculatively
+        
+        draft is "ngram" (n-gram lookup in the prompt and, given a VerseIndex
+        as corpus, in its English translations) or the path of a smaller
+        GPT-2 with the same tokenizer. Batches of more than one prompt still
+        use generate.
+        """
+        if draft == "ngram":
+            drafter = NgramDrafter(
+                max_ngram=max_ngram,
+                banned_ngram_size=self.generation_config["no_repeat_ngram_size"],
+                table=self._corpus_ngram_table(corpus) if corpus is not None else None
+            )
+        else:
+            draft_model = AutoModelForCausalLM.from_pretrained(draft, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+            if draft_model.config.vocab_size != self.model.config.vocab_size:
+                raise ValueError(
+                    f"Draft model vocabulary ({draft_model.config.vocab_size}) does not match "
+                    f"the main model ({self.model.config.vocab_size})"
+                )
+            drafter = DraftModelDrafter(draft_model.eval())
+        self.speculator = SpeculativeDecoder(self, drafter, num_tokens=num_tokens)
+        logger.info(f"Speculative decoding: {draft} drafts of up to {num_tokens} tokens")
+    
+    def _corpus_ngram_table(self, index):
+        """Next-token table of the index's English translations, for n-gram drafts"""
+        start = time.time()
+        if "et" not in index.kinds:
+            return None
+        passages = (index.passage_kind == index.kinds.index("et")).nonzero()[0]
+        texts = [index.passage(int(i))["text"] for i in passages]
+        table = build_ngram_table(self.tokenizer(texts).input_ids)
+        logger.info(f"N-gram draft table: {len(table)} token pairs from {len(texts)} passages in {time.time() - start:.1f}s")
+        return table
+    
+    def prepare_prompt(self, prompt, mode="scholar"):
+        """Build, ground and tokenize a prompt; safe to run ahead of generation"""
+        return self.prepare_prompts([prompt], mode)[0]
+    
+    def prepare_prompts(self, prompts, mode="scholar"):
+        """PreparedPrompts of several prompts, tokenized in one call (cached ids reused)"""
+        start = time.perf_counter()
+        system_prompts = [self._build_prompt(prompt, mode) for prompt in prompts]
+        token_ids = self.token_cache.encode_batch(system_prompts)
+        tokenize_time = time.perf_counter() - start
+        STAGE_SECONDS.labels("tokenize").observe(tokenize_time)
+        return [
+            self._ground(prompt, system_prompt, input_ids, tokenize_time)
+            for prompt, system_prompt, input_ids in zip(prompts, system_prompts, token_ids)
+        ]
+    
+    def _ground(self, prompt, system_prompt, input_ids, tokenize_time):
+        """Put the best-matching verse passages ahead of a tokenized prompt (RAG only)"""
+        if self.context_packer is None:
+            return PreparedPrompt(system_prompt, input_ids, tokenize_time=tokenize_time)
+        
+        start = time.perf_counter()
+        context_ids, verses = self.context_packer.pack(prompt)
+        STAGE_SECONDS.labels("retrieval").observe(time.perf_counter() - start)
+        if not context_ids:
+            return PreparedPrompt(system_prompt, input_ids, tokenize_time=tokenize_time)
+        input_ids = context_ids + input_ids
+        system_prompt = self.tokenizer.decode(input_ids, skip_special_tokens=True)
+        return PreparedPrompt(system_prompt, input_ids, [f"Bhagavad-Gītā {verse}" for verse in verses],
+                              tokenize_time)
+    
+    def resolve_prompt(self, prompt, mode="scholar"):
+        """PreparedPrompt for a raw prompt string, a PreparedPrompt, or a Future of one"""
+        return self.resolve_prompts([prompt], mode)[0]
+    
+    def resolve_prompts(self, prompts, mode="scholar"):
+        """resolve_prompt of each prompt, with the raw strings among them tokenized as one batch"""
+        resolved = [prompt.result() if isinstance(prompt, Future) else prompt for prompt in prompts]
+        raw = [i for i, prompt in enumerate(resolved) if not isinstance(prompt, PreparedPrompt)]
+        if raw:
+            for i, prepared in zip(raw, self.prepare_prompts([resolved[i] for i in raw], mode)):
+                resolved[i] = prepared
+        return resolved
+    
+    def make_sampling(self, profile="balanced", max_new_tokens=None, deadline=None):
+        """Sampling for a profile of this model's generation config (see sampling.PROFILES)"""
+        return Sampling(profile, resolve_config(self.generation_config, profile, max_new_tokens), deadline)
+    
+    def token_budget(self, config, prompt_length):
+        """max_new_tokens of config, capped so prompt and answer fit the context window"""
+        return max(1, min(config["max_new_tokens"], self.model.config.n_positions - prompt_length))
+    
+    def generate_response(self, prompt, mode="scholar", sampling=None):
         """Generate response using GPT-2"""
+        return self.generate_batch([prompt], mode=mode, samplings=[sampling])[0]
+    
+    def stream_response(self, prompt, mode="scholar", on_token=None, sampling=None):
+        """Generate a response, handing each token id to on_token as it is sampled"""
+        streamer = TokenCallbackStreamer(on_token) if on_token is not None else None
+        return self.generate_batch([prompt], mode=mode, streamer=streamer, samplings=[sampling])[0]
+    
+    def generate_batch(self, prompts, mode="scholar", streamer=None, samplings=None):
+        """Generate responses for several prompts of the same mode in one generate call
+        
+        prompts may be strings, PreparedPrompts or Futures of PreparedPrompts.
+        samplings, one per prompt, must share their config (Sampling.key) but
+        may have different deadlines; None means the balanced profile.
+        """
+        start_time = time.time()
+        samplings = [s if s is not None else self.make_sampling() for s in samplings or [None] * len(prompts)]
         try:
-            start_time = time.time()
-            
-            # Format prompt to encourage focused, direct responses
-            if mode == "child":
-                system_prompt = f"Explain in simple words for a child: {prompt}\n\nAnswer:"
-            else:
-                # More specific prompt format matching training data
-                if "verse" in prompt.lower() and any(char.isdigit() for char in prompt):
-                    system_prompt = f"Explain {prompt}\n\n"
-                elif "what is" in prompt.lower() or "what does" in prompt.lower():
-                    system_prompt = f"{prompt}\n\nAccording to Bhagavad Gita,"
-                else:
-                    system_prompt = f"{prompt}\n\n"
-            
-            # Tokenize input
-            inputs = self.tokenizer(
-                system_prompt, 
-                return_tensors="pt",
-                padding=True,
-                truncation=True,
-                max_length=100
-            )
+            prepared = self.resolve_prompts(prompts, mode)
+            PROMPT_TOKENS.inc(sum(len(p.input_ids) for p in prepared))
+            
+            if self.speculator is not None and len(prepared) == 1:
+                outputs = [self._generate_speculative(prepared[0].input_ids, streamer, samplings[0])]
+                generated = outputs[0][len(prepared[0].input_ids):]
+                TOKENS_GENERATED.inc(len(generated))
+                budget = self.token_budget(samplings[0].config, len(prepared[0].input_ids))
+                reasons = [finish_reason(generated, budget, self.tokenizer.eos_token_id)]
+                return self._finish_batch(prepared, outputs, mode, start_time, samplings, reasons)
+            
+            # Left-pad so every prompt ends where generation starts
+            length = max(len(p.input_ids) for p in prepared)
+            input_ids = torch.full((len(prepared), length), self.tokenizer.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(prepared), length), dtype=torch.long)
+            for row, p in enumerate(prepared):
+                input_ids[row, length - len(p.input_ids):] = torch.tensor(p.input_ids, dtype=torch.long)
+                attention_mask[row, length - len(p.input_ids):] = 1
+            
+            timer = StageTimer(streamer)
+            
+            # A single prompt can start from cached template/prompt KV;
+            # left-padded batches cannot share it
+            cache_kwargs = {}
+            if len(prepared) == 1:
+                past_key_values = self.prefill_prefix(input_ids)
+                if past_key_values is not None:
+                    cache_kwargs["past_key_values"] = past_key_values
+            
+            config = samplings[0].config
+            config = dict(config, max_new_tokens=self.token_budget(config, length))
+            deadlines = [s.deadline for s in samplings]
+            cutoff = None
+            if any(deadline is not None for deadline in deadlines):
+                cutoff = DeadlineLogitsProcessor(deadlines, self.tokenizer.eos_token_id, self.tokenizer.pad_token_id)
             
             # Generate response - OPTIMIZED for concise, focused answers
             with torch.no_grad():
                 outputs = self.model.generate(
-                    inputs.input_ids,
-                    attention_mask=inputs.attention_mask,
-                    max_new_tokens=150,       # Further reduced for conciseness
-                    min_new_tokens=20,        # Allow very brief answers
-                    temperature=0.6,          # Lower temp = more focused
-                    do_sample=True,
+                    input_ids,
+                    attention_mask=attention_mask,
                     pad_token_id=self.tokenizer.pad_token_id,
                     num_return_sequences=1,
-                    top_p=0.85,               # More focused sampling
-                    top_k=40,                 # More selective
-                    repetition_penalty=1.15,  # Slight repetition penalty
-                    no_repeat_ngram_size=3    # Prevent 3-word repetitions
+                    streamer=timer,
+                    logits_processor=LogitsProcessorList([cutoff]) if cutoff is not None else None,
+                    **cache_kwargs,
+                    **config
                 )
-            
-            # Decode response
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # Debug: Log the raw response before cleaning
-            logger.info(f"Raw response: {response[:200]}...")
-            
-            # Clean response
-            response = self._clean_response(response, system_prompt)
-            
-            # Debug: Log the cleaned response
-            logger.info(f"Cleaned response: {response[:200]}...")
-            
-            # Remove the original prompt from response if it's still there
-            if system_prompt in response:
-                response = response.replace(system_prompt, "").strip()
-            
-            # Remove common artifacts - order matters!
-            response = response.replace("? Assistant:", "")
-            response = response.replace("Assistant:", "")
-            response = response.replace("Answer:", "")
-            
-            # Remove leading "?" if present
-            response = response.lstrip("? ").strip()
-            
-            # Remove "Explain in" prefix if present
-            if response.startswith("Explain in"):
-                parts = response.split(":", 1)
-                response = parts[1] if len(parts) > 1 else response
-            
-            # Remove "in Bhagavad-Gītā" at the start if standalone
-            if response.startswith("in Bhagavad-Gītā"):
-                response = response[len("in Bhagavad-Gītā"):].strip()
-            
-            # Clean formatting artifacts
-            response = response.replace("READ MORE ›", "")
-            response = response.replace("Read More", "")
-            response = response.replace("READ MORE INV", "")
-            response = response.replace("‎ Appears in", "\n\nReference: Appears in")
-            response = response.replace("‑", "-")  # Replace special dash
-            
-            # Remove stray punctuation artifacts
-            response = response.replace(" - \n\n", "\n\n")
-            response = response.replace(":nd ", ": ")
-            
-            response = response.strip()
-            
-            # Clean up multiple dots
-            import re
-            response = re.sub(r'\.{3,}', '...', response)  # Replace 4+ dots with 3
-            
-            # Clean up spacing
-            response = re.sub(r'\n+', '\n\n', response)  # Multiple newlines to double
-            response = re.sub(r' +', ' ', response)  # Multiple spaces to single
-            
-            # Add proper structure for verses
-            response = re.sub(r'\bVerse (\d+)', r'\n\nVerse \1:', response)
-            response = re.sub(r'\bChapter (\d+)', r'\n\nChapter \1:', response)
-            
-            # Clean up Sanskrit formatting
-            response = re.sub(r'\|\|(\d+)\|\|', r'(Verse \1)', response)
-            
-            # Remove excessive punctuation
-            response = re.sub(r'[?.]{2,}', '.', response)
-            
-            # Smart truncation: Keep only coherent, complete sentences
-            sentences = [s.strip() for s in response.split('.') if s.strip()]
-            
-            # Remove very long rambling sentences (likely incoherent)
-            sentences = [s for s in sentences if len(s) < 300]
-            
-            # Keep only first 5-6 meaningful sentences for conciseness
-            if len(sentences) > 6:
-                sentences = sentences[:6]
-            
-            # Remove incomplete or very short sentences at the end
-            while sentences and len(sentences[-1]) < 20:
-                sentences.pop()
-            
-            # Reconstruct response
-            response = '. '.join(sentences)
-            if response and not response.endswith('.'):
-                response += '.'
-            
-            # Final cleanup
-            response = response.strip()
-            
-            # Extract citations
-            citations = self._extract_citations(response)
-            
-            return {
-                "response": response,
-                "citations": citations,
-                "audio_url": "",
-                "mode": mode,
-                "confidence": 0.8,
-                "generation_time": time.time() - start_time,
-                "model_used": "gpt2"
-            }
-            
+            # Finished rows are filled with padding up to the longest answer
+            TOKENS_GENERATED.inc(int((outputs[:, length:] != self.tokenizer.pad_token_id).sum()))
+            
+            reasons = []
+            for row in range(len(prepared)):
+                if cutoff is not None and row in cutoff.cut:
+                    reasons.append("deadline")
+                elif (outputs[row, length:] == self.tokenizer.eos_token_id).any():
+                    reasons.append("stop")
+                else:
+                    reasons.append("length")
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            return {
-                "response": "I'm working on understanding your question better. Could you please rephrase it?",
-                "citations": ["Bhagavad-Gītā (AI-generated)"],
-                "audio_url": "",
-                "mode": mode,
-                "confidence": 0.7,
-                "generation_time": time.time() - start_time,
-                "model_used": "gpt2"
-            }
-    
-    def _clean_response(self, response, original_prompt):
-        """Clean the generated response"""
-        if not response:
-            return "I'm working on understanding your question. Please try rephrasing it."
-        
-        response = response.strip()
-        
-        # Remove the original prompt from the response
-        if original_prompt in response:
-            response = response.replace(original_prompt, "").strip()
-        
-        # Keep the full response without aggressive sentence filtering
-        # The model generates dots as part of verse formatting
-        pass
+            return [self._fallback_response(mode, start_time) for _ in prompts]
+        
+        return self._finish_batch(prepared, outputs, mode, start_time, samplings, reasons)
+    
+    def _finish_batch(self, prepared, outputs, mode, start_time, samplings, reasons):
+        results = []
+        for p, output, sampling, reason in zip(prepared, outputs, samplings, reasons):
+            try:
+                results.append(self.finish_response(
+                    output, p.system_prompt, mode, start_time, p.citations,
+                    profile=sampling.profile, finish_reason=reason, tokenize_time=p.tokenize_time
+                ))
+            except Exception as e:
+                logger.error(f"Error generating response: {e}")
+                results.append(self._fallback_response(mode, start_time))
+        
+        return results
+    
+    def _generate_speculative(self, input_ids, streamer=None, sampling=None):
+        """Prompt + generated token ids from the speculative decoder, fed to streamer like generate does"""
+        if streamer is None:
+            return self.speculator.generate(input_ids, sampling=sampling)
+        streamer.put(torch.tensor([input_ids]))
+        token_ids = self.speculator.generate(
+            input_ids,
+            on_token=lambda token: streamer.put(torch.tensor([token])),
+            sampling=sampling
+        )
+        streamer.end()
+        return token_ids
+    
+    def prefill_prefix(self, input_ids):
+        """Past key values for all but the last prompt token, via the prefix cache
+        
+        Only the tokens after the longest cached prefix are run through the
+        model; the result is cached for later prompts. Returns None when the
+        prefix cache is disabled. The last token is left for the caller so
+        its forward pass yields the first logits.
+        """
+        if self.prefix_cache is None or input_ids.shape[1] < 2:
+            return None
+        
+        token_ids = input_ids[0, :-1].tolist()
+        matched, past_key_values = self.prefix_cache.lookup(token_ids)
+        CACHE_LOOKUPS.labels("prefix", "hit" if matched else "miss").inc()
+        if matched < len(token_ids):
+            with torch.no_grad():
+                outputs = self.model(
+                    input_ids=input_ids[:, matched:-1],
+                    past_key_values=past_key_values,
+                    use_cache=True
+                )
+            past_key_values = outputs.past_key_values
+            self.prefix_cache.insert(token_ids, past_key_values)
+        return past_key_values
+    
+    def finish_response(self, token_ids, system_prompt, mode, start_time, citations=None,
+                        profile=None, finish_reason=None, tokenize_time=None):
+        """Decode prompt + generated token ids into the final response dict
         
-        if response and not response.endswith(('.', '!', '?')):
-            response += '.'
+        citations, when the prompt was grounded, are the verses it used.
+        profile, finish_reason ("stop", "length" or "deadline") and
+        tokenize_time (PreparedPrompt.tokenize_time) are reported back as they are.
+        """
+        # Decode response (padding is a special token and drops out here)
+        start = time.perf_counter()
+        response = self.tokenizer.decode(token_ids, skip_special_tokens=True)
+        response = self._postprocess(response, system_prompt)
+        STAGE_SECONDS.labels("postprocess").observe(time.perf_counter() - start)
         
-        # Don't use fallback - return what the model actually generated
-        # if len(response) < 50:
-        #     return "The Bhagavad-Gita teaches us about righteous living, duty, and spiritual wisdom. It emphasizes the importance of following one's dharma (duty) while maintaining detachment from results."
+        # Extract citations
+        if not citations:
+            start = time.perf_counter()
+            citations = self._extract_citations(response)
+            STAGE_SECONDS.labels("citations").observe(time.perf_counter() - start)
+        
+        return {
+            "response": response,
+            "citations": citations,
+            "audio_url": "",
+            "mode": mode,
+            "confidence": 0.8,
+            "generation_time": time.time() - start_time,
+            "model_used": self.name,
+            "profile": profile,
+            "finish_reason": finish_reason,
+            "tokenize_time": tokenize_time
+        }
+    
+    def make_logits_processors(self, prompt_length, config=None):
+        """Logits processors and warpers for custom decode loops
+        
+        Mirrors what model.generate builds from the generation config (the
+        model's own unless config is given), in the same order, so
+        hand-written loops sample from the same distribution.
+        """
+        config = config or self.generation_config
+        processors = LogitsProcessorList([
+            RepetitionPenaltyLogitsProcessor(penalty=config["repetition_penalty"]),
+            NoRepeatNGramLogitsProcessor(config["no_repeat_ngram_size"]),
+            MinNewTokensLengthLogitsProcessor(
+                prompt_length, config["min_new_tokens"], self.tokenizer.eos_token_id
+            )
+        ])
+        warpers = LogitsProcessorList([
+            TemperatureLogitsWarper(config["temperature"]),
+            TopKLogitsWarper(top_k=config["top_k"]),
+            TopPLogitsWarper(top_p=config["top_p"])
+        ])
+        return processors, warpers
+    
+    def _build_prompt(self, prompt, mode):
+        """Format prompt to encourage focused, direct responses"""
+        if mode == "child":
+            return f"Explain in simple words for a child: {prompt}\n\nAnswer:"
+        
+        # More specific prompt format matching training data
+        if "verse" in prompt.lower() and any(char.isdigit() for char in prompt):
+            return f"Explain {prompt}\n\n"
+        elif "what is" in prompt.lower() or "what does" in prompt.lower():
+            return f"{prompt}\n\nAccording to Bhagavad Gita,"
+        else:
+            return f"{prompt}\n\n"
+    
+    def _postprocess(self, response, system_prompt):
+        """Turn decoded model output into the final answer text"""
+        # Debug: Log the raw response before cleaning
+        logger.info(f"Raw response: {response[:200]}...")
+        
+        response = postprocess_response(response, system_prompt)
+        
+        # Debug: Log the cleaned response
+        logger.info(f"Cleaned response: {response[:200]}...")
         
         return response
     
+    def _fallback_response(self, mode, start_time):
+        """Response returned when generation fails"""
+        FALLBACK_RESPONSES.inc()
+        return {
+            "response": FALLBACK_RESPONSE,
+            "citations": ["Bhagavad-Gītā (AI-generated)"],
+            "audio_url": "",
+            "mode": mode,
+            "confidence": 0.7,
+            "generation_time": time.time() - start_time,
+            "model_used": self.name
+        }
+    
     def _extract_citations(self, response):
         """Extract citations from response"""
         citations = []
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Model registry for the Sanatana Dharma LLM server
+Loaded checkpoints, the traffic split between them and zero-downtime swaps
+
+The models to serve are listed in a JSON file (MODEL_REGISTRY) that every
+uvicorn worker watches:
+
+    {"models": [
+        {"name": "clean-v1", "path": "models/gpt2-gita-clean", "weight": 0.9},
+        {"name": "clean-v2", "path": "models/checkpoint-93", "weight": 0.1}
+    ]}
+
+Edit it with this script, e.g. after training a checkpoint in the notebook:
+
+    python model_registry.py add clean-v2 models/checkpoint-93 --weight 0.1
+    python model_registry.py promote clean-v2
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class ModelSlot:
+    """One loaded checkpoint and the batcher in front of it
+
+    in_flight counts generations running on it. A retired slot takes no new
+    requests and is closed (batcher stopped, model released) once its last
+    generation finishes.
+    """
+
+    def __init__(self, name, path, model, scheduler=None):
+        self.name = name
+        self.path = path
+        self.model = model
+        self.scheduler = scheduler
+        self.state = "serving"   # serving -> draining -> closed
+        self.in_flight = 0
+        self.served = 0
+
+    def acquire(self):
+        self.in_flight += 1
+        self.served += 1
+
+    def release(self):
+        self.in_flight -= 1
+        if self.state == "draining" and self.in_flight <= 0:
+            self._close()
+
+    def retire(self):
+        if self.state != "serving":
+            return
+        self.state = "draining"
+        logger.info(f"Draining model {self.name} ({self.in_flight} generations in flight)")
+        if self.in_flight <= 0:
+            self._close()
+
+    def _close(self):
+        self.state = "closed"
+        if self.scheduler is not None:
+            self.scheduler.shutdown()
+        # Generations hold their own references, so this frees the weights
+        # and KV caches once the last one returns
+        self.model = None
+        self.scheduler = None
+        gc.collect()
+        logger.info(f"Released model {self.name}")
+
+    def stats(self):
+        model = self.model
+        return {
+            "path": self.path,
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "load_timings": {step: round(s, 3) for step, s in model.load_timings.items()} if model is not None else None
+        }
+
+
+class ModelRegistry:
+    """Serving slots and their traffic weights
+
+    Lives on the event loop. install() replaces the routing table in one
+    assignment, so every request is routed by either the old table or the
+    new one; slots left out of the new table drain and close.
+    """
+
+    def __init__(self, rng=None):
+        self._table = ()      # ((slot, weight), ...) of serving slots
+        self._draining = []
+        self._rng = rng or random.Random()
+
+    def __len__(self):
+        return len(self._table)
+
+    def slots(self):
+        """Serving slots, then those still draining"""
+        return [slot for slot, _ in self._table] + [s for s in self._draining if s.state == "draining"]
+
+    def get(self, name):
+        for slot, _ in self._table:
+            if slot.name == name:
+                return slot
+        return None
+
+    def primary(self):
+        """Slot with the largest share of traffic, or None before the first install"""
+        if not self._table:
+            return None
+        return max(self._table, key=lambda entry: entry[1])[0]
+
+    def route(self, name=None):
+        """Slot for a new request: the named one, or a weighted random pick
+
+        Returns None for an unknown name.
+        """
+        if name is not None:
+            return self.get(name)
+        table = self._table
+        total = sum(weight for _, weight in table)
+        if total <= 0:
+            return table[0][0] if table else None
+        point = self._rng.random() * total
+        for slot, weight in table:
+            point -= weight
+            if point < 0:
+                return slot
+        return table[-1][0]
+
+    def install(self, entries):
+        """Serve exactly entries, a list of (slot, weight); every other slot drains"""
+        keep = {id(slot) for slot, _ in entries}
+        retired = [slot for slot, _ in self._table if id(slot) not in keep]
+        self._table = tuple(entries)
+        for slot in retired:
+            slot.retire()
+            if slot.state == "draining":
+                self._draining.append(slot)
+        self._draining = [slot for slot in self._draining if slot.state == "draining"]
+        split = ", ".join(f"{slot.name} {weight:g}" for slot, weight in entries)
+        logger.info(f"Serving models: {split}")
+
+    def stats(self):
+        total = sum(weight for _, weight in self._table) or 1
+        models = {}
+        for slot, weight in self._table:
+            models[slot.name] = dict(slot.stats(), share=round(weight / total, 3))
+        return {
+            "models": models,
+            "draining": [dict(slot.stats(), name=slot.name) for slot in self._draining if slot.state == "draining"]
+        }
+
+
+def read_registry_file(path):
+    """Validated [{"name", "path", "weight"}] from a registry file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return validate_entries(json.load(f).get("models", []), path)
+
+
+def validate_entries(entries, path):
+    if not entries:
+        raise ValueError(f"{path} lists no models")
+
+    names = set()
+    for entry in entries:
+        if not entry.get("name") or not entry.get("path"):
+            raise ValueError(f"{path}: every model needs a name and a path")
+        if entry["name"] in names:
+            raise ValueError(f"{path}: model {entry['name']!r} is listed twice")
+        names.add(entry["name"])
+        entry["weight"] = float(entry.get("weight", 1.0))
+        if entry["weight"] < 0:
+            raise ValueError(f"{path}: weight of {entry['name']!r} is negative")
+    if sum(entry["weight"] for entry in entries) <= 0:
+        raise ValueError(f"{path}: at least one model needs a positive weight")
+    return entries
+
+
+def write_registry_file(path, entries):
+    """Replace the registry file atomically, so workers never read half of it"""
+    validate_entries(entries, path)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".registry-", suffix=".json")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({"models": entries}, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Edit the model registry watched by the server")
+    parser.add_argument("--file", default=os.getenv("MODEL_REGISTRY") or "models/registry.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("show")
+    add = commands.add_parser("add", help="load another model next to the current ones")
+    add.add_argument("name")
+    add.add_argument("path")
+    add.add_argument("--weight", type=float, default=0.0, help="share of traffic (default 0: loaded, not routed)")
+    weight = commands.add_parser("weight", help="change a model's share of traffic")
+    weight.add_argument("name")
+    weight.add_argument("weight", type=float)
+    promote = commands.add_parser("promote", help="serve only this model")
+    promote.add_argument("name")
+    remove = commands.add_parser("remove", help="stop serving a model")
+    remove.add_argument("name")
+    args = parser.parse_args()
+
+    entries = read_registry_file(args.file) if os.path.exists(args.file) else []
+    by_name = {entry["name"]: entry for entry in entries}
+    if args.command != "show" and args.command != "add" and args.name not in by_name:
+        parser.error(f"no model named {args.name!r} in {args.file}")
+
+    if args.command == "add":
+        if args.name in by_name:
+            parser.error(f"{args.name!r} is already in {args.file}")
+        entries.append({"name": args.name, "path": args.path, "weight": args.weight})
+    elif args.command == "weight":
+        by_name[args.name]["weight"] = args.weight
+    elif args.command == "promote":
+        entries = [dict(by_name[args.name], weight=1.0)]
+    elif args.command == "remove":
+        entries = [entry for entry in entries if entry["name"] != args.name]
+
+    if args.command != "show":
+        try:
+            write_registry_file(args.file, entries)
+        except ValueError as e:
+            parser.error(str(e))
+    for entry in entries:
+        print(f"{entry['name']:<24} {entry['weight']:>6g}  {entry['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Response post-processing for the Sanatana Dharma LLM server
+Turns decoded GPT-2 output into the final answer text with rules compiled once at import
+"""
+
+import re
+
+# Chat artifacts the model copies from its training data - order matters!
+ARTIFACT_RULES = [
+    ("? Assistant:", ""),
+    ("Assistant:", ""),
+    ("Answer:", ""),
+]
+
+# Formatting artifacts and stray punctuation, applied after the prefix clean-up
+FORMAT_RULES = [
+    ("READ MORE ›", ""),
+    ("Read More", ""),
+    ("READ MORE INV", ""),
+    ("\u200e Appears in", "\n\nReference: Appears in"),
+    ("‑", "-"),  # Replace special dash
+    (" - \n\n", "\n\n"),
+    (":nd ", ": "),
+]
+
+# Rules that are safe to apply to partial text while streaming
+STREAM_RULES = ARTIFACT_RULES + [
+    ("READ MORE ›", ""),
+    ("Read More", ""),
+    ("READ MORE INV", ""),
+    ("‑", "-"),
+]
+
+# Spacing and verse structure. Each pattern starts with a literal so the
+# regex engine can skip ahead, and only runs if its trigger text is present.
+# The original chain also squeezed 4+ dots to "..." first, which the final
+# [?.]{2,} rule makes redundant.
+_NEWLINES = re.compile(r'\n+')
+_SPACES = re.compile(r'  +')
+_VERSE = re.compile(r'Verse (\d+)')
+_CHAPTER = re.compile(r'Chapter (\d+)')
+_SANSKRIT = re.compile(r'\|\|(\d+)\|\|')
+_PUNCTUATION = re.compile(r'[?.]{2,}')
+
+MAX_SENTENCES = 6           # Keep only first 5-6 meaningful sentences for conciseness
+MAX_SENTENCE_LENGTH = 300   # Longer ones are likely incoherent rambling
+MIN_LAST_SENTENCE = 20      # Shorter trailing sentences are likely cut off
+
+EMPTY_RESPONSE = "I'm working on understanding your question. Please try rephrasing it."
+
+# Returned when generation fails; never cached
+FALLBACK_RESPONSE = "I'm working on understanding your question better. Could you please rephrase it?"
+
+
+class LiteralStage:
+    """Ordered literal replacements, same result as chained str.replace calls
+
+    Each rule costs one substring check when its text is absent, which is
+    the common case. (A merged regex alternation looks cheaper but is
+    slower than these C-level scans in CPython's re.)
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.max_length = max(len(old) for old, _ in self.rules)
+
+    def apply(self, text):
+        for old, new in self.rules:
+            if old in text:
+                text = text.replace(old, new)
+        return text
+
+    def partial_match_length(self, text):
+        """Length of the longest suffix of text that could still become a match"""
+        for size in range(min(self.max_length - 1, len(text)), 0, -1):
+            tail = text[-size:]
+            if any(old.startswith(tail) for old, _ in self.rules):
+                return size
+        return 0
+
+
+ARTIFACTS = LiteralStage(ARTIFACT_RULES)
+FORMATTING = LiteralStage(FORMAT_RULES)
+
+
+def _heading(template):
+    # Substitute only at a word boundary, like \bVerse; a leading \b would
+    # stop the regex engine from scanning for the literal
+    def substitute(match):
+        start = match.start()
+        if start and (match.string[start - 1].isalnum() or match.string[start - 1] == "_"):
+            return match.group(0)
+        return template.format(match.group(1))
+    return substitute
+
+
+_verse_heading = _heading("\n\nVerse {}:")
+_chapter_heading = _heading("\n\nChapter {}:")
+
+
+def layout(text):
+    """Normalize spacing and give verse and chapter references their own lines"""
+    if "\n" in text:
+        text = _NEWLINES.sub("\n\n", text)  # Multiple newlines to double
+    if "  " in text:
+        text = _SPACES.sub(" ", text)  # Multiple spaces to single
+    if "Verse " in text:
+        text = _VERSE.sub(_verse_heading, text)
+    if "Chapter " in text:
+        text = _CHAPTER.sub(_chapter_heading, text)
+    if "||" in text:
+        text = _SANSKRIT.sub(r"(Verse \1)", text)  # Sanskrit verse markers
+    if ".." in text or "?." in text or ".?" in text or "??" in text:
+        text = _PUNCTUATION.sub(".", text)  # Remove excessive punctuation
+    return text
+
+
+def truncate_sentences(text):
+    """Keep the first few complete sentences, in a single scan that stops early"""
+    sentences = []
+    start = 0
+    while len(sentences) < MAX_SENTENCES:
+        end = text.find(".", start)
+        sentence = (text[start:] if end < 0 else text[start:end]).strip()
+        if sentence and len(sentence) < MAX_SENTENCE_LENGTH:
+            sentences.append(sentence)
+        if end < 0:
+            break
+        start = end + 1
+
+    # Remove incomplete or very short sentences at the end
+    while sentences and len(sentences[-1]) < MIN_LAST_SENTENCE:
+        sentences.pop()
+
+    response = ". ".join(sentences)
+    if response and not response.endswith("."):
+        response += "."
+    return response
+
+
+def postprocess_response(response, system_prompt):
+    """Clean decoded model output (prompt included) into the final answer"""
+    if not response:
+        response = EMPTY_RESPONSE
+    else:
+        response = response.strip()
+        # Remove the original prompt from the response
+        if system_prompt in response:
+            response = response.replace(system_prompt, "").strip()
+        if response and not response.endswith((".", "!", "?")):
+            response += "."
+
+    # Removing the prompt can join text into another copy of it
+    if system_prompt in response:
+        response = response.replace(system_prompt, "").strip()
+
+    response = ARTIFACTS.apply(response)
+
+    # Remove leading "?" if present
+    response = response.lstrip("? ").strip()
+
+    # Remove "Explain in" prefix if present
+    if response.startswith("Explain in"):
+        parts = response.split(":", 1)
+        response = parts[1] if len(parts) > 1 else response
+
+    # Remove "in Bhagavad-Gītā" at the start if standalone
+    if response.startswith("in Bhagavad-Gītā"):
+        response = response[len("in Bhagavad-Gītā"):].strip()
+
+    response = FORMATTING.apply(response).strip()
+    response = layout(response)
+    return truncate_sentences(response)
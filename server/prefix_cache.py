@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Prompt-prefix KV cache for the Sanatana Dharma LLM server
+Reuses past_key_values of previously seen token prefixes so only new tokens are prefilled
+"""
+
+import collections
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Node:
+    """Trie node; entry is any cached sequence whose tokens pass through here"""
+
+    __slots__ = ("children", "entry")
+
+    def __init__(self, entry=None):
+        self.children = {}
+        self.entry = entry
+
+
+class _Entry:
+    """KV cache of one token sequence"""
+
+    __slots__ = ("key", "token_ids", "past_key_values", "nbytes", "pinned")
+
+    def __init__(self, key, token_ids, past_key_values, pinned):
+        self.key = key
+        self.token_ids = token_ids
+        self.past_key_values = past_key_values
+        self.nbytes = sum(
+            k.numel() * k.element_size() + v.numel() * v.element_size()
+            for k, v in past_key_values
+        )
+        self.pinned = pinned
+
+
+class PrefixCache:
+    """LRU-bounded token trie of past_key_values
+
+    lookup() finds the longest cached prefix of a prompt and returns its
+    past_key_values sliced to that length, so any prefix of a cached prompt
+    is reusable (e.g. the child template shared by every child-mode request).
+    Memory is accounted in bytes of KV tensors; least recently used entries
+    are evicted once max_bytes is exceeded. Pinned entries (the fixed
+    templates) are never evicted.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.hit_tokens = 0
+
+        self._root = _Node()
+        self._entries = collections.OrderedDict()   # key -> _Entry, least recently used first
+        self._by_tokens = {}                         # tuple(token_ids) -> _Entry
+        self._keys = itertools.count()
+        self._lock = threading.Lock()
+
+    def lookup(self, token_ids):
+        """Return (matched_length, past_key_values) for the longest cached prefix
+
+        past_key_values is None when nothing matches. The returned tensors are
+        views of the cached ones; callers must not modify them in place.
+        """
+        with self._lock:
+            node, matched = self._root, 0
+            for token in token_ids:
+                child = node.children.get(token)
+                if child is None:
+                    break
+                node, matched = child, matched + 1
+
+            if matched == 0:
+                self.misses += 1
+                return 0, None
+
+            entry = node.entry
+            self._entries.move_to_end(entry.key)
+            self.hits += 1
+            self.hit_tokens += matched
+
+        past_key_values = tuple(
+            (k[:, :, :matched], v[:, :, :matched]) for k, v in entry.past_key_values
+        )
+        return matched, past_key_values
+
+    def insert(self, token_ids, past_key_values, pinned=False):
+        """Cache the KV of token_ids (batch of one, covering exactly these tokens)"""
+        token_ids = list(token_ids)
+        if not token_ids:
+            return
+
+        with self._lock:
+            # Replace an identical sequence rather than storing it twice
+            existing = self._by_tokens.get(tuple(token_ids))
+            if existing is not None:
+                pinned = pinned or existing.pinned
+                self._remove(existing)
+
+            entry = _Entry(next(self._keys), token_ids, past_key_values, pinned)
+            if entry.nbytes > self.max_bytes and not pinned:
+                return
+
+            node = self._root
+            for token in token_ids:
+                child = node.children.get(token)
+                if child is None:
+                    child = node.children[token] = _Node()
+                # Newest entry serves lookups along its whole path
+                child.entry = entry
+                node = child
+
+            self._entries[entry.key] = entry
+            self._by_tokens[tuple(token_ids)] = entry
+            self.nbytes += entry.nbytes
+            self._evict()
+
+    def stats(self):
+        """Size and hit counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_tokens": self.hit_tokens
+            }
+
+    def _evict(self):
+        for entry in list(self._entries.values()):
+            if self.nbytes <= self.max_bytes:
+                break
+            if not entry.pinned:
+                self._remove(entry)
+
+    def _remove(self, entry):
+        del self._entries[entry.key]
+        del self._by_tokens[tuple(entry.token_ids)]
+        self.nbytes -= entry.nbytes
+
+        # Walk the entry's path; nodes it owned are handed to an entry that
+        # ends there or passes through, or dropped if there is none
+        path = [self._root]
+        for token in entry.token_ids:
+            path.append(path[-1].children[token])
+
+        for depth in range(len(path) - 1, 0, -1):
+            node = path[depth]
+            if node.entry is not entry:
+                continue
+            if node.children:
+                node.entry = next(iter(node.children.values())).entry
+            elif tuple(entry.token_ids[:depth]) in self._by_tokens:
+                node.entry = self._by_tokens[tuple(entry.token_ids[:depth])]
+            else:
+                del path[depth - 1].children[entry.token_ids[depth - 1]]
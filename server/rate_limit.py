@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Per-client rate limiting for the Sanatana Dharma LLM server
+A token bucket per client, refilled at RATE_LIMIT requests per minute
+"""
+
+import time
+
+
+class RateLimitedError(Exception):
+    """Raised when a client has used up its request budget"""
+
+    def __init__(self, retry_after):
+        super().__init__("Rate limit exceeded")
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Allows each client per_minute requests a minute, in bursts of up to burst
+
+    Lives on the event loop. Buckets that have refilled completely carry no
+    state and are dropped, so idle clients cost nothing.
+    """
+
+    def __init__(self, per_minute, burst=10, max_clients=100000):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets = {}   # client -> (tokens, time.monotonic() of the last update)
+
+    def check(self, client):
+        """Take one request from client's bucket, or raise RateLimitedError"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.limited += 1
+            self._buckets[client] = (tokens, now)
+            raise RateLimitedError(max(1, int((1 - tokens) / self.rate + 0.999)))
+        self._buckets[client] = (tokens - 1, now)
+        if len(self._buckets) > self.max_clients:
+            self._prune(now)
+
+    def stats(self):
+        return {"per_minute": round(self.rate * 60), "burst": self.burst,
+                "clients": len(self._buckets), "limited": self.limited}
+
+    def _prune(self, now):
+        full_after = self.burst / self.rate
+        self._buckets = {
+            client: (tokens, updated) for client, (tokens, updated) in self._buckets.items()
+            if now - updated < full_after
+        }
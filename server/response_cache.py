@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Response cache for the Sanatana Dharma LLM server
+Answers repeated questions without running GPT-2 again
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message):
+    """Lowercase, drop punctuation and collapse whitespace
+
+    "What is Dharma?" and "what is dharma" map to the same text.
+    """
+    text = _PUNCTUATION.sub(" ", message.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _features(text):
+    # Word unigrams and bigrams as a sparse count vector
+    words = text.split()
+    features = collections.Counter(words)
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return features
+
+
+def similarity(a, b):
+    """Cosine similarity of two normalized messages over word uni/bigrams"""
+    fa, fb = _features(a), _features(b)
+    if not fa or not fb:
+        return 0.0
+    dot = sum(count * fb[feature] for feature, count in fa.items())
+    norm = math.sqrt(sum(c * c for c in fa.values())) * math.sqrt(sum(c * c for c in fb.values()))
+    return dot / norm
+
+
+class MemoryBackend:
+    """In-process LRU store with per-entry expiry"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._items = collections.OrderedDict()   # key -> (expires_at, namespace, message, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[3]
+
+    def set(self, key, namespace, message, value, ttl):
+        with self._lock:
+            self._items[key] = (time.time() + ttl, namespace, message, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def messages(self, namespace, limit):
+        """Most recently used (key, message) pairs of a namespace"""
+        now = time.time()
+        with self._lock:
+            found = []
+            for key, (expires_at, item_namespace, message, _) in reversed(self._items.items()):
+                if item_namespace == namespace and expires_at >= now:
+                    found.append((key, message))
+                    if len(found) >= limit:
+                        break
+            return found
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SqliteBackend:
+    """Store in a local SQLite file, shared by every uvicorn worker on the host
+
+    Blocking (lock waits across workers); call it off the event loop.
+    Expired and least recently used rows are evicted in batches, only once
+    the table grows past max_entries.
+    """
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        # Eviction trims to this, so the next one is a tenth of the cap away
+        self.low_water = max(0, max_entries - max(1, max_entries // 10))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._rows = None   # rows at the last count plus those inserted here since
+        self._lock = threading.Lock()
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, namespace TEXT, message TEXT, value TEXT,"
+                " expires_at REAL, last_used REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (namespace, last_used)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def _connection(self):
+        # One connection per thread; WAL lets readers and a writer work concurrently
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        db = self._connection()
+        now = time.time()
+        row = db.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, namespace, message, value, ttl):
+        db = self._connection()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (key, namespace, message, json.dumps(value, ensure_ascii=False), now + ttl, now)
+        )
+        with self._lock:
+            if self._rows is not None:
+                self._rows += 1
+                if self._rows <= self.max_entries:
+                    return
+            # Other workers insert too, so a recount decides whether to evict
+            self._rows = len(self)
+            if self._rows <= self.max_entries:
+                return
+            db.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.low_water,)
+            )
+            self._rows = len(self)
+
+    def messages(self, namespace, limit):
+        return self._connection().execute(
+            "SELECT key, message FROM responses WHERE namespace = ? AND expires_at >= ?"
+            " ORDER BY last_used DESC LIMIT ?",
+            (namespace, time.time(), limit)
+        ).fetchall()
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """Exact and near-duplicate response cache keyed on (message, mode, sampling params)
+
+    Messages are normalized before lookup. With similarity_threshold > 0 a
+    miss falls back to the most similar recently used question of the same
+    mode and sampling params, if it scores at least the threshold.
+    """
+
+    def __init__(self, backend, ttl=3600, similarity_threshold=0.0, similarity_candidates=256):
+        self.backend = backend
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.similarity_candidates = similarity_candidates
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def get(self, message, mode, params):
+        """Cached response dict for this request, or None"""
+        namespace = self._namespace(mode, params)
+        normalized = normalize_message(message)
+
+        value = self.backend.get(self._key(namespace, normalized))
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.similarity_threshold > 0:
+            best_key, best_score = None, self.similarity_threshold
+            for key, candidate in self.backend.messages(namespace, self.similarity_candidates):
+                score = similarity(normalized, candidate)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is not None:
+                value = self.backend.get(best_key)
+                if value is not None:
+                    self.near_hits += 1
+                    return value
+
+        self.misses += 1
+        return None
+
+    def set(self, message, mode, params, response):
+        namespace = self._namespace(mode, params)
+        normalized = normalize_message(message)
+        self.backend.set(self._key(namespace, normalized), namespace, normalized, response, self.ttl)
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0
+        }
+
+    def _namespace(self, mode, params):
+        params_hash = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        return f"{mode}:{params_hash}"
+
+    def _key(self, namespace, normalized):
+        return hashlib.sha1(f"{namespace}\n{normalized}".encode("utf-8")).hexdigest()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Sampling profiles for the Sanatana Dharma LLM server
+Named trade-offs between answer length and latency that each request can pick
+"""
+
+import time
+
+# Overrides of the model's generation config; "balanced" is the config as loaded
+# (RAG_MAX_NEW_TOKENS included), so it answers exactly like requests without a profile
+PROFILES = {
+    "fast": {"max_new_tokens": 48, "min_new_tokens": 8},         # short answers for latency-bound clients
+    "balanced": {},
+    "thorough": {"max_new_tokens": 320, "min_new_tokens": 60}    # long-form scholar answers
+}
+
+# Why a generation ended: EOS, token budget, or wall-clock deadline (partial answer)
+FINISH_REASONS = ("stop", "length", "deadline")
+
+
+def resolve_config(base_config, profile, max_new_tokens=None):
+    """Generation config for a profile, with an explicit token budget taking precedence"""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown sampling profile {profile!r}, expected one of {', '.join(PROFILES)}")
+    config = dict(base_config, **PROFILES[profile])
+    if max_new_tokens is not None:
+        config["max_new_tokens"] = max_new_tokens
+    config["min_new_tokens"] = min(config["min_new_tokens"], config["max_new_tokens"])
+    return config
+
+
+class Sampling:
+    """Generation settings of one request: profile name, resolved config and deadline
+
+    deadline is a time.monotonic() value, or None. Decoders stop once it
+    passes and return what they have generated so far.
+    """
+
+    __slots__ = ("profile", "config", "deadline")
+
+    def __init__(self, profile, config, deadline=None):
+        self.profile = profile
+        self.config = config
+        self.deadline = deadline
+
+    @property
+    def key(self):
+        """Hashable form of config; requests with equal keys can share a generate call"""
+        return tuple(sorted(self.config.items()))
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+
+def finish_reason(generated, max_new_tokens, eos_token_id):
+    """Why a decode loop that checks the deadline between tokens stopped, from its generated ids"""
+    if generated and generated[-1] == eos_token_id:
+        return "stop"
+    if len(generated) >= max_new_tokens:
+        return "length"
+    return "deadline"
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Runtime settings for the Sanatana Dharma LLM server
+Values come from the environment (or config.env, see config.env.example)
+"""
+
+import os
+from dotenv import load_dotenv
+
+# Load config.env if present; real environment variables take precedence
+load_dotenv("config.env", override=False)
+
+
+def _int(name, default):
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+def _bool(name, default):
+    value = os.getenv(name, "").strip().lower()
+    return value in ("1", "true", "yes", "on") if value else default
+
+
+def _float(name, default):
+    value = os.getenv(name, "").strip()
+    return float(value) if value else default
+
+
+# Model
+MODEL_PATH = os.getenv("MODEL_PATH", "models/gpt2-gita-clean")
+MODEL_DEVICE = os.getenv("MODEL_DEVICE", "cpu")
+# Memory-map safetensors weights so all uvicorn workers share one copy
+MODEL_MMAP = _bool("MODEL_MMAP", False)
+# Weight precision: fp32, bf16 (half the memory) or int8 (dynamic quantization)
+MODEL_DTYPE = os.getenv("MODEL_DTYPE", "fp32").lower()
+# Forward pass: eager (PyTorch) or torchscript (decoder traced at load, less per-token overhead)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "eager").lower()
+# Token ids of recent prompts (template + question) kept to skip re-tokenizing (0 = off)
+TOKEN_CACHE_SIZE = _int("TOKEN_CACHE_SIZE", 4096)
+# Memory budget for cached prompt-prefix KV tensors (0 = off)
+PREFIX_CACHE_MB = _int("PREFIX_CACHE_MB", 64)
+# Run the example prompts through the model before reporting ready
+WARMUP = _bool("WARMUP", True)
+# JSON file listing the models to serve and their traffic weights (see
+# model_registry.py); edits are loaded, warmed up and swapped in while
+# serving. Empty = serve MODEL_PATH only
+MODEL_REGISTRY = os.getenv("MODEL_REGISTRY", "").strip()
+MODEL_REGISTRY_POLL = _float("MODEL_REGISTRY_POLL", 5.0)   # seconds between checks for edits
+
+# Speculative decoding of single prompts: "" (off), "ngram" or a draft model path
+SPECULATIVE_DRAFT = os.getenv("SPECULATIVE_DRAFT", "").strip()
+SPECULATIVE_TOKENS = _int("SPECULATIVE_TOKENS", 4)   # draft tokens verified per forward pass
+SPECULATIVE_NGRAM = _int("SPECULATIVE_NGRAM", 3)     # longest n-gram looked up for "ngram" drafts
+
+# Sampling profiles (sampling.PROFILES): used when a request names none
+DEFAULT_PROFILE = os.getenv("DEFAULT_PROFILE", "balanced").lower()
+# Upper bound on a request's explicit max_new_tokens
+MAX_NEW_TOKENS = _int("MAX_NEW_TOKENS", 400)
+
+# Verse index built by verse_index.py; lookups and retrieval are off without it
+VERSE_INDEX_PATH = os.getenv("VERSE_INDEX_PATH", "indexes/gita")
+# Answer verse/chapter references ("2.47", "chapter 12 summary") verbatim, without the model
+VERSE_LOOKUP = _bool("VERSE_LOOKUP", True)
+
+# Retrieval-augmented generation over the verse index
+RAG = _bool("RAG", False)
+RAG_TOP_K = _int("RAG_TOP_K", 4)                          # passages packed into each prompt
+RAG_CONTEXT_TOKENS = _int("RAG_CONTEXT_TOKENS", 384)      # token budget for all passages
+RAG_PASSAGE_TOKENS = _int("RAG_PASSAGE_TOKENS", 128)      # longest single passage
+RAG_MAX_NEW_TOKENS = _int("RAG_MAX_NEW_TOKENS", 100)      # grounded answers are shorter
+RAG_TOKEN_CACHE_SIZE = _int("RAG_TOKEN_CACHE_SIZE", 4096)  # pre-tokenized passages kept
+
+# Inference worker pool
+MAX_WORKERS = _int("MAX_WORKERS", 4)           # concurrent generations per process
+MAX_QUEUE = _int("MAX_QUEUE", 16)              # requests allowed to wait for a worker, per lane
+TIMEOUT = _float("TIMEOUT", 60.0)              # seconds per request, queueing included
+# Priority lanes, highest first: name:weight[:max_share]. Free workers go to
+# waiting lanes in proportion to weight; a lane holds at most max_share of
+# them. Streamed and child-mode requests are interactive, other /chat bulk
+LANES = os.getenv("LANES", "interactive:4,bulk:1:0.75")
+# API keys (X-API-Key header) pinned to a lane: "key1:bulk,key2:interactive"
+API_KEY_LANES = os.getenv("API_KEY_LANES", "")
+# Further API keys that identify a client for RATE_LIMIT and fair queuing;
+# requests with any other key are treated as keyless
+API_KEYS = os.getenv("API_KEYS", "")
+# Addresses or networks of the reverse proxies whose X-Real-IP header names
+# the caller; any other peer is identified by its own address
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1")
+# Chat requests per minute per client (known API key, else IP), per uvicorn worker; 0 = off
+RATE_LIMIT = _int("RATE_LIMIT", 0)
+RATE_LIMIT_BURST = _int("RATE_LIMIT_BURST", 10)   # requests a client may send at once
+# torch intra-op threads per inference worker (0 = split the CPU cores evenly)
+INTRA_OP_THREADS = _int("INTRA_OP_THREADS", 0)
+
+# Batching of concurrent /chat requests (BATCH_MAX_SIZE=1 turns it off)
+#   static:     requests arriving within BATCH_MAX_WAIT_MS share one generate call
+#   continuous: one decode loop; sequences join and leave between decode steps
+BATCHING = os.getenv("BATCHING", "static").lower()
+BATCH_MAX_SIZE = _int("BATCH_MAX_SIZE", 8)
+BATCH_MAX_WAIT_MS = _int("BATCH_MAX_WAIT_MS", 20)
+
+# Response cache in front of the model
+#   memory: per-process LRU; sqlite: file shared by all uvicorn workers; off
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "memory").lower()
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "cache/responses.sqlite3")
+RESPONSE_CACHE_SIZE = _int("RESPONSE_CACHE_SIZE", 1024)     # entries
+RESPONSE_CACHE_TTL = _int("RESPONSE_CACHE_TTL", 3600)       # seconds
+# Near-duplicate matching: minimum similarity (0-1) to reuse another question's answer; 0 = exact only
+RESPONSE_CACHE_SIMILARITY = _float("RESPONSE_CACHE_SIMILARITY", 0.0)
+# Identical questions (same mode, same normalized text) asked while one is
+# being generated share that generation; requests with "fresh": true never do
+COALESCE = _bool("COALESCE", True)
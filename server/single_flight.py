@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Request coalescing for the Sanatana Dharma LLM server
+Identical questions asked while one is being answered share that single generation
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One in-flight generation and the requests attached to it
+
+    result resolves to the response dict (or the generation's exception).
+    A streaming flight also records every SSE event it publishes, so
+    requests that attach late replay the tokens they missed.
+    Lives on the event loop; publish from other threads with
+    loop.call_soon_threadsafe.
+    """
+
+    def __init__(self, key, streaming):
+        self.key = key
+        self.streaming = streaming
+        self.result = asyncio.get_running_loop().create_future()
+        # Every waiter may have left before a failure lands; don't warn about it
+        self.result.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.task = None          # the generation, cancelled once nobody is attached
+        self.participants = 0
+        self._events = []         # (event, data) published so far
+        self._queues = []
+        self._registry = None
+
+    def publish(self, event, data):
+        self._events.append((event, data))
+        for queue in self._queues:
+            queue.put_nowait((event, data))
+
+    def subscribe(self):
+        """Queue receiving every event of this flight, from the first one on"""
+        queue = asyncio.Queue()
+        for item in self._events:
+            queue.put_nowait(item)
+        self._queues.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        if queue in self._queues:
+            self._queues.remove(queue)
+
+    def attach(self):
+        self.participants += 1
+
+    def detach(self):
+        """Drop one participant; the last one to leave cancels an unfinished generation"""
+        self.participants -= 1
+        if self.participants <= 0 and self.task is not None and not self.task.done():
+            # Nobody can join a flight that is being abandoned
+            if self._registry is not None:
+                self._registry.finish(self)
+            self.task.cancel()
+
+
+class SingleFlight:
+    """In-flight generations by request key
+
+    A request whose key matches a running flight attaches to it instead of
+    starting a generation of its own. A flight leaves the registry when it
+    finishes, after its answer has been stored in the response cache, so
+    later requests are served from there.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key):
+        """Running flight for key (attached), or None"""
+        flight = self._flights.get(key) if key is not None else None
+        if flight is not None:
+            flight.attach()
+            self.joined += 1
+        return flight
+
+    def start(self, key, streaming):
+        """New flight (attached); registered under key unless key is None"""
+        flight = Flight(key, streaming)
+        flight.attach()
+        if key is not None:
+            flight._registry = self
+            self._flights[key] = flight
+        self.started += 1
+        return flight
+
+    def finish(self, flight):
+        if flight.key is not None and self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.joined
+        }
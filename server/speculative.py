@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Speculative decoding for the Sanatana Dharma LLM server
+A cheap drafter proposes several tokens and GPT-2 verifies them in one forward pass
+"""
+
+import collections
+import logging
+import threading
+import time
+
+import torch
+
+from metrics import SPECULATIVE_TOKENS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class NgramDrafter:
+    """Drafts by n-gram lookup, in the prompt and in the verse corpus, without a model call
+
+    Prompt lookup copies what followed the latest earlier occurrence of the
+    context's last tokens (the retrieved passages when RAG is on). The
+    corpus table gives the most frequent token after each token pair of the
+    verse translations. GENERATION_CONFIG bans repeating any 3-gram
+    (no_repeat_ngram_size), prompt included, and a banned token is always
+    rejected; so drafts stop before the first token that would repeat
+    an n-gram of that size.
+    """
+
+    def __init__(self, max_ngram=3, banned_ngram_size=0, table=None):
+        self.max_ngram = max(1, max_ngram)
+        self.banned_ngram_size = banned_ngram_size
+        self.table = table or {}   # (token, token) -> most frequent next token
+
+    def session(self):
+        return _NgramSession(self)
+
+
+class _NgramSession:
+    """N-gram drafter state for one sequence: the n-grams it may not repeat"""
+
+    def __init__(self, drafter):
+        self.drafter = drafter
+        self.size = drafter.banned_ngram_size
+        self._seen = set()
+        self._indexed = 0   # tokens whose n-grams are in _seen
+
+    def propose(self, token_ids, num_tokens, processors=None, warpers=None):
+        """Return (draft token ids, None); deterministic drafts have no distribution"""
+        if self.size:
+            for end in range(max(self._indexed, self.size), len(token_ids) + 1):
+                self._seen.add(tuple(token_ids[end - self.size:end]))
+            self._indexed = len(token_ids)
+
+        copied = self._allowed(token_ids, self._prompt_lookup(token_ids, num_tokens))
+        if len(copied) < num_tokens and self.drafter.table:
+            predicted = self._allowed(token_ids, self._corpus_lookup(token_ids, num_tokens))
+            if len(predicted) > len(copied):
+                return predicted, None
+        return copied, None
+
+    def _prompt_lookup(self, token_ids, num_tokens):
+        length = len(token_ids)
+        for n in range(min(self.drafter.max_ngram, length - 1), 0, -1):
+            suffix = token_ids[-n:]
+            # Latest match first, skipping the suffix itself
+            for start in range(length - n - 1, -1, -1):
+                if token_ids[start] == suffix[0] and token_ids[start:start + n] == suffix:
+                    draft = token_ids[start + n:start + n + num_tokens]
+                    if draft:
+                        return draft
+        return []
+
+    def _corpus_lookup(self, token_ids, num_tokens):
+        table = self.drafter.table
+        a, b = token_ids[-2:] if len(token_ids) > 1 else (None, token_ids[-1])
+        draft = []
+        while len(draft) < num_tokens:
+            token = table.get((a, b))
+            if token is None:
+                break
+            draft.append(token)
+            a, b = b, token
+        return draft
+
+    def _allowed(self, token_ids, draft):
+        # Longest prefix of draft that repeats no n-gram of the banned size
+        if not self.size or not draft:
+            return draft
+        context = token_ids[-(self.size - 1):] if self.size > 1 else []
+        new = set()
+        for i, token in enumerate(draft):
+            ngram = tuple((context + draft[:i])[-(self.size - 1):] + [token]) if self.size > 1 else (token,)
+            if ngram in self._seen or ngram in new:
+                return draft[:i]
+            new.add(ngram)
+        return draft
+
+
+def build_ngram_table(token_lists):
+    """Most frequent next token for every token pair in token_lists"""
+    counts = collections.Counter()
+    for tokens in token_lists:
+        counts.update(zip(tokens, tokens[1:], tokens[2:]))
+    table, best = {}, {}
+    for (a, b, c), count in counts.items():
+        if count > best.get((a, b), 0):
+            best[(a, b)] = count
+            table[(a, b)] = c
+    return table
+
+
+class DraftModelDrafter:
+    """Samples the draft from a smaller GPT-2 that shares the tokenizer"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def session(self):
+        return _DraftModelSession(self.model)
+
+
+class _DraftModelSession:
+    """Draft model state for one sequence
+
+    Keeps the draft model's KV cache across proposals, so each call only
+    runs the tokens accepted or resampled since the last one.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._token_ids = []
+        self._past_key_values = None
+
+    def propose(self, token_ids, num_tokens, processors=None, warpers=None):
+        """Return (draft token ids, [len, vocab] probabilities they were sampled from)"""
+        # Keep the cached KV of the prefix shared with the current context
+        common = 0
+        for cached, token in zip(self._token_ids, token_ids):
+            if cached != token:
+                break
+            common += 1
+        common = min(common, len(token_ids) - 1)
+        past_key_values = _crop(self._past_key_values, common) if common else None
+
+        ids = list(token_ids)
+        new_ids = ids[common:]
+        draft, probs = [], []
+        for _ in range(num_tokens):
+            outputs = self.model(
+                input_ids=torch.tensor([new_ids], dtype=torch.long),
+                past_key_values=past_key_values,
+                use_cache=True
+            )
+            past_key_values = outputs.past_key_values
+            p = _distribution(outputs.logits[0, -1], ids, processors, warpers)
+            token = int(torch.multinomial(p, num_samples=1))
+            draft.append(token)
+            probs.append(p)
+            ids.append(token)
+            new_ids = [token]
+
+        # The last drafted token has not been run through the draft model yet
+        self._token_ids = ids[:-1]
+        self._past_key_values = past_key_values
+        return draft, torch.stack(probs)
+
+
+class SpeculativeDecoder:
+    """Draft-then-verify sampling for one sequence, with the main model's output distribution
+
+    Each step the drafter proposes up to num_tokens tokens and GPT-2 scores
+    all of them in a single forward pass. Draft token d at a position is
+    kept with probability min(1, p(d) / q(d)), where p is the main model's
+    processed distribution (repetition penalty, n-gram ban, temperature,
+    top-k/top-p, exactly as in generate) and q the drafter's (one-hot for
+    n-gram drafts). The first rejected position is resampled from
+    max(p - q, 0), and when everything is kept one more token is sampled
+    from the last position. This is the rejection scheme of Leviathan et
+    al. / Chen et al.: every token follows the same distribution as plain
+    sampling, while a step can yield several tokens.
+    """
+
+    def __init__(self, llm, drafter, num_tokens=4):
+        self.llm = llm
+        self.drafter = drafter
+        self.num_tokens = max(1, num_tokens)
+        self.eos_token_id = llm.tokenizer.eos_token_id
+        self.proposed = 0
+        self.accepted = 0
+        self.steps = 0
+        self._lock = threading.Lock()
+
+    def generate(self, input_ids, on_token=None, sampling=None):
+        """Prompt + generated token ids for a list of prompt token ids
+
+        sampling (a sampling.Sampling) overrides the model's generation
+        config; past its deadline decoding stops after the current step.
+        """
+        with torch.inference_mode():
+            return self._generate(list(input_ids), on_token, sampling)
+
+    def stats(self):
+        with self._lock:
+            steps, proposed, accepted = self.steps, self.proposed, self.accepted
+        return {
+            "drafter": type(self.drafter).__name__,
+            "num_tokens": self.num_tokens,
+            "steps": steps,
+            "proposed": proposed,
+            "accepted": accepted,
+            "acceptance_rate": round(accepted / proposed, 3) if proposed else None
+        }
+
+    def _generate(self, token_ids, on_token, sampling):
+        llm = self.llm
+        prompt_length = len(token_ids)
+        config = sampling.config if sampling is not None else llm.generation_config
+        max_new_tokens = llm.token_budget(config, prompt_length)
+        processors, warpers = llm.make_logits_processors(prompt_length, config)
+        drafter = self.drafter.session()
+
+        # Invariant: past_key_values covers every token but the last
+        start = time.perf_counter()
+        input_ids = torch.tensor([token_ids], dtype=torch.long)
+        past_key_values = llm.prefill_prefix(input_ids)
+        if past_key_values is None and prompt_length > 1:
+            past_key_values = llm.model(input_ids=input_ids[:, :-1], use_cache=True).past_key_values
+        prefill = True
+
+        while True:
+            generated = len(token_ids) - prompt_length
+            # Leave room for the token every step adds on top of the accepted drafts
+            budget = min(self.num_tokens, max_new_tokens - generated - 1)
+            draft, draft_probs = [], None
+            if budget > 0:
+                draft, draft_probs = drafter.propose(token_ids, budget, processors, warpers)
+
+            outputs = llm.model(
+                input_ids=torch.tensor([[token_ids[-1]] + draft], dtype=torch.long),
+                past_key_values=past_key_values,
+                use_cache=True
+            )
+            logits = outputs.logits[0]
+
+            accepted, new_tokens, finished = 0, [], False
+            for position in range(len(draft) + 1):
+                p = _distribution(logits[position], token_ids + new_tokens, processors, warpers)
+                if position < len(draft):
+                    token = draft[position]
+                    q = draft_probs[position] if draft_probs is not None else None
+                    ratio = p[token] if q is None else p[token] / q[token]
+                    if torch.rand(()) < ratio:
+                        accepted += 1
+                    else:
+                        # Resample from the part of p the draft did not cover
+                        if q is None:
+                            residual = p.clone()
+                            residual[token] = 0
+                        else:
+                            residual = torch.clamp(p - q, min=0)
+                        token = int(torch.multinomial(residual / residual.sum(), num_samples=1))
+                else:
+                    token = int(torch.multinomial(p, num_samples=1))
+
+                new_tokens.append(token)
+                if token == self.eos_token_id or generated + len(new_tokens) >= max_new_tokens:
+                    finished = True
+                    break
+                if len(new_tokens) > accepted:
+                    break   # a resampled or bonus token ends the step
+
+            # Drop the KV of rejected draft positions
+            past_key_values = _crop(outputs.past_key_values, len(token_ids) + len(new_tokens) - 1)
+
+            elapsed = time.perf_counter() - start
+            if prefill:
+                STAGE_SECONDS.labels("prefill").observe(elapsed)
+                prefill = False
+            else:
+                for _ in new_tokens:
+                    STAGE_SECONDS.labels("decode_token").observe(elapsed / len(new_tokens))
+            start = time.perf_counter()
+
+            with self._lock:
+                self.steps += 1
+                self.proposed += len(draft)
+                self.accepted += accepted
+            SPECULATIVE_TOKENS.labels("proposed").inc(len(draft))
+            SPECULATIVE_TOKENS.labels("accepted").inc(accepted)
+            token_ids.extend(new_tokens)
+            if on_token is not None:
+                for token in new_tokens:
+                    on_token(token)
+            if finished or (sampling is not None and sampling.expired()):
+                return token_ids
+
+
+def _distribution(logits, token_ids, processors, warpers):
+    """Sampling distribution after the same processors and warpers as generate"""
+    ids = torch.tensor([token_ids], dtype=torch.long)
+    scores = logits.unsqueeze(0).float()
+    if processors is not None:
+        scores = warpers(ids, processors(ids, scores))
+    return torch.softmax(scores, dim=-1)[0]
+
+
+def _crop(past_key_values, length):
+    """past_key_values cut to the first length positions"""
+    return tuple((k[:, :, :length], v[:, :, :length]) for k, v in past_key_values)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Token streaming helpers for the Sanatana Dharma LLM server
+Turns sampled token ids into cleaned text chunks and Server-Sent Events
+"""
+
+import json
+import re
+
+from postprocessing import STREAM_RULES, LiteralStage
+
+_NEWLINES = re.compile(r'\n+')
+_SPACES = re.compile(r' +')
+
+
+class IncrementalDetokenizer:
+    """Decodes a growing list of token ids into newly completed text
+
+    Only the last few tokens are re-decoded per step, and text ending in a
+    partial UTF-8 character (Devanagari, diacritics) is held back until the
+    next token completes it.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.token_ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def push(self, token_id):
+        """Add one token id; returns the text it completes (may be empty)"""
+        self.token_ids.append(token_id)
+
+        prefix_text = self.tokenizer.decode(
+            self.token_ids[self.prefix_offset:self.read_offset], skip_special_tokens=True
+        )
+        new_text = self.tokenizer.decode(self.token_ids[self.prefix_offset:], skip_special_tokens=True)
+
+        if len(new_text) > len(prefix_text) and not new_text.endswith("�"):
+            self.prefix_offset = self.read_offset
+            self.read_offset = len(self.token_ids)
+            return new_text[len(prefix_text):]
+        return ""
+
+
+class StreamingCleaner:
+    """Applies the clean-up rules that are safe to run on partial text
+
+    Artifact removal and whitespace collapsing happen on the fly. Text that
+    could still turn into an artifact, and trailing whitespace, is held back
+    until more text arrives or the stream ends. Sentence truncation needs the
+    whole answer and only happens in the final response.
+    """
+
+    def __init__(self, rules=STREAM_RULES):
+        self.stage = LiteralStage(rules)
+        self._buffer = ""
+        self._started = False
+
+    def push(self, text):
+        """Add raw text; returns the cleaned text that is safe to show now"""
+        self._buffer += text
+        self._buffer = self.stage.apply(self._buffer)
+
+        if not self._started:
+            # Same as the leading lstrip("? ").strip() of the final response
+            self._buffer = self._buffer.lstrip("? ").lstrip()
+            if not self._buffer:
+                return ""
+
+        cut = len(self._buffer) - self.stage.partial_match_length(self._buffer)
+        # Keep trailing whitespace so runs split across chunks collapse correctly
+        while cut > 0 and self._buffer[cut - 1].isspace():
+            cut -= 1
+        if cut <= 0:
+            return ""
+
+        ready, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        self._started = True
+        return self._collapse(ready)
+
+    def flush(self):
+        """Return whatever is still held back once generation has finished"""
+        rest, self._buffer = self._buffer, ""
+        return self._collapse(rest).rstrip()
+
+    def _collapse(self, text):
+        text = _NEWLINES.sub('\n\n', text)
+        return _SPACES.sub(' ', text)
+
+
+class TokenTextStream:
+    """Token ids in, cleaned text chunks out"""
+
+    def __init__(self, tokenizer, on_text):
+        self.detokenizer = IncrementalDetokenizer(tokenizer)
+        self.cleaner = StreamingCleaner()
+        self.on_text = on_text
+
+    def push(self, token_id):
+        text = self.detokenizer.push(token_id)
+        if text:
+            text = self.cleaner.push(text)
+            if text:
+                self.on_text(text)
+
+    def close(self):
+        text = self.cleaner.flush()
+        if text:
+            self.on_text(text)
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,88 @@
+"""
+Greedy parity of the traced TorchScript decoder with eager PyTorch
+on the 2-layer randomly initialized model of benchmark.build_tiny_model
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from benchmark import QUESTIONS, build_tiny_model
+from inference_backend import PARITY_PROMPT, TorchScriptBackend, _empty_past, greedy_tokens, trace_decoder
+
+NUM_TOKENS = 16
+
+
+@pytest.fixture(scope="module")
+def tiny_model_path(tmp_path_factory):
+    return build_tiny_model(str(tmp_path_factory.mktemp("tiny")))
+
+
+@pytest.fixture
+def model(tiny_model_path):
+    return transformers.AutoModelForCausalLM.from_pretrained(tiny_model_path).eval()
+
+
+@pytest.fixture
+def tokenizer(tiny_model_path):
+    tokenizer = transformers.AutoTokenizer.from_pretrained(tiny_model_path)
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+
+def _prompts():
+    return [PARITY_PROMPT] + [question for question, _ in QUESTIONS[:3]]
+
+
+def test_traced_decoder_matches_eager(model, tokenizer):
+    graph = trace_decoder(model)
+    for prompt in _prompts():
+        input_ids = tokenizer(prompt, return_tensors="pt").input_ids
+        expected = greedy_tokens(model, input_ids, num_tokens=NUM_TOKENS)
+
+        past_key_values, tokens = _empty_past(model, 1), []
+        attention_mask = torch.ones_like(input_ids)
+        position_ids = torch.arange(input_ids.shape[1]).unsqueeze(0)
+        step_ids = input_ids
+        with torch.no_grad():
+            for _ in range(NUM_TOKENS):
+                logits, past_key_values = graph(step_ids, attention_mask, position_ids, past_key_values)
+                step_ids = logits[:, -1].argmax(-1, keepdim=True)
+                tokens.append(int(step_ids))
+                attention_mask = torch.cat([attention_mask, attention_mask.new_ones(1, 1)], dim=1)
+                position_ids = position_ids[:, -1:] + 1
+        assert [tokens] == expected, prompt
+
+
+def test_backend_matches_eager_single_and_padded_batch(model, tokenizer):
+    singles = [tokenizer(prompt, return_tensors="pt").input_ids for prompt in _prompts()]
+    batch = tokenizer(_prompts()[:2], return_tensors="pt", padding=True)
+    expected_singles = [greedy_tokens(model, input_ids, num_tokens=NUM_TOKENS) for input_ids in singles]
+    expected_batch = greedy_tokens(model, batch.input_ids, batch.attention_mask, num_tokens=NUM_TOKENS)
+
+    backend = TorchScriptBackend()
+    backend.install(model, tokenizer)
+
+    # The load-time parity check passed, so the graph serves
+    assert backend.name == "torchscript"
+    assert backend.graph is not None
+    calls = backend.calls
+    assert [greedy_tokens(model, input_ids, num_tokens=NUM_TOKENS) for input_ids in singles] == expected_singles
+    assert greedy_tokens(model, batch.input_ids, batch.attention_mask, num_tokens=NUM_TOKENS) == expected_batch
+    assert backend.calls > calls
+
+
+def test_backend_generate_matches_eager(model, tokenizer):
+    batch = tokenizer(_prompts()[:2], return_tensors="pt", padding=True)
+    kwargs = dict(attention_mask=batch.attention_mask, do_sample=False, max_new_tokens=NUM_TOKENS,
+                  pad_token_id=tokenizer.pad_token_id)
+    with torch.no_grad():
+        expected = model.generate(batch.input_ids, **kwargs)
+
+    backend = TorchScriptBackend()
+    backend.install(model, tokenizer)
+    with torch.no_grad():
+        traced = model.generate(batch.input_ids, **kwargs)
+    assert backend.name == "torchscript"
+    assert torch.equal(traced, expected)
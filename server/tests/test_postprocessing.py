@@ -0,0 +1,164 @@
+"""
+Golden tests for response post-processing
+Expected outputs were captured from SanatanaLLMGPT2._postprocess before the
+rules moved to postprocessing.py; the module must reproduce them byte for byte
+"""
+
+import pytest
+
+from postprocessing import postprocess_response
+
+CHILD_KRISHNA = "Explain in simple words for a child: Who is Krishna?\n\nAnswer:"
+CHILD = "Explain in simple words for a child: How can I be brave like Arjuna?\n\nAnswer:"
+WHAT = "What is karma yoga according to the Bhagavad-Gita?\n\nAccording to Bhagavad Gita,"
+VERSE = "Explain Bhagavad Gita 2.47\n\n"
+PLAIN = "Why did Arjuna hesitate to fight?\n\n"
+
+
+# (name, decoded model output, prompt, expected answer)
+GOLDEN = [
+    (
+        "empty",
+        "",
+        PLAIN,
+        "I'm working on understanding your question. Please try rephrasing it."
+    ),
+    (
+        "prompt_only",
+        "What is karma yoga according to the Bhagavad-Gita?\n\nAccording to Bhagavad Gita,",
+        WHAT,
+        ""
+    ),
+    (
+        "child_prefix",
+        "Explain in simple words for a child: How can I be brave like Arjuna?\n\nAnswer: Arjuna was brave because he trusted Krishna and did his duty without fear. Be like him",
+        CHILD,
+        "Arjuna was brave because he trusted Krishna and did his duty without fear."
+    ),
+    (
+        "child_explain_in",
+        "Explain in simple words for a child: Courage means doing the right thing even when you are scared. Krishna helps us",
+        CHILD_KRISHNA,
+        "Courage means doing the right thing even when you are scared."
+    ),
+    (
+        "scholar_what_is",
+        "What is karma yoga according to the Bhagavad-Gita?\n\nAccording to Bhagavad Gita, karma yoga is the path of selfless action performed as an offering to the Supreme. One must act without attachment to the fruits of action",
+        WHAT,
+        "karma yoga is the path of selfless action performed as an offering to the Supreme. One must act without attachment to the fruits of action."
+    ),
+    (
+        "assistant_artifacts",
+        "? Assistant: Answer: The soul is eternal and cannot be slain by weapons. Assistant: It is unborn and undying",
+        PLAIN,
+        "The soul is eternal and cannot be slain by weapons. It is unborn and undying."
+    ),
+    (
+        "leading_question_marks",
+        "?? ? The wise grieve neither for the living nor for the dead, says Krishna",
+        PLAIN,
+        "The wise grieve neither for the living nor for the dead, says Krishna."
+    ),
+    (
+        "in_bhagavad_gita_prefix",
+        "in Bhagavad-Gītā the Lord teaches that the self is beyond the body and the mind entirely",
+        PLAIN,
+        "the Lord teaches that the self is beyond the body and the mind entirely."
+    ),
+    (
+        "repeated_sentences",
+        "Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results.",
+        PLAIN,
+        "Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results. Perform your duty without attachment to the results."
+    ),
+    (
+        "repeated_prompt",
+        "Why did Arjuna hesitate to fight?\n\nArjuna hesitated because he saw his teachers and kinsmen. Why did Arjuna hesitate to fight?\n\nHe did not want to fight them",
+        PLAIN,
+        "Arjuna hesitated because he saw his teachers and kinsmen. He did not want to fight them."
+    ),
+    (
+        "devanagari",
+        "Explain Bhagavad Gita 2.47\n\nकर्मण्येवाधिकारस्ते मा फलेषु कदाचन ||47|| You have a right to perform your prescribed duty, but not to the fruits of action",
+        VERSE,
+        "कर्मण्येवाधिकारस्ते मा फलेषु कदाचन (Verse 47) You have a right to perform your prescribed duty, but not to the fruits of action."
+    ),
+    (
+        "transliteration",
+        "karmaṇy evādhikāras te mā phaleṣu kadācana. Verse 47 teaches detachment from the results of every action we perform",
+        VERSE,
+        "karmaṇy evādhikāras te mā phaleṣu kadācana. Verse 47: teaches detachment from the results of every action we perform."
+    ),
+    (
+        "verse_chapter_headings",
+        "In Chapter 2 Krishna begins his teaching. Verse 47 is the most quoted line of the whole chapter. See also Verse 48 and Chapter 3 on karma yoga in depth",
+        PLAIN,
+        "In \n\nChapter 2: Krishna begins his teaching. Verse 47: is the most quoted line of the whole chapter. See also \n\nVerse 48: and \n\nChapter 3: on karma yoga in depth."
+    ),
+    (
+        "embedded_heading_words",
+        "The Universe 12 and subChapter 4 are not headings at all, they are ordinary words inside the sentence",
+        PLAIN,
+        "The Universe 12 and subChapter 4 are not headings at all, they are ordinary words inside the sentence."
+    ),
+    (
+        "unbalanced_quotes",
+        "Krishna said \"abandon all varieties of dharma and surrender unto Me. I shall deliver you from all sinful reactions, do not fear",
+        PLAIN,
+        "Krishna said \"abandon all varieties of dharma and surrender unto Me. I shall deliver you from all sinful reactions, do not fear."
+    ),
+    (
+        "unbalanced_single_quote",
+        "The word 'yoga means union with the divine and it is explained in many different ways throughout the text",
+        PLAIN,
+        "The word 'yoga means union with the divine and it is explained in many different ways throughout the text."
+    ),
+    (
+        "whitespace_runs",
+        "  The   self is   never born\n\n\n\nand never   dies.\n\nIt is   eternal,\tancient   and primeval   ",
+        PLAIN,
+        "The self is never born\n\nand never dies. It is eternal,\tancient and primeval."
+    ),
+    (
+        "ellipses_and_punctuation",
+        "The mind is restless.... It is hard to control?? But by practice and detachment it can be mastered...!",
+        PLAIN,
+        "The mind is restless. It is hard to control. But by practice and detachment it can be mastered."
+    ),
+    (
+        "format_artifacts",
+        "Devotion is the highest path READ MORE › for those who seek Krishna. Read More \u200e Appears in Chapter 12 ‑ Bhakti Yoga :nd more - \n\nsurrender is key to it",
+        PLAIN,
+        "Devotion is the highest path for those who seek Krishna. Reference: Appears in \n\nChapter 12: - Bhakti Yoga : more\n\nsurrender is key to it."
+    ),
+    (
+        "long_rambling_sentence",
+        "The teaching is simple. and then the warrior thought about it again and then the warrior thought about it again and then the warrior thought about it again and then the warrior thought about it again and then the warrior thought about it again and then the warrior thought about it again and then the warrior thought about it again and then the warrior thought about it again and then the warrior thought about it again and then the warrior thought about it again . Krishna spoke to him about duty and detachment",
+        PLAIN,
+        "The teaching is simple. Krishna spoke to him about duty and detachment."
+    ),
+    (
+        "short_trailing_fragments",
+        "Dharma means righteous duty according to one's nature. It is. Yes. So",
+        PLAIN,
+        "Dharma means righteous duty according to one's nature."
+    ),
+    (
+        "no_sentence_survives",
+        "Yes. No. Ok",
+        PLAIN,
+        ""
+    ),
+    (
+        "exclamation_ending",
+        "Surrender to Krishna and be free from fear!",
+        PLAIN,
+        "Surrender to Krishna and be free from fear!."
+    )
+]
+
+
+@pytest.mark.parametrize("response, system_prompt, expected", [case[1:] for case in GOLDEN],
+                         ids=[case[0] for case in GOLDEN])
+def test_matches_original_postprocessing(response, system_prompt, expected):
+    assert postprocess_response(response, system_prompt) == expected
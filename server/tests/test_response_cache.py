@@ -0,0 +1,38 @@
+"""
+SQLite response cache store: LRU eviction in batches past the cap
+"""
+
+from response_cache import ResponseCache, SqliteBackend
+
+
+def test_sqlite_backend_evicts_least_recently_used_past_the_cap(tmp_path):
+    backend = SqliteBackend(str(tmp_path / "cache.sqlite"), max_entries=20)
+    for i in range(20):
+        backend.set(f"key{i}", "scholar", f"question {i}", {"response": i}, ttl=60)
+    assert len(backend) == 20
+    assert backend.get("key0") == {"response": 0}   # now the most recently used
+
+    backend.set("key20", "scholar", "question 20", {"response": 20}, ttl=60)
+    assert len(backend) == backend.low_water == 18
+    assert backend.get("key0") == {"response": 0}
+    assert backend.get("key20") == {"response": 20}
+    assert backend.get("key1") is None and backend.get("key2") is None and backend.get("key3") is None
+
+
+def test_sqlite_backend_recounts_rows_of_other_workers(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    worker_a, worker_b = SqliteBackend(path, max_entries=10), SqliteBackend(path, max_entries=10)
+    for i in range(8):
+        worker_a.set(f"a{i}", "scholar", f"a {i}", {"response": i}, ttl=60)
+    for i in range(8):
+        worker_b.set(f"b{i}", "scholar", f"b {i}", {"response": i}, ttl=60)
+    assert len(worker_a) <= 10
+    assert worker_a.get("b7") == {"response": 7}
+
+
+def test_response_cache_round_trip(tmp_path):
+    cache = ResponseCache(SqliteBackend(str(tmp_path / "cache.sqlite")), similarity_threshold=0.8)
+    cache.set("What is Dharma?", "scholar", {"top_k": 50}, {"response": "Duty."})
+    assert cache.get("what is dharma", "scholar", {"top_k": 50}) == {"response": "Duty."}
+    assert cache.get("what is dharma", "child", {"top_k": 50}) is None
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Prompt tokenization for the Sanatana Dharma LLM server
+Fast (Rust) tokenizer loading and an LRU cache of prompt token ids
+
+Checkpoints saved by the training notebook ship the slow GPT-2 files
+(vocab.json, merges.txt, added_tokens.json) without a tokenizer.json, so
+every load rebuilds the fast tokenizer from them. The loader converts them
+once and writes tokenizer.json next to them; for read-only checkpoints run
+the conversion ahead of time:
+
+    python tokenization.py models/gpt2-gita-clean
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from transformers import AutoTokenizer
+
+logger = logging.getLogger(__name__)
+
+# Fast and slow tokenizers must agree on these before tokenizer.json is written
+PARITY_TEXTS = [
+    "What is karma yoga according to the Bhagavad-Gita?\n\nAccording to Bhagavad Gita,",
+    "Explain in simple words for a child: How can I be brave like Arjuna?\n\nAnswer:",
+    "Explain Bhagavad Gita 2.47\n\n",
+    "<|startoftext|>Question: What is dharma?<|sep|>Answer: duty.<|endoftext|><|pad|>",
+    "karmaṇy evādhikāras te mā phaleṣu kadācana  कर्मण्येवाधिकारस्ते"
+]
+
+
+def convert_tokenizer(model_path):
+    """Write model_path/tokenizer.json from the slow tokenizer files; returns its path"""
+    slow = AutoTokenizer.from_pretrained(model_path, use_fast=False)
+    fast = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+    for text in PARITY_TEXTS:
+        if fast(text).input_ids != slow(text).input_ids:
+            raise ValueError(f"Fast tokenizer of {model_path} disagrees with the slow one on {text!r}")
+
+    # Atomic, so concurrently starting workers never read half a file
+    path = os.path.join(model_path, "tokenizer.json")
+    fd, tmp_path = tempfile.mkstemp(dir=model_path, prefix=".tokenizer-", suffix=".json")
+    os.close(fd)
+    try:
+        fast.backend_tokenizer.save(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f"Fast tokenizer written to {path}")
+    return path
+
+
+def verify_fast_tokenizer(tokenizer, model_path):
+    """Raise unless tokenizer is a fast one that maps the checkpoint's added tokens to their ids"""
+    if not tokenizer.is_fast:
+        raise RuntimeError(f"No fast tokenizer for {model_path} (is the tokenizers package installed?)")
+    added_tokens_file = os.path.join(model_path, "added_tokens.json")
+    if not os.path.exists(added_tokens_file):
+        return
+    with open(added_tokens_file, 'r', encoding='utf-8') as f:
+        added_tokens = json.load(f)
+    for token, token_id in added_tokens.items():
+        if tokenizer(token).input_ids != [token_id]:
+            raise ValueError(f"Tokenizer of {model_path} does not encode {token!r} as id {token_id}")
+
+
+def load_fast_tokenizer(model_path):
+    """Fast tokenizer of a checkpoint, converting its slow tokenizer files once if needed"""
+    if os.path.isdir(model_path) and not os.path.exists(os.path.join(model_path, "tokenizer.json")):
+        try:
+            convert_tokenizer(model_path)
+        except OSError as e:
+            logger.warning(
+                f"Could not write a tokenizer.json to {model_path} ({e}), converting at every load "
+                f"(run: python tokenization.py {model_path})"
+            )
+    tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+    verify_fast_tokenizer(tokenizer, model_path)
+    return tokenizer
+
+
+class TokenCache:
+    """Token ids of recently seen prompt texts, truncated to max_length
+
+    Prompts are the same templates around questions that repeat, so most
+    lookups skip the tokenizer. Misses of one call are tokenized together
+    in a single batch call. Thread-safe; returns fresh lists.
+    """
+
+    def __init__(self, tokenizer, max_length, size=4096):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+        self._ids = collections.OrderedDict()   # text -> tuple of token ids
+        self._lock = threading.Lock()
+
+    def encode(self, text):
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts):
+        """Token ids of every text, in order"""
+        found = {}
+        with self._lock:
+            for text in texts:
+                ids = self._ids.get(text)
+                if ids is not None:
+                    self._ids.move_to_end(text)
+                    found[text] = ids
+            self.hits += sum(text in found for text in texts)
+
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+        if missing:
+            encoded = self.tokenizer(missing, truncation=True, max_length=self.max_length).input_ids
+            with self._lock:
+                self.misses += len(missing)
+                for text, ids in zip(missing, encoded):
+                    found[text] = tuple(ids)
+                    if self.size > 0:
+                        self._ids[text] = found[text]
+                while len(self._ids) > self.size:
+                    self._ids.popitem(last=False)
+        return [list(found[text]) for text in texts]
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._ids), "max_size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a checkpoint's fast tokenizer (tokenizer.json) once")
+    parser.add_argument("model_paths", nargs="+")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for model_path in args.model_paths:
+        convert_tokenizer(model_path)
+        verify_fast_tokenizer(AutoTokenizer.from_pretrained(model_path, use_fast=True), model_path)
+
+
+if __name__ == "__main__":
+    main()
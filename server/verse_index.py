@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Verse retrieval index for the Sanatana Dharma LLM server
+BM25 over the Gita slok corpus (verses, translations and commentaries), with an optional dense-vector index
+
+Build it once from the same repository data/generate_clean_dataset.py reads:
+    python verse_index.py ../data/bhagavad-gita-repo --output indexes/gita
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+
+# Passage kinds: the verse itself, then the per-author fields of the slok files
+PASSAGE_KINDS = {
+    "slok": "Sanskrit",
+    "et": "English translation",
+    "ht": "Hindi translation",
+    "ec": "English commentary",
+    "hc": "Hindi commentary",
+    "sc": "Sanskrit commentary",
+}
+AUTHOR_FIELDS = ("et", "ht", "ec", "hc", "sc")
+
+# Words, including Devanagari with its vowel signs (the danda is punctuation)
+_WORD = re.compile(r"[\w\u0900-\u0963\u0966-\u097f]+")
+_LATIN_MARKS = re.compile(r"[\u0300-\u036f]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has he his i in is it its of on or that the this "
+    "to was were which who will with what does do how why me my you your".split()
+)
+
+
+def tokenize(text):
+    """Lowercased search terms; Latin diacritics are folded so Gītā matches gita"""
+    text = _LATIN_MARKS.sub("", unicodedata.normalize("NFKD", text.lower()))
+    text = unicodedata.normalize("NFC", text)
+    return [word for word in _WORD.findall(text) if word not in STOPWORDS]
+
+
+def _data_authors():
+    # The commentator list lives with the dataset builder; reuse it as-is
+    data_dir = Path(__file__).resolve().parent.parent / "data"
+    sys.path.insert(0, str(data_dir))
+    try:
+        from generate_clean_dataset import AUTHORS
+    finally:
+        sys.path.remove(str(data_dir))
+    return AUTHORS
+
+
+def load_passages(repo_dir):
+    """Passages of every slok file, grouped by verse in reading order
+
+    Returns (verse_ids, passages, author_names) where each passage is a
+    (verse_index, author_key, kind, text) tuple; the verse's own Sanskrit
+    and transliteration have author_key None.
+    """
+    authors = _data_authors()
+    slok_files = list(Path(repo_dir, "slok").glob("*.json"))
+    if not slok_files:
+        raise FileNotFoundError(f"No slok files in {Path(repo_dir, 'slok')}")
+
+    sloks = []
+    for slok_file in slok_files:
+        with open(slok_file, encoding="utf-8") as f:
+            sloks.append(json.load(f))
+    sloks.sort(key=lambda slok: (int(slok["chapter"]), int(slok["verse"])))
+
+    verse_ids, passages, author_names = [], [], {}
+    for slok in sloks:
+        verse_index = len(verse_ids)
+        verse_ids.append(f"{slok['chapter']}.{slok['verse']}")
+
+        text = "\n".join(part for part in (slok.get("slok", ""), slok.get("transliteration", "")) if part)
+        if text:
+            passages.append((verse_index, None, "slok", text))
+
+        for author_key in authors:
+            author_data = slok.get(author_key)
+            if not author_data:
+                continue
+            author_names.setdefault(author_key, author_data.get("author", author_key))
+            for kind in AUTHOR_FIELDS:
+                text = author_data.get(kind, "")
+                if text and text.strip():
+                    passages.append((verse_index, author_key, kind, text.strip()))
+
+    return verse_ids, passages, author_names
+
+
+def load_verse_texts(repo_dir):
+    """Sanskrit and transliteration of every verse plus chapter metadata, for verbatim answers"""
+    verses = {}
+    for slok_file in Path(repo_dir, "slok").glob("*.json"):
+        with open(slok_file, encoding="utf-8") as f:
+            slok = json.load(f)
+        verses[f"{slok['chapter']}.{slok['verse']}"] = {
+            "slok": slok.get("slok", ""),
+            "transliteration": slok.get("transliteration", ""),
+        }
+
+    chapters = {}
+    for chapter_file in Path(repo_dir, "chapter").glob("bhagavadgita_chapter_*.json"):
+        with open(chapter_file, encoding="utf-8") as f:
+            info = json.load(f)
+        number = info.get("chapter_number") or int(chapter_file.stem.rsplit("_", 1)[1])
+        chapters[str(number)] = {
+            "name": info.get("name", ""),
+            "translation": info.get("translation", ""),
+            "summary": info.get("summary", {}),
+        }
+    return {"verses": verses, "chapters": chapters}
+
+
+def build_index(repo_dir, output, k1=1.2, b=0.75, dense_model=None):
+    """Write a memory-mappable BM25 index (and optionally dense vectors) to output"""
+    verse_ids, passages, author_names = load_passages(repo_dir)
+    author_keys = list(author_names)
+    author_ids = {key: i for i, key in enumerate(author_keys)}
+    kinds = list(PASSAGE_KINDS)
+
+    # Term frequencies per passage
+    vocab = {}
+    doc_terms = []
+    lengths = np.zeros(len(passages), dtype=np.float32)
+    for i, (_, _, _, text) in enumerate(passages):
+        counts = {}
+        for term in tokenize(text):
+            term_id = vocab.setdefault(term, len(vocab))
+            counts[term_id] = counts.get(term_id, 0) + 1
+        doc_terms.append(counts)
+        lengths[i] = sum(counts.values())
+
+    # Postings sorted by term, each entry carrying its precomputed BM25
+    # impact, so a query only sums slices
+    num_postings = sum(len(counts) for counts in doc_terms)
+    terms = np.empty(num_postings, dtype=np.int32)
+    docs = np.empty(num_postings, dtype=np.int32)
+    tfs = np.empty(num_postings, dtype=np.float32)
+    position = 0
+    for doc, counts in enumerate(doc_terms):
+        n = len(counts)
+        terms[position:position + n] = list(counts.keys())
+        docs[position:position + n] = doc
+        tfs[position:position + n] = list(counts.values())
+        position += n
+
+    order = np.lexsort((docs, terms))
+    terms, docs, tfs = terms[order], docs[order], tfs[order]
+    df = np.bincount(terms, minlength=len(vocab)).astype(np.float32)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(df, out=offsets[1:])
+
+    num_docs = len(passages)
+    idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1.0))
+    impacts = (idf[terms] * tfs * (k1 + 1) / (tfs + norm[docs])).astype(np.float32)
+
+    # Passages are grouped by verse, so verse scores are segment maxima
+    passage_verse = np.array([p[0] for p in passages], dtype=np.int16)
+    verse_starts = np.searchsorted(passage_verse, np.arange(len(verse_ids))).astype(np.int64)
+
+    os.makedirs(output, exist_ok=True)
+    np.save(os.path.join(output, "postings_offsets.npy"), offsets)
+    np.save(os.path.join(output, "postings_passages.npy"), docs)
+    np.save(os.path.join(output, "postings_impacts.npy"), impacts)
+    np.save(os.path.join(output, "passage_verse.npy"), passage_verse)
+    np.save(os.path.join(output, "passage_author.npy"),
+            np.array([author_ids.get(p[1], -1) for p in passages], dtype=np.int16))
+    np.save(os.path.join(output, "passage_kind.npy"), np.array([kinds.index(p[2]) for p in passages], dtype=np.int8))
+    np.save(os.path.join(output, "verse_starts.npy"), verse_starts)
+
+    # Passage text as one UTF-8 blob plus byte offsets
+    encoded = [p[3].encode("utf-8") for p in passages]
+    text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=text_offsets[1:])
+    with open(os.path.join(output, "passage_text.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(output, "passage_text_offsets.npy"), text_offsets)
+
+    with open(os.path.join(output, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    with open(os.path.join(output, "verses.json"), "w", encoding="utf-8") as f:
+        json.dump(load_verse_texts(repo_dir), f, ensure_ascii=False)
+
+    if dense_model:
+        vectors = _encoder(dense_model).encode([p[3] for p in passages], batch_size=64,
+                                               normalize_embeddings=True, show_progress_bar=True)
+        np.save(os.path.join(output, "dense.npy"), np.asarray(vectors, dtype=np.float32))
+
+    meta = {
+        "version": INDEX_VERSION,
+        "k1": k1,
+        "b": b,
+        "verses": verse_ids,
+        "authors": [{"key": key, "name": author_names[key]} for key in author_keys],
+        "kinds": kinds,
+        "dense_model": dense_model,
+    }
+    with open(os.path.join(output, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+
+    logger.info(
+        f"Indexed {num_docs} passages of {len(verse_ids)} verses "
+        f"({len(vocab)} terms, {num_postings} postings) into {output}"
+    )
+    return output
+
+
+def _encoder(model_name):
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise ImportError("Dense retrieval needs sentence-transformers: pip install sentence-transformers")
+    return SentenceTransformer(model_name, device="cpu")
+
+
+class VerseIndex:
+    """Read-only view of a built index; arrays are memory-mapped, not loaded
+
+    search() returns the top-k verse ids with scores, a verse scoring as its
+    best passage. Dense vectors, when built and enabled, are fused with BM25
+    by reciprocal rank.
+    """
+
+    def __init__(self, path, dense=False):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path} was built by an incompatible version; rebuild it")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+        self.verse_ids = meta["verses"]
+        self.verse_lookup = {verse_id: i for i, verse_id in enumerate(self.verse_ids)}
+        self.authors = meta["authors"]
+        self.kinds = meta["kinds"]
+
+        def load(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        self.offsets = load("postings_offsets")
+        self.postings = load("postings_passages")
+        self.impacts = load("postings_impacts")
+        self.passage_verse = load("passage_verse")
+        self.passage_author = load("passage_author")
+        self.passage_kind = load("passage_kind")
+        self.verse_starts = load("verse_starts")
+        self.text_offsets = load("passage_text_offsets")
+        self.text = np.memmap(os.path.join(path, "passage_text.bin"), dtype=np.uint8, mode="r")
+
+        self.dense = None
+        self.encoder = None
+        if dense and meta.get("dense_model"):
+            self.dense = load("dense")
+            self.encoder = _encoder(meta["dense_model"])
+
+        logger.info(f"Verse index: {len(self.verse_ids)} verses, {len(self)} passages from {path}")
+
+    def __len__(self):
+        return len(self.passage_verse)
+
+    def author_id(self, author):
+        """Index of an author given by key ("siva") or name, or None"""
+        author = author.lower()
+        for i, info in enumerate(self.authors):
+            if author in (info["key"].lower(), info["name"].lower()):
+                return i
+        return None
+
+    def passage_scores(self, query, author=None):
+        """BM25 score of every passage (float32 array)"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # A term lists each passage once, so fancy-index add is safe
+            scores[self.postings[start:end]] += self.impacts[start:end]
+        if author is not None:
+            scores[self.passage_author != author] = 0
+        return scores
+
+    def search(self, query, k=5, author=None):
+        """Top-k (verse_id, score) for a query, optionally limited to one author's passages"""
+        author_id = self.author_id(author) if isinstance(author, str) else author
+        scores = self.passage_scores(query, author_id)
+        verse_scores = np.maximum.reduceat(scores, self.verse_starts)
+
+        if self.dense is not None:
+            verse_scores = self._fuse(verse_scores, self._dense_verse_scores(query, author_id))
+
+        top = _top_k(verse_scores, k)
+        return [(self.verse_ids[i], float(verse_scores[i])) for i in top]
+
+    def search_passages(self, query, k=5, author=None, verses=None, kinds=None):
+        """Top-k (passage_index, score), optionally limited to an author, verse ids and/or passage kinds"""
+        author_id = self.author_id(author) if isinstance(author, str) else author
+        scores = self.passage_scores(query, author_id)
+        if kinds is not None:
+            kind_ids = [self.kinds.index(kind) for kind in kinds if kind in self.kinds]
+            scores[~np.isin(self.passage_kind, kind_ids)] = 0
+        if verses is not None:
+            keep = np.zeros(len(self), dtype=bool)
+            for verse_id in verses:
+                start, end = self.verse_range(verse_id)
+                keep[start:end] = True
+            scores[~keep] = 0
+        top = _top_k(scores, k)
+        return [(int(i), float(scores[i])) for i in top]
+
+    def verse_range(self, verse_id):
+        """Passage indexes [start, end) of a verse"""
+        i = self.verse_lookup[verse_id]
+        end = self.verse_starts[i + 1] if i + 1 < len(self.verse_starts) else len(self)
+        return int(self.verse_starts[i]), int(end)
+
+    def passage(self, index):
+        """Text and attribution of one passage"""
+        start, end = self.text_offsets[index], self.text_offsets[index + 1]
+        author = int(self.passage_author[index])
+        return {
+            "verse": self.verse_ids[self.passage_verse[index]],
+            "author": self.authors[author]["name"] if author >= 0 else None,
+            "kind": self.kinds[self.passage_kind[index]],
+            "text": bytes(self.text[start:end]).decode("utf-8"),
+        }
+
+    def _dense_verse_scores(self, query, author_id):
+        vector = self.encoder.encode([query], normalize_embeddings=True)[0].astype(np.float32)
+        scores = self.dense @ vector
+        if author_id is not None:
+            scores[self.passage_author != author_id] = -1
+        return np.maximum.reduceat(scores, self.verse_starts)
+
+    def _fuse(self, sparse, dense, k=60):
+        # Reciprocal rank fusion of the two verse rankings
+        fused = np.zeros(len(sparse), dtype=np.float32)
+        for scores in (sparse, dense):
+            ranks = np.empty(len(scores), dtype=np.float32)
+            ranks[np.argsort(-scores, kind="stable")] = np.arange(1, len(scores) + 1)
+            fused += 1.0 / (k + ranks)
+        return fused
+
+
+def _top_k(scores, k):
+    # Indexes of the k best positive scores, best first
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [i for i in top if scores[i] > 0]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the verse retrieval index")
+    parser.add_argument("repo_dir", help="bhagavad-gita repository, e.g. ../data/bhagavad-gita-repo")
+    parser.add_argument("--output", default="indexes/gita", help="index directory (default: indexes/gita)")
+    parser.add_argument("--dense-model", help="sentence-transformers model for the optional dense index, "
+                                              "e.g. sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--query", help="search the built index and print the top verses")
+    args = parser.parse_args()
+
+    build_index(args.repo_dir, args.output, dense_model=args.dense_model)
+    if args.query:
+        index = VerseIndex(args.output, dense=bool(args.dense_model))
+        for verse_id, score in index.search(args.query, k=5):
+            print(f"{verse_id:>6}  {score:.3f}")
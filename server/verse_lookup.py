@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Verse and chapter lookups for the Sanatana Dharma LLM server
+Recognizes references like "2.47", "chapter 3 verse 5" or "अध्याय 12 सारांश" and answers verbatim, without the model
+"""
+
+import json
+import logging
+import os
+import re
+import time
+
+from verse_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+_DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+_DEVANAGARI = re.compile(r"[\u0900-\u097f]")
+
+_CHAPTER_WORD = r"(?<![a-z])(?:chapter|ch\.?|adhyaya|अध्याय)"
+_VERSE_WORD = r"(?<![a-z])(?:verse|shloka|sloka|slok|v\.|श्लोक)"
+
+# (pattern, group of the chapter number, group of the verse number)
+_VERSE_PATTERNS = [
+    (re.compile(_CHAPTER_WORD + r"\s*(\d{1,2})\s*[,;]?\s*" + _VERSE_WORD + r"\s*(\d{1,3})"), 1, 2),
+    (re.compile(_VERSE_WORD + r"\s*(\d{1,3})\s*(?:of|in|,)?\s*" + _CHAPTER_WORD + r"\s*(\d{1,2})"), 2, 1),
+    (re.compile(r"(?<![\d.:])(\d{1,2})\s?[.:]\s?(\d{1,3})(?![\d.:])"), 1, 2),
+]
+_CHAPTER_PATTERN = re.compile(_CHAPTER_WORD + r"\s*(\d{1,2})(?![\d.:])")
+
+# Words that can surround a reference without changing what is asked;
+# anything else means a real question for the model
+_FILLER = frozenset(tokenize(
+    "bhagavad bhagvad bhagavadgita gita geeta bg verse verses shloka sloka slok chapter ch adhyaya "
+    "summary summarize summarise overview explain explanation meaning mean means translation translate "
+    "text show tell give read say says please about according per by the of in is what does do me "
+    "sanskrit transliteration commentary "
+    "भगवद गीता श्रीमद्भगवद्गीता का की के में है क्या अध्याय श्लोक सारांश किस बारे अर्थ बताइए बताओ "
+    "समझाइए अनुवाद व्याख्या टीका"
+))
+_COMMENTARY_INTENT = frozenset(tokenize("commentary व्याख्या टीका"))
+
+# Parts of commentator names too common to identify one
+_GENERIC_NAME_PARTS = frozenset(tokenize("swami sri shri dr prabhupada ji sh"))
+
+
+class Reference:
+    """A recognized lookup: a verse ("2.47") or a chapter ("12")"""
+
+    __slots__ = ("chapter", "verse", "author", "hindi", "commentary")
+
+    def __init__(self, chapter, verse=None, author=None, hindi=False, commentary=False):
+        self.chapter = chapter
+        self.verse = verse
+        self.author = author          # author index in the verse index, or None
+        self.hindi = hindi
+        self.commentary = commentary
+
+
+class VerseStore:
+    """Verbatim verse texts, translations and chapter summaries, in memory
+
+    Sanskrit, transliteration and chapter metadata come from the index's
+    verses.json; translations and commentaries are the index's passages.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        with open(os.path.join(index.path, "verses.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        self.verses = data["verses"]
+        self.chapters = data["chapters"]
+        self.lookups = 0
+
+        # Distinctive name words (and keys) of every commentator
+        self._author_words = []
+        for i, info in enumerate(index.authors):
+            words = {word for word in tokenize(info["name"]) if len(word) >= 4} - _GENERIC_NAME_PARTS
+            self._author_words.append((i, words | {info["key"].lower()}))
+
+        logger.info(f"Verse store: {len(self.verses)} verses, {len(self.chapters)} chapters")
+
+    def parse(self, message):
+        """Reference the message asks for, or None if it is a real question"""
+        text = message.translate(_DEVANAGARI_DIGITS).lower()
+
+        reference, span = None, None
+        for pattern, chapter_group, verse_group in _VERSE_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                chapter, verse = int(match.group(chapter_group)), int(match.group(verse_group))
+                reference, span = Reference(chapter, verse), match.span()
+                break
+        if reference is None:
+            match = _CHAPTER_PATTERN.search(text)
+            if match is None:
+                return None
+            reference, span = Reference(int(match.group(1))), match.span()
+
+        words = set(tokenize(text[:span[0]] + " " + text[span[1]:]))
+        rest = {word for word in words if word not in _FILLER and not word.isdigit()}
+        for author, names in self._author_words:
+            if rest & names:
+                reference.author = author
+                rest -= names | _GENERIC_NAME_PARTS
+                break
+        if rest:
+            return None
+
+        reference.hindi = bool(_DEVANAGARI.search(message))
+        reference.commentary = bool(_COMMENTARY_INTENT & words)
+        return reference
+
+    def answer(self, message, mode="scholar"):
+        """Response dict for a verse/chapter lookup, or None to use the model"""
+        start_time = time.time()
+        reference = self.parse(message)
+        if reference is None:
+            return None
+
+        if reference.verse is None:
+            text, citation = self._chapter_answer(reference)
+        else:
+            text, citation = self._verse_answer(reference)
+        if text is None:
+            return None
+
+        self.lookups += 1
+        return {
+            "response": text,
+            "citations": [citation],
+            "audio_url": "",
+            "mode": mode,
+            "confidence": 1.0,
+            "generation_time": time.time() - start_time,
+            "model_used": "verse-store"
+        }
+
+    def stats(self):
+        return {"verses": len(self.verses), "chapters": len(self.chapters), "lookups": self.lookups}
+
+    def _verse_answer(self, reference):
+        verse_id = f"{reference.chapter}.{reference.verse}"
+        texts = self.verses.get(verse_id)
+        if texts is None:
+            return None, None
+
+        # Same layout as the verse_explanation / verse_commentary training examples
+        if reference.commentary:
+            passage = self._passage(verse_id, ("hc", "ec") if reference.hindi else ("ec", "hc"), reference.author)
+            if passage is None:
+                return None, None
+            return (
+                f"Commentary on Bhagavad Gita verse {verse_id} by {passage['author']}:\n\n{passage['text']}",
+                f"Bhagavad-Gītā {verse_id}"
+            )
+
+        response = f"Verse {verse_id} of Bhagavad Gita:\n\n"
+        if texts["slok"]:
+            response += f"Sanskrit:\n{texts['slok']}\n\n"
+        if texts["transliteration"]:
+            response += f"Transliteration:\n{texts['transliteration']}\n\n"
+        passage = self._passage(verse_id, ("ht", "et") if reference.hindi else ("et", "ht"), reference.author)
+        if passage is not None:
+            response += f"Translation (by {passage['author']}):\n{passage['text']}"
+        return response.strip(), f"Bhagavad-Gītā {verse_id}"
+
+    def _chapter_answer(self, reference):
+        info = self.chapters.get(str(reference.chapter))
+        if info is None:
+            return None, None
+        summary = info.get("summary", {})
+        if reference.hindi and summary.get("hi"):
+            text = f"अध्याय {reference.chapter}: {info['name']}\n\n{summary['hi']}"
+        elif summary.get("en"):
+            text = f"Chapter {reference.chapter}: {info['translation']}\n\n{summary['en']}"
+        else:
+            return None, None
+        return text, f"Bhagavad-Gītā Chapter {reference.chapter}"
+
+    def _passage(self, verse_id, kinds, author=None):
+        # First passage of the preferred kind; passages are in AUTHORS order
+        index = self.index
+        start, end = index.verse_range(verse_id)
+        kind_ids = [index.kinds.index(kind) for kind in kinds]
+        for kind_id in kind_ids:
+            for i in range(start, end):
+                if index.passage_kind[i] == kind_id and (author is None or index.passage_author[i] == author):
+                    return index.passage(i)
+        return None